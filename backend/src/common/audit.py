@@ -1,10 +1,36 @@
+"""
+Audit events, written off the request path.
+
+write_audit only appends to an in-process buffer; main.handler calls
+flush_audit once the response is built. The buffer is bounded: at
+AUDIT_BUFFER_MAX pending events write_audit flushes inline rather than grow
+or drop.
+
+With AUDIT_SINK=log (the default) a flush prints one {"audit": {...}} JSON
+line per event and the request never waits on DynamoDB; a CloudWatch Logs
+subscription delivers the lines to jobs/audit_ingest.py, which batch-writes
+them into the audit table. AUDIT_SINK=table writes them from the flush with
+BatchWriteItem (25 per request) instead - for environments without the
+subscription - and falls back to the log channel for events it can't take
+(throttled past the retries, or the call failed). Either path puts the same
+item (sk is ts#event_id), so an event delivered twice is still one record.
+
+Each flush emits AuditFlushLatency; AuditEventsFallback and AuditEventsDropped
+(unserializable, so neither channel could take it) when nonzero.
+"""
 import hashlib
+import json
+import threading
 import time
 import uuid
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+
+from .config import TABLE_AUDIT, AUDIT_SINK, AUDIT_BUFFER_MAX
+from .db import batch_put_items
+from .metrics import put_metric
 
-from .config import TABLE_AUDIT
-from .db import put_item
+_pending: List[Dict] = []
+_lock = threading.Lock()
 
 def _sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
@@ -33,4 +59,51 @@ def write_audit(team_id: str, action: str, invite_token: Optional[str], meta: Op
     if meta:
         item["meta"] = meta
 
-    put_item(TABLE_AUDIT, item)
+    with _lock:
+        _pending.append(item)
+        full = len(_pending) >= AUDIT_BUFFER_MAX
+    if full:
+        flush_audit()
+
+def _to_log(items: List[Dict]) -> int:
+    """Print each item as an audit log line; returns how many couldn't be serialized."""
+    dropped = 0
+    for item in items:
+        try:
+            line = json.dumps({"audit": item}, default=str)
+        except (TypeError, ValueError) as e:
+            print(f"[AUDIT] Dropping unserializable event {item.get('event_id')}: {e}")
+            dropped += 1
+            continue
+        print(line)
+    return dropped
+
+def flush_audit() -> int:
+    """Write every pending event (table, else the log channel). Never raises; returns the count flushed."""
+    with _lock:
+        items = _pending[:]
+        _pending.clear()
+    if not items:
+        return 0
+
+    started = time.monotonic()
+    fallback = []
+    if AUDIT_SINK == "log":
+        dropped = _to_log(items)
+    else:
+        try:
+            fallback = batch_put_items(TABLE_AUDIT, items)
+        except Exception as e:
+            print(f"[AUDIT] BatchWriteItem failed, routing {len(items)} event(s) to the log channel: {e}")
+            fallback = items
+        dropped = _to_log(fallback)
+
+    put_metric(
+        "AuditFlushLatency", (time.monotonic() - started) * 1000, "Milliseconds",
+        {"Sink": AUDIT_SINK}, events=len(items),
+    )
+    if fallback:
+        put_metric("AuditEventsFallback", len(fallback) - dropped, "Count")
+    if dropped:
+        put_metric("AuditEventsDropped", dropped, "Count")
+    return len(items) - dropped
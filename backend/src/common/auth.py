@@ -4,19 +4,26 @@ import time
 import os
 from typing import Dict, Optional, Tuple
 
-from boto3.dynamodb.conditions import Key
-
-from .config import TABLE_INVITES, DYNAMODB
+from .config import TABLE_INVITES, TABLE_TEAMS, DYNAMODB
 from .db import get_item
 from .responses import err
 
 def token_hash(token: str) -> str:
     return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
+def token_epoch(team: Optional[Dict]) -> int:
+    """
+    Current invite epoch for a team. Invites record the epoch they were issued
+    under; bumping the team's token_epoch revokes every older invite at once.
+    """
+    return int((team or {}).get("token_epoch", 0))
+
 def require_invite(event: Dict, required_role: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
     """
     Returns: (invite_record, error_response)
     If required_role is specified, also checks role permission.
+    The team record is read once here and attached as invite["_team"] so
+    handlers don't need to fetch it again.
     """
     headers = event.get("headers") or {}
     token = headers.get("x-invite-token") or headers.get("X-Invite-Token")
@@ -37,6 +44,11 @@ def require_invite(event: Dict, required_role: Optional[str] = None) -> Tuple[Op
     if exp and now > exp:
         return None, err("Invite token expired.", 401, code="unauthorized")
 
+    # Team-wide revocation: invites issued before the team's current epoch are dead
+    team = get_item(TABLE_TEAMS, {"team_id": invite["team_id"]}) if invite.get("team_id") else None
+    if int(invite.get("token_epoch", 0)) < token_epoch(team):
+        return None, err("Invite token has been revoked.", 401, code="unauthorized")
+
     # Check role if specified
     if required_role:
         role = invite.get("role")
@@ -45,6 +57,7 @@ def require_invite(event: Dict, required_role: Optional[str] = None) -> Tuple[Op
 
     # Attach raw token only in-memory for audit hashing; do not persist raw token.
     invite["_raw_token"] = token
+    invite["_team"] = team or {}
     return invite, None
 
 def require_role(invite: Dict, allowed_roles: set) -> Optional[Dict]:
@@ -51,10 +51,33 @@ def create_signed_url(
 
     # Ensure domain has no trailing slash
     domain_name = domain_name.rstrip("/")
-    
+
     # Build the full URL
     url = f"{domain_name}/{object_key}"
+    return f"{url}?{_signed_query(url, key_pair_id, private_key_pem, expires_in_seconds)}"
+
 
+def create_signed_prefix_query(
+    domain_name: str,
+    key_prefix: str,
+    key_pair_id: str,
+    private_key_pem: str,
+    expires_in_seconds: int,
+) -> str:
+    """
+    Sign a wildcard policy for every object under key_prefix and return the query
+    string ("Policy=...&Signature=...&Key-Pair-Id=..."). Append it to any URL under
+    the prefix - one RSA signature covers a whole set of renditions.
+    """
+    if not domain_name or not key_prefix or not key_pair_id or not private_key_pem:
+        raise ValueError("Missing required parameters for CloudFront signing")
+
+    resource = f"{domain_name.rstrip('/')}/{key_prefix}*"
+    return _signed_query(resource, key_pair_id, private_key_pem, expires_in_seconds)
+
+
+def _signed_query(resource: str, key_pair_id: str, private_key_pem: str, expires_in_seconds: int) -> str:
+    """Custom-policy query string for resource (a URL, optionally ending in *)."""
     # Round expiry UP to the next whole hour boundary.
     # All calls within the same clock-hour produce the same Expires value →
     # identical URL → browser disk cache hits on reload instead of re-downloading.
@@ -67,7 +90,7 @@ def create_signed_url(
     policy_dict = {
         "Statement": [
             {
-                "Resource": url,
+                "Resource": resource,
                 "Condition": {
                     "DateLessThan": {
                         "AWS:EpochTime": expire_time
@@ -96,12 +119,4 @@ def create_signed_url(
     signature_b64 = signature_b64.replace("+", "-").replace("/", "_").replace("=", "~")
     policy_b64 = policy_b64.replace("+", "-").replace("/", "_").replace("=", "~")
 
-    # Build the signed URL
-    signed_url = (
-        f"{url}"
-        f"?Policy={policy_b64}"
-        f"&Signature={signature_b64}"
-        f"&Key-Pair-Id={key_pair_id}"
-    )
-
-    return signed_url
+    return f"Policy={policy_b64}&Signature={signature_b64}&Key-Pair-Id={key_pair_id}"
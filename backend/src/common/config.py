@@ -48,4 +48,18 @@ ALLOWED_CONTENT_TYPES = set(
 
 DEMO_ENABLED = os.getenv("DEMO_ENABLED", "false").lower() == "true"
 DEMO_TEAM_ID = os.getenv("DEMO_TEAM_ID", "")
-DEMO_INVITE_TTL_DAYS = int(os.getenv("DEMO_INVITE_TTL_DAYS", "1"))
\ No newline at end of file
+DEMO_INVITE_TTL_DAYS = int(os.getenv("DEMO_INVITE_TTL_DAYS", "1"))
+
+# Background purge of soft-deleted teams (jobs/team_purge.py)
+PURGE_GRACE_DAYS = int(os.getenv("PURGE_GRACE_DAYS", "30"))  # keep data this long after deleted_at
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", "4"))  # parallel DeleteObjects requests
+
+# Garbage collection of uploads never finalized by /media/complete (jobs/upload_gc.py)
+UPLOAD_GC_GRACE_HOURS = int(os.getenv("UPLOAD_GC_GRACE_HOURS", "24"))  # on top of the presign TTL
+
+# All-teams used_bytes reconciliation (jobs/storage_reconcile.py)
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "8"))  # teams reconciled in parallel
+
+# Audit events are buffered per invocation and flushed by main.handler (common/audit.py)
+AUDIT_SINK = os.getenv("AUDIT_SINK", "log")  # log: JSON lines for jobs/audit_ingest.py (off the request path), table: BatchWriteItem
+AUDIT_BUFFER_MAX = int(os.getenv("AUDIT_BUFFER_MAX", "100"))  # flush early once this many are pending
@@ -1,3 +1,4 @@
+import time
 import boto3
 from boto3.dynamodb.conditions import Key
 from typing import Any, Dict, Optional, Tuple
@@ -13,9 +14,74 @@ def get_item(table_name: str, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     item = resp.get("Item")
     return _normalize(item) if item else None
 
+def batch_get_items(table_name: str, keys: list, projection: Optional[str] = None, consistent: bool = False) -> list:
+    """
+    Fetch many items by primary key with BatchGetItem (100 keys per request),
+    retrying UnprocessedKeys. Missing items are simply absent from the result;
+    order is not preserved. consistent=True sees writes made just before.
+    """
+    # Dedupe: BatchGetItem rejects duplicate keys within a request
+    unique = list({tuple(sorted(k.items())): k for k in keys}.values())
+    results = []
+    for i in range(0, len(unique), 100):
+        request = {"Keys": unique[i:i + 100]}
+        if projection:
+            request["ProjectionExpression"] = projection
+        if consistent:
+            request["ConsistentRead"] = True
+        pending = {table_name: request}
+        for attempt in range(5):
+            resp = dynamodb.batch_get_item(RequestItems=pending)
+            results.extend(_normalize(it) for it in resp.get("Responses", {}).get(table_name, []))
+            pending = resp.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+            time.sleep(0.05 * (2 ** attempt))  # back off on throttling
+    return results
+
 def put_item(table_name: str, item: Dict[str, Any]) -> None:
     table(table_name).put_item(Item=item)
 
+def transact_write_items(actions: list) -> None:
+    """
+    TransactWriteItems (up to 100 actions, all or nothing). Goes through the
+    resource's client, which takes plain Python values like the Table API.
+    """
+    dynamodb.meta.client.transact_write_items(TransactItems=actions)
+
+def used_bytes_action(table_name: str, team_id: str, delta: int) -> Dict[str, Any]:
+    """
+    Transaction action adjusting a team's used_bytes by delta and bumping its
+    usage_version. Written in the same transaction as the media record change,
+    so jobs/storage_reconcile.py can tell from usage_version alone whether
+    usage moved while it was summing records.
+    """
+    return {"Update": {
+        "TableName": table_name,
+        "Key": {"team_id": team_id},
+        "UpdateExpression": "SET used_bytes = if_not_exists(used_bytes, :zero) + :delta ADD usage_version :one",
+        "ExpressionAttributeValues": {":zero": 0, ":delta": delta, ":one": 1},
+    }}
+
+def batch_put_items(table_name: str, items: list, attempts: int = 4) -> list:
+    """
+    Put many items with BatchWriteItem (25 per request), retrying
+    UnprocessedItems with backoff. Returns the items still unprocessed after
+    the last attempt, so the caller can decide where they go.
+    """
+    unprocessed = []
+    for i in range(0, len(items), 25):
+        pending = {table_name: [{"PutRequest": {"Item": it}} for it in items[i:i + 25]]}
+        for attempt in range(attempts):
+            resp = dynamodb.batch_write_item(RequestItems=pending)
+            pending = resp.get("UnprocessedItems") or {}
+            if not pending:
+                break
+            if attempt < attempts - 1:
+                time.sleep(0.05 * (2 ** attempt))  # back off on throttling
+        unprocessed.extend(r["PutRequest"]["Item"] for r in pending.get(table_name, []))
+    return unprocessed
+
 def query(table_name: str, key_condition, limit: int = 50, exclusive_start_key: Optional[Dict[str, Any]] = None) -> Tuple[list, Optional[Dict[str, Any]]]:
     kwargs = {"KeyConditionExpression": key_condition, "Limit": limit}
     if exclusive_start_key:
@@ -70,8 +136,27 @@ def query_items(table_name: str, key_condition = None, expression_values: dict =
     items = [_normalize(i) for i in resp.get("Items", [])]
     return items, None
 
-def query_media_items(table_name: str, team_id: str, limit: int = 30, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
-    """Query media items for a team with pagination (newest first)."""
+# Media GSI (team_id, capture_sk) for capture-time ordering
+CAPTURE_INDEX = "capture-index"
+
+
+def capture_sort_key(ts: int, media_id: str) -> str:
+    """capture-index sort key: zero-padded epoch seconds so string order is time order."""
+    return f"{max(0, int(ts)):010d}#{media_id}"
+
+
+# S3 user metadata (x-amz-meta-media-sk) carrying the media item's sort key, so
+# the thumbnail stage can address the item without a gsi1 lookup
+MEDIA_SK_METADATA = "media-sk"
+
+
+def media_sort_key(ts: int, media_id: str) -> str:
+    """Media table sort key (newest-first order under team_id)."""
+    return f"{int(ts)}#{media_id}"
+
+
+def query_media_items(table_name: str, team_id: str, limit: int = 30, cursor: Optional[str] = None, index_name: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    """Query media items for a team with pagination (newest first), optionally via a GSI."""
     import json
     
     eks = None
@@ -83,6 +168,8 @@ def query_media_items(table_name: str, team_id: str, limit: int = 30, cursor: Op
     
     # Query with newest first by using ScanIndexForward=False
     kwargs = {"KeyConditionExpression": Key("team_id").eq(team_id), "Limit": limit, "ScanIndexForward": False}
+    if index_name:
+        kwargs["IndexName"] = index_name
     if eks:
         kwargs["ExclusiveStartKey"] = eks
     resp = table(table_name).query(**kwargs)
@@ -109,6 +196,17 @@ def query_media_by_id(table_name: str, media_id: str):
 def delete_item(table_name: str, key: dict):
     table(table_name).delete_item(Key=key)
 
+def batch_delete_items(table_name: str, keys: list) -> None:
+    """
+    Delete many items with BatchWriteItem. boto3's batch_writer chunks the
+    requests into groups of 25 and resubmits UnprocessedItems for us.
+    """
+    if not keys:
+        return
+    with table(table_name).batch_writer() as batch:
+        for key in keys:
+            batch.delete_item(Key=key)
+
 def update_item(table_name: str, key: Dict[str, Any], update_expression: str, expression_values: Dict[str, Any] = None, expression_names: Dict[str, str] = None) -> None:
     """
     Update an item in a DynamoDB table.
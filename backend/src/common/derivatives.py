@@ -0,0 +1,136 @@
+"""
+Derived objects (thumbnails, previews, responsive renditions) for a media item.
+
+Shared by the thumbnail Lambda (which writes them) and the API (which signs,
+lists and deletes them), so key layout lives in one place. No Pillow here.
+
+Image renditions are recorded on the media item as a compact map:
+
+    renditions = {
+        "sizes":   [256, 512, 1024, 1600],  # ladder slots (longest edge), part of the key
+        "widths":  [256, 512, 1024, 1200],  # actual pixel width of each slot
+        "heights": [192, 384, 768, 900],
+        "formats": ["avif", "webp", "jpeg"],
+    }
+
+and stored at thumbnails/{team_id}/{media_id}/{size}.{ext}.
+
+Videos get an HLS ladder under streams/{team_id}/{media_id}/, recorded as
+stream_key (the master playlist) plus
+
+    stream = {
+        "variants": [360, 720, 1080],  # rung short edge; playlist {n}p.m3u8
+        "segments": [31, 31, 31],      # segment count per rung: {n}p_000.ts ...
+    }
+
+Videos whose index (moov box) sits after the media data also get a fast-start
+MP4 copy at previews/{team_id}/{media_id}/playback.mp4, recorded as
+preview_key, for progressive playback until the ladder is ready.
+
+Every video gets a short silent hover loop for the grid at
+previews/{team_id}/{media_id}/hover.mp4, recorded as hover_key.
+
+Once an item's derivatives are complete, the run that made them records
+derived_etag (the original's S3 ETag) and derived_version (PIPELINE_VERSION).
+A notification or backfill for the same bytes and version is then a no-op,
+and bumping PIPELINE_VERSION regenerates everything on the next pass.
+"""
+import os
+from typing import Dict, List
+
+# Longest-edge ladder; images are never upscaled, so small originals get fewer slots
+RENDITION_SIZES = sorted(
+    int(x) for x in os.getenv("RENDITION_SIZES", "256,512,1024,1600,2560").split(",") if x.strip()
+)
+# Requested formats; the thumbnail Lambda drops any its Pillow build can't encode
+RENDITION_FORMATS = [
+    x.strip().lower() for x in os.getenv("RENDITION_FORMATS", "avif,webp,jpeg").split(",") if x.strip()
+]
+
+FORMAT_EXT = {"jpeg": "jpg", "webp": "webp", "avif": "avif"}
+FORMAT_CONTENT_TYPE = {"jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+
+# Grid thumbnail / modal preview targets when picking from the ladder
+THUMB_TARGET = 512
+PREVIEW_TARGET = 1600
+
+# Bump when derivative output changes (sizes, formats, encoder settings) so
+# existing items are regenerated rather than skipped as already derived
+PIPELINE_VERSION = int(os.getenv("DERIVATIVE_PIPELINE_VERSION", "1"))
+
+
+def rendition_prefix(team_id: str, media_id: str) -> str:
+    return f"thumbnails/{team_id}/{media_id}/"
+
+
+def rendition_key(team_id: str, media_id: str, size: int, fmt: str) -> str:
+    return f"{rendition_prefix(team_id, media_id)}{size}.{FORMAT_EXT[fmt]}"
+
+
+def playback_key(team_id: str, media_id: str) -> str:
+    return f"previews/{team_id}/{media_id}/playback.mp4"
+
+
+def hover_key(team_id: str, media_id: str) -> str:
+    return f"previews/{team_id}/{media_id}/hover.mp4"
+
+
+HLS_MASTER = "master.m3u8"
+
+
+def stream_prefix(team_id: str, media_id: str) -> str:
+    return f"streams/{team_id}/{media_id}/"
+
+
+def hls_variant_name(edge: int) -> str:
+    return f"{int(edge)}p"
+
+
+def stream_keys(item: Dict) -> List[str]:
+    """Master playlist, rung playlists and every segment of an item's HLS ladder."""
+    if not item.get("stream_key"):
+        return []
+    prefix = stream_prefix(item["team_id"], item["media_id"])
+    stream = item.get("stream") or {}
+    keys = [item["stream_key"]]
+    for edge, count in zip(stream.get("variants", []), stream.get("segments", [])):
+        name = hls_variant_name(edge)
+        keys.append(f"{prefix}{name}.m3u8")
+        keys.extend(f"{prefix}{name}_{i:03d}.ts" for i in range(int(count)))
+    return keys
+
+
+def pick_size(sizes: List[int], target: int) -> int:
+    """Smallest slot that covers target, else the largest slot we have."""
+    covering = [s for s in sizes if s >= target]
+    return min(covering) if covering else max(sizes)
+
+
+def rendition_keys(item: Dict) -> List[str]:
+    r = item.get("renditions") or {}
+    return [
+        rendition_key(item["team_id"], item["media_id"], int(size), fmt)
+        for size in r.get("sizes", [])
+        for fmt in r.get("formats", [])
+    ]
+
+
+def derivative_keys(item: Dict) -> List[str]:
+    """Every S3 key generated from an item's original (not the original itself)."""
+    keys = [k for k in (item.get("thumb_key"), item.get("preview_key"), item.get("hover_key")) if k]
+    keys.extend(k for k in rendition_keys(item) if k not in keys)
+    keys.extend(stream_keys(item))
+    return keys
+
+
+def normalize_etag(etag: str) -> str:
+    """S3 returns ETags quoted; items store them bare."""
+    return (etag or "").strip('"')
+
+
+def derivatives_current(item: Dict, etag: str, version: int = PIPELINE_VERSION) -> bool:
+    """True if item's derivatives were made from these bytes by this (or a newer) pipeline."""
+    etag = normalize_etag(etag)
+    if not etag or item.get("derived_etag") != etag:
+        return False
+    return int(item.get("derived_version") or 0) >= version
@@ -0,0 +1,30 @@
+"""
+CloudWatch metrics via the Embedded Metric Format.
+
+A metric is one JSON log line; CloudWatch Logs extracts it asynchronously, so
+there's no PutMetricData call (or extra IAM, or latency) on the request path.
+"""
+import json
+import os
+import time
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TeamMediaHub")
+
+
+def put_metric(name: str, value: float, unit: str = "Milliseconds", dimensions: dict = None, **properties):
+    """Emit one metric value; extra keyword args are logged as searchable properties."""
+    dimensions = {k: str(v) for k, v in (dimensions or {}).items()}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [list(dimensions)],
+                "Metrics": [{"Name": name, "Unit": unit}],
+            }],
+        },
+        name: value,
+        **dimensions,
+        **properties,
+    }
+    print(json.dumps(record, default=str))
@@ -29,3 +29,49 @@ def delete_object(bucket: str, key: str):
         s3.delete_object(Bucket=bucket, Key=key)
     except Exception:
         pass
+
+# S3 DeleteObjects accepts at most 1,000 keys per request.
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+def delete_objects(bucket: str, keys: list) -> list:
+    """
+    Delete many S3 objects using DeleteObjects, 1,000 keys per request.
+    Best effort; returns the list of keys S3 reported as failed.
+    """
+    failed = []
+    keys = [k for k in dict.fromkeys(keys) if k]
+    if not keys:
+        return failed
+
+    s3 = _get_s3_client()
+    for i in range(0, len(keys), DELETE_OBJECTS_MAX_KEYS):
+        chunk = keys[i:i + DELETE_OBJECTS_MAX_KEYS]
+        try:
+            resp = s3.delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": k} for k in chunk], "Quiet": True},
+            )
+            failed.extend(e.get("Key") for e in resp.get("Errors", []))
+        except Exception:
+            failed.extend(chunk)
+    return failed
+
+def iter_object_pages(bucket: str, prefix: str):
+    """
+    Yield pages (lists of {Key, Size, LastModified, ETag}) from a paginated
+    ListObjectsV2 over prefix. Each page holds at most 1,000 objects.
+    """
+    s3 = _get_s3_client()
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        contents = page.get("Contents", [])
+        if contents:
+            yield contents
+
+def iter_common_prefixes(bucket: str, prefix: str):
+    """Yield the next level of "folders" under prefix (e.g. media/{team_id}/ under media/)."""
+    s3 = _get_s3_client()
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        for p in page.get("CommonPrefixes", []):
+            yield p["Prefix"]
@@ -0,0 +1,89 @@
+"""
+Signed HLS playback.
+
+A CloudFront signed query only covers the URL it's appended to, and players
+resolve the relative URIs inside a playlist without it. So playlists are
+served by the API (/media/stream), which rewrites each segment URI to a
+CloudFront URL carrying one wildcard signature for the item's stream prefix,
+and each rung playlist URI back to /media/stream. That works for native HLS
+(iOS Safari) as well as hls.js, with no cookies.
+
+/media/stream URLs carry their own short-lived HMAC instead of the invite
+token, so a player can fetch them without custom headers. The key is derived
+from the CloudFront private key, a secret the API already holds.
+"""
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+
+from common.config import CLOUDFRONT_DOMAIN, CLOUDFRONT_KEY_PAIR_ID, CLOUDFRONT_PRIVATE_KEY
+from common.cloudfront_signer import create_signed_prefix_query
+from common.derivatives import HLS_MASTER, stream_prefix
+
+STREAM_URL_TTL_SECONDS = 3 * 3600
+
+
+def api_base_url(event) -> str:
+    """https://{host} of the API as the client called it."""
+    headers = event.get("headers") or {}
+    host = (event.get("requestContext") or {}).get("domainName") or headers.get("host") or ""
+    return f"https://{host}" if host else ""
+
+
+def _signature(team_id: str, media_id: str, expires: int) -> str:
+    key = hashlib.sha256(b"hls-playlist\0" + CLOUDFRONT_PRIVATE_KEY.encode("utf-8")).digest()
+    msg = f"{team_id}/{media_id}/{expires}".encode("utf-8")
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()[:32]
+
+
+def stream_params(team_id: str, media_id: str, playlist: str = HLS_MASTER, ttl: int = STREAM_URL_TTL_SECONDS) -> dict:
+    # Whole-hour expiry, like CloudFront URLs, so repeat listings return the same URL
+    expires = ((int(time.time()) + ttl + 3599) // 3600) * 3600
+    return {
+        "team_id": team_id,
+        "media_id": media_id,
+        "p": playlist,
+        "exp": str(expires),
+        "sig": _signature(team_id, media_id, expires),
+    }
+
+
+def stream_url(api_base: str, team_id: str, media_id: str, playlist: str = HLS_MASTER) -> str:
+    return f"{api_base.rstrip('/')}/media/stream?{urlencode(stream_params(team_id, media_id, playlist))}"
+
+
+def verify_stream_params(team_id: str, media_id: str, expires: str, sig: str) -> bool:
+    if not (CLOUDFRONT_PRIVATE_KEY and team_id and media_id and expires.isdigit() and sig):
+        return False
+    if int(expires) < time.time():
+        return False
+    return hmac.compare_digest(_signature(team_id, media_id, int(expires)), sig)
+
+
+def rewrite_playlist(text: str, api_base: str, team_id: str, media_id: str, expires: str, sig: str) -> str:
+    """Point rung playlists back at /media/stream and segments at signed CloudFront URLs."""
+    prefix = stream_prefix(team_id, media_id)
+    segment_query = None
+    out = []
+    for line in text.splitlines():
+        uri = line.strip()
+        if not uri or uri.startswith("#"):
+            out.append(line)
+            continue
+        if "/" in uri or ".." in uri:
+            raise ValueError(f"unexpected playlist entry {uri!r}")
+        if uri.endswith(".m3u8"):
+            query = urlencode({"team_id": team_id, "media_id": media_id, "p": uri, "exp": expires, "sig": sig})
+            out.append(f"{api_base.rstrip('/')}/media/stream?{query}")
+        else:
+            if segment_query is None:
+                segment_query = create_signed_prefix_query(
+                    domain_name=CLOUDFRONT_DOMAIN,
+                    key_prefix=prefix,
+                    key_pair_id=CLOUDFRONT_KEY_PAIR_ID,
+                    private_key_pem=CLOUDFRONT_PRIVATE_KEY,
+                    expires_in_seconds=STREAM_URL_TTL_SECONDS,
+                )
+            out.append(f"{CLOUDFRONT_DOMAIN.rstrip('/')}/{prefix}{uri}?{segment_query}")
+    return "\n".join(out) + "\n"
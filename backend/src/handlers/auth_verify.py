@@ -11,6 +11,7 @@ from common.team_codes import get_team_by_code
 from common.user_auth import verify_code, add_user_to_team, create_or_get_user
 from common.db import put_item
 from common.config import TABLE_INVITES
+from common.auth import token_epoch
 
 def generate_session_token() -> str:
     """Generate session token (replaces invite token for authenticated users)."""
@@ -72,6 +73,7 @@ def handle_auth_verify(event, body=None):
             "created_at": int(time.time()),
             "expires_at": int(time.time()) + (365 * 86400),  # 1 year
             "revoked_at": None,
+            "token_epoch": token_epoch(team),
         }
         
         put_item(TABLE_INVITES, session_record)
@@ -1,179 +1,237 @@
 """
-Get coach's teams: Coach provides user_token → return list of teams where they're admin
+Get coach's teams: Coach provides user_token → return list of teams where they're admin,
+with per-team storage usage and recent upload activity.
+
+Everything is served by key lookups - no table scans:
+  - memberships: Query on TeamMembersTable (partition user_id)
+  - teams:       one BatchGetItem for all team records
+  - activity:    one bounded Query per team on the media partition, in parallel
+
+Admin tokens are bearer secrets and only their hashes are stored, so the list
+doesn't carry them. Opening a team issues one (POST /coach/teams/token): the
+coach's earlier admin invites for the team are found on team-role-index and
+revoked, and a fresh one is minted under the team's current token_epoch.
 """
-import json
 import os
 import time
 import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
 from common.responses import ok, err
-from common.db import get_item
-from common.config import DYNAMODB
-from common.auth import token_hash
+from common.db import batch_get_items, table
+from common.config import DYNAMODB, TABLE_TEAMS, TABLE_INVITES, TABLE_MEDIA
+from common.auth import get_user_from_token, token_hash, token_epoch
 
 dynamodb = DYNAMODB
 
+# Recent activity window and how many recent uploads we read per team
+ACTIVITY_WINDOW_SECONDS = 7 * 24 * 3600
+ACTIVITY_SAMPLE = 50
+
+
 def handle_get_coach_teams(event):
     """
     GET /coach/teams
     Headers: x-user-token
-    Returns: { teams: [{ team_id, team_name, role, invite_token }] }
+    Returns: { teams: [{ team_id, team_name, role, usage, activity }], coach_verified }
     """
     headers = event.get("headers", {})
-    print(f"[coach_teams] Headers keys: {list(headers.keys())}")
-    
     user_token = headers.get("x-user-token") or headers.get("X-User-Token") or ""
     user_token = user_token.strip() if user_token else ""
-    
+
     if not user_token:
         print("[coach_teams] ✗ No user token provided")
-        print(f"[coach_teams] Headers present: {list(headers.keys())}")
         return err("User token required", status_code=401)
-    
-    print(f"[coach_teams] Looking up token: {user_token[:20]}...")
-    
+
     try:
         # Look up user by token
         tokens_table = dynamodb.Table(os.getenv("TABLE_USER_TOKENS", "UserTokensTable"))
-        print(f"[coach_teams] UserTokensTable: {os.getenv('TABLE_USER_TOKENS', 'UserTokensTable')}")
-        print(f"[coach_teams] Token key being used: {user_token}")
-        
-        response = tokens_table.get_item(Key={"token_hash": user_token})
-        print(f"[coach_teams] GetItem response: {response}")
-        
-        token_record = response.get("Item")
-        
+        token_record = tokens_table.get_item(Key={"token_hash": user_token}).get("Item")
         if not token_record:
-            print(f"[coach_teams] ✗ Token not found in DB")
-            print(f"[coach_teams] Attempting scan to debug...")
-            try:
-                scan_response = tokens_table.scan(Limit=5)
-                print(f"[coach_teams] Sample tokens in table: {[item.get('token_hash', 'NO_HASH')[:20] for item in scan_response.get('Items', [])]}")
-            except Exception as e:
-                print(f"[coach_teams] Scan failed: {e}")
+            print("[coach_teams] ✗ Token not found in DB")
             return err("Invalid token", status_code=401)
-        
-        print(f"[coach_teams] ✓ Token found, user_id: {token_record.get('user_id')}")
-        
+
         user_id = token_record.get("user_id")
-        email = token_record.get("email")
         coach_verified = token_record.get("coach_verified", False)
-        
-        # Get all teams where this user is a member with admin role
+
+        # All memberships for this user (partition key query, paginated)
         team_members_table = dynamodb.Table(os.getenv("TABLE_TEAM_MEMBERS", "TeamMembersTable"))
-        
-        # Query by user_id (partition key - no need for GSI)
-        print(f"[coach_teams] Querying TeamMembersTable for user_id: {user_id}")
-        try:
-            response = team_members_table.query(
-                KeyConditionExpression="user_id = :uid",
-                ExpressionAttributeValues={":uid": user_id},
-            )
-            team_memberships = response.get("Items", [])
-            print(f"[coach_teams] ✓ Found {len(team_memberships)} team memberships")
-            for i, m in enumerate(team_memberships):
-                print(f"[coach_teams]   [{i}] team_id={m.get('team_id')}, role={m.get('role')}")
-        except Exception as e:
-            print(f"[coach_teams] ✗ Query error: {e}")
-            team_memberships = []
-        
-        # Get team details for each membership
-        teams_table = dynamodb.Table(os.getenv("TABLE_TEAMS", "TeamsTable"))
-        invites_table = dynamodb.Table(os.getenv("TABLE_INVITES", "InvitesTable"))
+        memberships = []
+        kwargs = {"KeyConditionExpression": Key("user_id").eq(user_id)}
+        while True:
+            response = team_members_table.query(**kwargs)
+            memberships.extend(response.get("Items", []))
+            lek = response.get("LastEvaluatedKey")
+            if not lek:
+                break
+            kwargs["ExclusiveStartKey"] = lek
+
+        # Only include admin/coach memberships
+        memberships = [m for m in memberships if m.get("role") in ("admin", "coach")]
+        print(f"[coach_teams] user_id={user_id}: {len(memberships)} admin memberships")
+        if not memberships:
+            return ok({"teams": [], "coach_verified": coach_verified})
+
+        # Batch-hydrate team records, skipping missing and soft-deleted teams
+        teams_by_id = {
+            t["team_id"]: t
+            for t in batch_get_items(TABLE_TEAMS, [{"team_id": m["team_id"]} for m in memberships])
+            if not t.get("deleted_at")
+        }
+        memberships = [m for m in memberships if m["team_id"] in teams_by_id]
+
+        with ThreadPoolExecutor(max_workers=min(8, len(memberships))) as pool:
+            activity = dict(zip(
+                [m["team_id"] for m in memberships],
+                pool.map(_recent_activity, [m["team_id"] for m in memberships]),
+            ))
+
         teams = []
-        
-        for membership in team_memberships:
-            team_id = membership.get("team_id")
-            role = membership.get("role")
-            
-            print(f"[coach_teams] Processing membership: team_id={team_id}, role={role}")
-            
-            # Only include if admin
-            if role not in ["admin", "coach"]:
-                print(f"[coach_teams]   ✗ Skipped (role not admin/coach)")
-                continue
-            
-            print(f"[coach_teams]   ✓ Role is {role}")
-            
-            # Get team details
-            team_response = teams_table.get_item(Key={"team_id": team_id})
-            team = team_response.get("Item")
-            
-            # Skip soft-deleted teams
-            if team and team.get("deleted_at"):
-                print(f"[coach_teams]   ✗ Skipped (deleted_at={team.get('deleted_at')})")
-                continue
-            
-            if team:
-                team_name = team.get("team_name", "Unnamed Team")
-                print(f"[coach_teams]   team_name: {team_name}")
-                
-                # Try to get invite token from membership first (for coach-created teams)
-                invite_token = membership.get("invite_token")
-                print(f"[coach_teams]   invite_token from membership: {invite_token[:20] if invite_token else 'None'}...")
-                
-                if not invite_token:
-                    # Fallback: scan for existing admin token
-                    print(f"[coach_teams]   Scanning for existing admin token...")
-                    try:
-                        invite_response = invites_table.scan(
-                            FilterExpression="team_id = :tid AND #role = :role",
-                            ExpressionAttributeNames={"#role": "role"},
-                            ExpressionAttributeValues={":tid": team_id, ":role": "admin"},
-                            Limit=1,
-                        )
-                        items = invite_response.get("Items", [])
-                        print(f"[coach_teams]   Found {len(items)} admin invites")
-                        
-                        if items and items[0].get("token_hash"):
-                            # Token exists but we can't get the original
-                            # For now, generate a new admin token
-                            print(f"[coach_teams]   Creating new admin token...")
-                            invite_token = _create_admin_token(team_id, invites_table)
-                    except Exception as e:
-                        print(f"[coach_teams]   Scan error: {e}")
-                        # Create a new admin token
-                        print(f"[coach_teams]   Creating new admin token (fallback)...")
-                        invite_token = _create_admin_token(team_id, invites_table)
-                
-                if not invite_token:
-                    # Last resort: create a new admin token
-                    print(f"[coach_teams]   Creating new admin token (last resort)...")
-                    invite_token = _create_admin_token(team_id, invites_table)
-                
-                print(f"[coach_teams]   Final invite_token: {invite_token[:20] if invite_token else 'FAILED'}...")
-                
-                teams.append({
-                    "team_id": team_id,
-                    "team_name": team_name,
-                    "role": role,
-                    "invite_token": invite_token,
-                })
-                print(f"[coach_teams]   ✓ Added to teams list")
-            else:
-                print(f"[coach_teams]   ✗ Team not found in TeamsTable")
-        
+        for membership in memberships:
+            team_id = membership["team_id"]
+            team = teams_by_id[team_id]
+
+            teams.append({
+                "team_id": team_id,
+                "team_name": team.get("team_name", "Unnamed Team"),
+                "role": membership.get("role"),
+                "usage": {
+                    "plan": team.get("plan", "free"),
+                    "used_bytes": team.get("used_bytes", 0),
+                    "storage_limit_bytes": team.get("storage_limit_bytes", team.get("storage_limit_gb", 10) * (1024 ** 3)),
+                },
+                "activity": activity[team_id],
+            })
+
         print(f"[coach_teams] ✓ Returning {len(teams)} teams")
         return ok({"teams": teams, "coach_verified": coach_verified})
-    
+
     except Exception as e:
         print(f"Get coach teams error: {e}")
         return err("Failed to fetch teams", status_code=500)
 
 
-def _create_admin_token(team_id, invites_table):
+def _recent_activity(team_id):
+    """Latest upload time and uploads in the last 7 days (capped at ACTIVITY_SAMPLE)."""
+    try:
+        resp = table(TABLE_MEDIA).query(
+            KeyConditionExpression=Key("team_id").eq(team_id),
+            ProjectionExpression="created_at",
+            ScanIndexForward=False,
+            Limit=ACTIVITY_SAMPLE,
+        )
+        items = resp.get("Items", [])
+    except Exception as e:
+        print(f"[coach_teams] Activity query failed for {team_id}: {e}")
+        items = []
+
+    cutoff = int(time.time()) - ACTIVITY_WINDOW_SECONDS
+    created = [int(i.get("created_at", 0)) for i in items]
+    return {
+        "last_upload_at": created[0] if created else None,
+        "uploads_7d": sum(1 for ts in created if ts >= cutoff),
+        "uploads_7d_capped": len(created) == ACTIVITY_SAMPLE and created[-1] >= cutoff,
+    }
+
+
+def handle_coach_team_token(event, body):
+    """
+    POST /coach/teams/token
+    Headers: x-user-token
+    Body: { team_id }
+    Returns: { team_id, role, invite_token }
+
+    Issues the admin token a coach opens a team with. The coach's earlier admin
+    invites for the team (team-role-index, matched on user_id) are revoked, so
+    each coach holds at most one live dashboard token per team.
+    """
+    user, error = get_user_from_token(event)
+    if error:
+        return error
+    if not user:
+        return err("User token required", status_code=401)
+
+    team_id = ((body or {}).get("team_id") or "").strip()
+    if not team_id:
+        return err("team_id is required.", 400, code="validation_error")
+
+    try:
+        user_id = user.get("user_id")
+        team_members_table = dynamodb.Table(os.getenv("TABLE_TEAM_MEMBERS", "TeamMembersTable"))
+        membership = team_members_table.get_item(Key={"user_id": user_id, "team_id": team_id}).get("Item")
+        if not membership or membership.get("role") not in ("admin", "coach"):
+            return err("Not an admin of this team.", 403, code="forbidden")
+
+        team = dynamodb.Table(TABLE_TEAMS).get_item(Key={"team_id": team_id}).get("Item")
+        if not team or team.get("deleted_at"):
+            return err("Team not found.", 404, code="not_found")
+
+        revoked = _revoke_admin_tokens(team_id, user_id)
+        invite_token = _create_admin_token(team_id, team, user_id)
+        if not invite_token:
+            return err("Failed to issue token", status_code=500)
+
+        if "invite_token" in membership:
+            # Rows written before tokens were issued here kept the raw token
+            team_members_table.update_item(
+                Key={"user_id": user_id, "team_id": team_id},
+                UpdateExpression="REMOVE invite_token",
+            )
+
+        print(f"[coach_teams] Issued admin token for team_id={team_id} (revoked {revoked})")
+        return ok({"team_id": team_id, "role": "admin", "invite_token": invite_token})
+
+    except Exception as e:
+        print(f"Coach team token error: {e}")
+        return err("Failed to issue token", status_code=500)
+
+
+def _revoke_admin_tokens(team_id, user_id) -> int:
+    """Revoke the coach's live admin invites for a team; returns how many."""
+    invites_table = dynamodb.Table(TABLE_INVITES)
+    kwargs = {
+        "IndexName": "team-role-index",
+        "KeyConditionExpression": Key("team_id").eq(team_id) & Key("role").eq("admin"),
+    }
+    now = int(time.time())
+    revoked = 0
+    while True:
+        resp = invites_table.query(**kwargs)
+        for invite in resp.get("Items", []):
+            if invite.get("user_id") != user_id or invite.get("revoked_at"):
+                continue
+            invites_table.update_item(
+                Key={"token_hash": invite["token_hash"]},
+                UpdateExpression="SET revoked_at = :now",
+                ExpressionAttributeValues={":now": now},
+            )
+            revoked += 1
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            return revoked
+        kwargs["ExclusiveStartKey"] = lek
+
+
+def _create_admin_token(team_id, team=None, user_id=None):
     """Generate and store a new admin invite token for a team"""
     try:
         raw_token = secrets.token_urlsafe(32)
         ts = int(time.time())
-        
-        invites_table.put_item(Item={
+
+        item = {
             "token_hash": token_hash(raw_token),
             "team_id": team_id,
             "role": "admin",
             "created_at": ts,
             "expires_at": ts + (365 * 24 * 3600),
-        })
-        
+            "token_epoch": token_epoch(team),
+        }
+        if user_id:
+            item["user_id"] = user_id
+        dynamodb.Table(TABLE_INVITES).put_item(Item=item)
+
         return raw_token
     except Exception as e:
         print(f"Failed to create admin token: {e}")
@@ -1,10 +1,10 @@
 import time
 import secrets
 
-from common.config import DEMO_ENABLED, DEMO_TEAM_ID, DEMO_INVITE_TTL_DAYS, TABLE_INVITES, FRONTEND_BASE_URL
+from common.config import DEMO_ENABLED, DEMO_TEAM_ID, DEMO_INVITE_TTL_DAYS, TABLE_INVITES, TABLE_TEAMS, FRONTEND_BASE_URL
 from common.responses import ok, err
-from common.db import put_item
-from common.auth import token_hash
+from common.db import get_item, put_item
+from common.auth import token_hash, token_epoch
 from common.audit import write_audit
 
 def _now() -> int:
@@ -26,6 +26,7 @@ def handle_demo(event):
 
     ts = _now()
     raw_token = secrets.token_urlsafe(32)
+    team = get_item(TABLE_TEAMS, {"team_id": DEMO_TEAM_ID})
 
     put_item(TABLE_INVITES, {
         "token_hash": token_hash(raw_token),
@@ -34,6 +35,7 @@ def handle_demo(event):
         "created_at": ts,
         "expires_at": ts + (max(1, DEMO_INVITE_TTL_DAYS) * 24 * 3600),
         "is_demo": True,
+        "token_epoch": token_epoch(team),
     })
 
     invite_url = f"{FRONTEND_BASE_URL}/?token={raw_token}" if FRONTEND_BASE_URL else f"/?token={raw_token}"
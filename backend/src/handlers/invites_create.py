@@ -2,10 +2,10 @@
 import time
 import secrets
 
-from common.config import TABLE_INVITES, FRONTEND_BASE_URL
-from common.db import put_item
+from common.config import TABLE_INVITES, TABLE_TEAMS, FRONTEND_BASE_URL
+from common.db import get_item, put_item
 from common.responses import ok, err
-from common.auth import require_invite, require_role, token_hash
+from common.auth import require_invite, require_role, token_hash, token_epoch
 from common.audit import write_audit
 
 def _now() -> int:
@@ -29,6 +29,9 @@ def handle_invites_create(event, body):
     expires_in_days = int((body or {}).get("expires_in_days", 30))
     expires_in_days = max(1, min(expires_in_days, 365))  # 1..365
 
+    # Issue under the team's current epoch (team record is already loaded for our own team)
+    team = invite.get("_team") if team_id == invite.get("team_id") else get_item(TABLE_TEAMS, {"team_id": team_id})
+
     ts = _now()
     raw_token = secrets.token_urlsafe(32)
     put_item(TABLE_INVITES, {
@@ -37,6 +40,7 @@ def handle_invites_create(event, body):
         "role": role,
         "created_at": ts,
         "expires_at": ts + (expires_in_days * 24 * 3600),
+        "token_epoch": token_epoch(team),
     })
 
     # Build invite URL for front-end with CloudFront domain
@@ -15,7 +15,7 @@ def handle_me(event):
         if not team_id:
             return err("Invalid invite record.", 401, code="unauthorized")
 
-        team = get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
+        team = invite.get("_team") or get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
 
         write_audit(team_id, "me", invite_token=invite.get("_raw_token"))
 
@@ -2,7 +2,7 @@ import time
 import boto3
 import hashlib
 from common.config import TABLE_MEDIA, TABLE_TEAMS, MEDIA_BUCKET
-from common.db import put_item, get_item, update_item
+from common.db import get_item, transact_write_items, used_bytes_action, capture_sort_key, media_sort_key, MEDIA_SK_METADATA
 from common.responses import ok, err
 from common.auth import require_invite, require_role
 from common.audit import write_audit
@@ -35,7 +35,7 @@ def handle_media_complete(event, body):
         return err("media_id, object_key, filename, content_type, size_bytes are required.", 400, code="validation_error")
 
     # Re-check storage limit before finalizing (defensive)
-    team = get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
+    team = invite.get("_team") or get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
     storage_limit_bytes = team.get("storage_limit_bytes")
     if not storage_limit_bytes:
         storage_limit_gb = team.get("storage_limit_gb", 10)
@@ -53,14 +53,18 @@ def handle_media_complete(event, body):
     # Optional safety: confirm object exists (prevents phantom records).
     # This requires s3:HeadObject permission (we include it).
     try:
-        s3.head_object(Bucket=MEDIA_BUCKET, Key=object_key)
+        head = s3.head_object(Bucket=MEDIA_BUCKET, Key=object_key)
     except Exception:
         return err("Uploaded object not found yet.", 409, code="conflict")
 
     ts = int(time.time())
+    # Sort key chosen at presign time (see media_presign_upload); older clients
+    # that didn't send the metadata header get one now.
+    sk = (head.get("Metadata") or {}).get(MEDIA_SK_METADATA) or media_sort_key(ts, media_id)
+    if not sk.endswith(f"#{media_id}"):
+        return err("Uploaded object does not match media_id.", 400, code="validation_error")
+
     item = {
-        "team_id": team_id,
-        "sk": f"{ts}#{media_id}",
         "media_id": media_id,
         "object_key": object_key,
         "filename": filename,
@@ -106,22 +110,28 @@ def handle_media_complete(event, body):
     else:
         print(f"[UPLOAD] WARNING: No uploader_user_id set for media_id={media_id}")
     
-    put_item(TABLE_MEDIA, item)
+    # Merge rather than put: the thumbnail stage may already have upserted
+    # derivative fields (thumb_key, renditions, capture time) onto this item.
+    # capture-index falls back to upload time until the capture time is known
+    # (items completed before capture_sk existed: scripts/backfill_capture_sk.py).
+    # The record and the used_bytes increment go in one transaction, so
+    # jobs/storage_reconcile.py never sees one without the other.
+    names = {f"#f{i}": k for i, k in enumerate(item)}
+    values = {f":v{i}": v for i, v in enumerate(item.values())}
+    values[":capture_sk"] = capture_sort_key(ts, media_id)
+    transact_write_items([
+        {"Update": {
+            "TableName": TABLE_MEDIA,
+            "Key": {"team_id": team_id, "sk": sk},
+            "UpdateExpression": "SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(item)))
+            + ", capture_sk = if_not_exists(capture_sk, :capture_sk)",
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values,
+        }},
+        used_bytes_action(TABLE_TEAMS, team_id, size_bytes),
+    ])
     print(f"[UPLOAD] Saved media record: media_id={media_id}, team_id={team_id}, uploader_user_id={item.get('uploader_user_id', 'NONE')[:16] if item.get('uploader_user_id') else 'NONE'}...")
-
-    # Increment team's used_bytes
-    try:
-        update_item(
-            TABLE_TEAMS,
-            {"team_id": team_id},
-            "SET used_bytes = if_not_exists(used_bytes, :zero) + :size",
-            {":zero": 0, ":size": size_bytes}
-        )
-        print(f"[UPLOAD] Incremented used_bytes by {size_bytes} for team {team_id}")
-    except Exception as e:
-        print(f"[UPLOAD] Warning: Failed to update used_bytes: {e}")
-        # Don't fail the upload if we can't update used_bytes
-        # The repair script can fix this later
+    print(f"[UPLOAD] Incremented used_bytes by {size_bytes} for team {team_id}")
 
     write_audit(team_id, "media_complete", invite_token=invite.get("_raw_token"), meta={"media_id": media_id, "album_name": album_name})
 
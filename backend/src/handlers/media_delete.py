@@ -1,46 +1,82 @@
 from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+import time
+
+from botocore.exceptions import ClientError
 
 from common.responses import ok, err
 from common.auth import require_invite
 from common.config import TABLE_MEDIA, TABLE_TEAMS, MEDIA_BUCKET
-from common.db import query_media_by_id, delete_item, update_item
-from common.s3 import delete_object
+from common.db import batch_get_items, query_media_by_id, transact_write_items, used_bytes_action
+from common.s3 import delete_object, delete_objects
 from common.audit import write_audit
+from common.derivatives import derivative_keys
 
-def _token_hash(token: str) -> str:
-    """Hash a token for storage"""
-    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+# Upper bound on media_ids per /media/delete-batch call (keeps us well inside
+# the 30s API Lambda timeout: one GSI lookup per id, writes are batched).
+MAX_BATCH_DELETE = 200
 
-def handle_media_delete(event):
-    invite, auth_err = require_invite(event)
-    if auth_err:
-        return auth_err
+# gsi1 lookups in flight at once for /media/delete-batch
+LOOKUP_CONCURRENCY = 16
 
-    role = invite.get("role", "viewer")
-    if role not in ("admin", "uploader"):
-        print(f"[DELETE] Role check failed: role={role}")
-        return err("Not authorized.", 403, code="forbidden")
+# Record deletes per transaction; the team's used_bytes update is the 100th action
+TRANSACT_DELETES = 99
 
-    qs = parse_qs((event.get("rawQueryString") or ""))
-    media_id = (qs.get("media_id", [None])[0] or "").strip()
-    if not media_id:
-        print(f"[DELETE] media_id missing")
-        return err("media_id is required.", 400, code="bad_request")
+# Transaction attempts per chunk before giving up (cancelled by a conflicting write)
+TRANSACT_ATTEMPTS = 4
 
-    # Look up the media record using your existing GSI (media_id -> team_id/sk)
-    item = query_media_by_id(TABLE_MEDIA, media_id=media_id)
-    if not item:
-        print(f"[DELETE] Media not found: media_id={media_id}")
-        return err("Not found.", 404, code="not_found")
+def _delete_records(team_id: str, items: list) -> list:
+    """
+    Delete media records and decrement used_bytes in the same transaction, so
+    there's never a moment where one has happened without the other (which
+    jobs/storage_reconcile.py would otherwise correct, and the late decrement
+    then apply twice).
 
-    team_id = item["team_id"]
-    if team_id != invite["team_id"]:
-        print(f"[DELETE] Team mismatch: item_team={team_id}, invite_team={invite['team_id']}")
-        return err("Not authorized.", 403, code="forbidden")
-    
-    print(f"[DELETE] Starting delete check - role={role}, media_id={media_id}, team_id={team_id}")
-    
+    Each Delete requires the record to still exist: a record an overlapping
+    delete already removed (and already subtracted) cancels the transaction,
+    which is then retried with the records that are left. Returns the items
+    this call actually deleted.
+    """
+    deleted = []
+    for i in range(0, len(items), TRANSACT_DELETES):
+        chunk = items[i:i + TRANSACT_DELETES]
+        for attempt in range(TRANSACT_ATTEMPTS):
+            actions = [{"Delete": {
+                "TableName": TABLE_MEDIA,
+                "Key": {"team_id": team_id, "sk": it["sk"]},
+                "ConditionExpression": "attribute_exists(sk)",
+            }} for it in chunk]
+            freed = sum(max(0, it.get("size_bytes", 0)) for it in chunk)
+            if freed:
+                actions.append(used_bytes_action(TABLE_TEAMS, team_id, -freed))
+            try:
+                transact_write_items(actions)
+                deleted.extend(chunk)
+                break
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException" or attempt == TRANSACT_ATTEMPTS - 1:
+                    raise
+            keys = [{"team_id": team_id, "sk": it["sk"]} for it in chunk]
+            existing = {it["sk"] for it in batch_get_items(TABLE_MEDIA, keys, projection="sk", consistent=True)}
+            gone = len(chunk) - len(existing)
+            print(f"[DELETE] Transaction cancelled: {gone} of {len(chunk)} records already deleted, retrying the rest")
+            chunk = [it for it in chunk if it["sk"] in existing]
+            if not chunk:
+                break
+            if not gone:
+                time.sleep(0.05 * (2 ** attempt))  # a conflicting write, not a vanished record: back off
+    return deleted
+
+def _token_hash(token: str) -> str:
+    """Hash a token for storage"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _check_delete_permission(event, invite, role, item):
+    """
+    Returns None if the caller may delete this media item, else a denial message.
+    Admins can delete anything; uploaders can only delete their own uploads.
+    """
     # Ownership check: admin can delete anything, uploader can only delete own uploads
     if role == "uploader":
         uploader_user_id = item.get("uploader_user_id")
@@ -77,51 +113,161 @@ def handle_media_delete(event):
         
         if uploader_user_id and not owns_upload:
             print(f"[DELETE] DENIED: uploader_id {uploader_user_id[:16]}... doesn't match current_user_id or token_hash")
-            return err("You can only delete your own uploads.", 403, code="forbidden")
+            return "You can only delete your own uploads."
         
         # If upload has no owner (old uploads before accounts), only admin can delete
         if not uploader_user_id:
             print(f"[DELETE] DENIED: no uploader_user_id (legacy upload)")
-            return err("Only admins can delete legacy uploads.", 403, code="forbidden")
+            return "Only admins can delete legacy uploads."
+
+    return None
+
+def handle_media_delete(event):
+    invite, auth_err = require_invite(event)
+    if auth_err:
+        return auth_err
+
+    role = invite.get("role", "viewer")
+    if role not in ("admin", "uploader"):
+        print(f"[DELETE] Role check failed: role={role}")
+        return err("Not authorized.", 403, code="forbidden")
+
+    qs = parse_qs((event.get("rawQueryString") or ""))
+    media_id = (qs.get("media_id", [None])[0] or "").strip()
+    if not media_id:
+        print(f"[DELETE] media_id missing")
+        return err("media_id is required.", 400, code="bad_request")
+
+    # Look up the media record using your existing GSI (media_id -> team_id/sk)
+    item = query_media_by_id(TABLE_MEDIA, media_id=media_id)
+    if not item:
+        print(f"[DELETE] Media not found: media_id={media_id}")
+        return err("Not found.", 404, code="not_found")
+
+    team_id = item["team_id"]
+    if team_id != invite["team_id"]:
+        print(f"[DELETE] Team mismatch: item_team={team_id}, invite_team={invite['team_id']}")
+        return err("Not authorized.", 403, code="forbidden")
+    
+    print(f"[DELETE] Starting delete check - role={role}, media_id={media_id}, team_id={team_id}")
+
+    denied = _check_delete_permission(event, invite, role, item)
+    if denied:
+        return err(denied, 403, code="forbidden")
     
     print(f"[DELETE] Authorization passed, proceeding to delete S3 objects")
 
     object_key = item.get("object_key")
-    thumb_key = item.get("thumb_key")
-    preview_key = item.get("preview_key")
+    derived_keys = derivative_keys(item)
 
     # Delete S3 objects first (best effort)
     if object_key:
         delete_object(MEDIA_BUCKET, object_key)
         print(f"[DELETE] Deleted S3 object: {object_key}")
-    if thumb_key:
-        delete_object(MEDIA_BUCKET, thumb_key)
-        print(f"[DELETE] Deleted thumbnail: {thumb_key}")
-    if preview_key:
-        delete_object(MEDIA_BUCKET, preview_key)
-        print(f"[DELETE] Deleted preview: {preview_key}")
-
-    # Delete DB record
-    delete_item(TABLE_MEDIA, {"team_id": team_id, "sk": item["sk"]})
-    print(f"[DELETE] Deleted DynamoDB record: team_id={team_id}, sk={item['sk']}")
-
-    # Decrement team's used_bytes
-    size_bytes = item.get("size_bytes", 0)
-    if size_bytes > 0:
-        try:
-            update_item(
-                TABLE_TEAMS,
-                {"team_id": team_id},
-                "SET used_bytes = if_not_exists(used_bytes, :zero) - :size",
-                {":zero": 0, ":size": size_bytes}
-            )
-            print(f"[DELETE] Decremented used_bytes by {size_bytes} for team {team_id}")
-        except Exception as e:
-            print(f"[DELETE] Warning: Failed to update used_bytes: {e}")
-            # Don't fail the delete if we can't update used_bytes
-            # The repair script can fix this later
+    if derived_keys:
+        failed = delete_objects(MEDIA_BUCKET, derived_keys)
+        print(f"[DELETE] Deleted {len(derived_keys) - len(failed)}/{len(derived_keys)} derived objects (thumbnail, preview, renditions)")
+
+    # Delete DB record and decrement team's used_bytes, atomically
+    if _delete_records(team_id, [item]):
+        print(f"[DELETE] Deleted DynamoDB record: team_id={team_id}, sk={item['sk']}, freed {item.get('size_bytes', 0)} bytes")
+    else:
+        print(f"[DELETE] DynamoDB record already deleted by an overlapping request: team_id={team_id}, sk={item['sk']}")
 
     write_audit(team_id, "media_delete", invite_token=invite.get("_raw_token"), meta={"media_id": media_id})
     print(f"[DELETE] SUCCESS: media_id={media_id}")
 
     return ok({"deleted": True, "media_id": media_id})
+
+def handle_media_delete_batch(event, body):
+    """
+    POST /media/delete-batch
+    Body: {"media_ids": ["...", ...]}
+
+    Applies the same admin/uploader ownership rules as DELETE /media per item,
+    then removes S3 objects with DeleteObjects, and DB records together with
+    the used_bytes decrement in transactions of up to 99 records.
+    Returns: { results: [{ media_id, deleted, error? }], deleted_count, freed_bytes }
+    """
+    invite, auth_err = require_invite(event)
+    if auth_err:
+        return auth_err
+
+    role = invite.get("role", "viewer")
+    if role not in ("admin", "uploader"):
+        print(f"[DELETE_BATCH] Role check failed: role={role}")
+        return err("Not authorized.", 403, code="forbidden")
+
+    media_ids = (body or {}).get("media_ids")
+    if not isinstance(media_ids, list) or not media_ids:
+        return err("media_ids must be a non-empty list.", 400, code="validation_error")
+
+    # Dedupe while preserving request order
+    media_ids = list(dict.fromkeys(str(m).strip() for m in media_ids if str(m or "").strip()))
+    if not media_ids:
+        return err("media_ids must be a non-empty list.", 400, code="validation_error")
+    if len(media_ids) > MAX_BATCH_DELETE:
+        return err(f"At most {MAX_BATCH_DELETE} media_ids per request.", 400, code="validation_error")
+
+    team_id = invite["team_id"]
+    results = {}
+    to_delete = []
+
+    # gsi1 is keyed by media_id alone, so each id is its own Query; run them in parallel
+    with ThreadPoolExecutor(max_workers=min(LOOKUP_CONCURRENCY, len(media_ids))) as pool:
+        found = list(pool.map(lambda m: query_media_by_id(TABLE_MEDIA, media_id=m), media_ids))
+
+    for media_id, item in zip(media_ids, found):
+        if not item:
+            results[media_id] = {"media_id": media_id, "deleted": False, "error": {"message": "Not found.", "code": "not_found"}}
+            continue
+
+        if item["team_id"] != team_id:
+            print(f"[DELETE_BATCH] Team mismatch: media_id={media_id}, item_team={item['team_id']}, invite_team={team_id}")
+            results[media_id] = {"media_id": media_id, "deleted": False, "error": {"message": "Not authorized.", "code": "forbidden"}}
+            continue
+
+        denied = _check_delete_permission(event, invite, role, item)
+        if denied:
+            results[media_id] = {"media_id": media_id, "deleted": False, "error": {"message": denied, "code": "forbidden"}}
+            continue
+
+        to_delete.append(item)
+
+    if to_delete:
+        # Delete S3 objects first (best effort, same as single delete)
+        keys = []
+        for item in to_delete:
+            if item.get("object_key"):
+                keys.append(item["object_key"])
+            keys.extend(derivative_keys(item))
+        failed_keys = delete_objects(MEDIA_BUCKET, keys)
+        print(f"[DELETE_BATCH] Deleted {len(keys) - len(failed_keys)}/{len(keys)} S3 objects")
+        if failed_keys:
+            print(f"[DELETE_BATCH] Warning: S3 reported {len(failed_keys)} failed keys: {failed_keys[:5]}")
+
+        deleted = _delete_records(team_id, to_delete)
+        print(f"[DELETE_BATCH] Deleted {len(deleted)}/{len(to_delete)} DynamoDB records for team {team_id}")
+
+        deleted_here = {item["media_id"] for item in deleted}
+        for item in to_delete:
+            if item["media_id"] in deleted_here:
+                results[item["media_id"]] = {"media_id": item["media_id"], "deleted": True}
+            else:
+                # Removed by an overlapping delete between our lookup and our transaction
+                results[item["media_id"]] = {"media_id": item["media_id"], "deleted": False, "error": {"message": "Not found.", "code": "not_found"}}
+    else:
+        deleted = []
+
+    # Only what this request removed: records an overlapping delete got to first were freed there
+    freed_bytes = sum(max(0, item.get("size_bytes", 0)) for item in deleted)
+
+    deleted_ids = [item["media_id"] for item in deleted]
+    if deleted_ids:
+        write_audit(team_id, "media_delete_batch", invite_token=invite.get("_raw_token"), meta={"media_ids": deleted_ids, "count": len(deleted_ids)})
+
+    return ok({
+        "results": [results[m] for m in media_ids],
+        "deleted_count": len(deleted_ids),
+        "freed_bytes": freed_bytes,
+    })
@@ -3,9 +3,49 @@ from urllib.parse import parse_qs
 from common.responses import ok
 from common.auth import require_invite
 from common.config import TABLE_MEDIA, MEDIA_BUCKET, CLOUDFRONT_DOMAIN, CLOUDFRONT_KEY_PAIR_ID, CLOUDFRONT_PRIVATE_KEY
-from common.db import query_media_items
+from common.db import query_media_items, CAPTURE_INDEX
 from common.audit import write_audit
-from common.cloudfront_signer import create_signed_url
+from common.cloudfront_signer import create_signed_url, create_signed_prefix_query
+from common.derivatives import FORMAT_CONTENT_TYPE, rendition_key, rendition_prefix
+from common.streams import api_base_url, stream_url
+
+# <picture> source order: smallest encoding first, JPEG last as the <img> fallback
+SOURCE_FORMAT_ORDER = ("avif", "webp", "jpeg")
+
+
+def _image_sources(item):
+    """
+    srcset-ready renditions for an item, e.g.
+      [{"type": "image/webp", "srcset": "https://.../256.webp?... 256w, https://.../512.webp?... 512w"}, ...]
+    One wildcard signature covers every rendition of the item.
+    """
+    r = item.get("renditions") or {}
+    sizes, widths = r.get("sizes") or [], r.get("widths") or []
+    if not sizes or len(sizes) != len(widths):
+        return None
+
+    team_id, media_id = item["team_id"], item["media_id"]
+    query = create_signed_prefix_query(
+        domain_name=CLOUDFRONT_DOMAIN,
+        key_prefix=rendition_prefix(team_id, media_id),
+        key_pair_id=CLOUDFRONT_KEY_PAIR_ID,
+        private_key_pem=CLOUDFRONT_PRIVATE_KEY,
+        expires_in_seconds=3600,
+    )
+    base = CLOUDFRONT_DOMAIN.rstrip("/")
+    formats = sorted(r.get("formats") or [], key=lambda f: SOURCE_FORMAT_ORDER.index(f) if f in SOURCE_FORMAT_ORDER else len(SOURCE_FORMAT_ORDER))
+    return [
+        {
+            "type": FORMAT_CONTENT_TYPE[fmt],
+            "srcset": ", ".join(
+                f"{base}/{rendition_key(team_id, media_id, int(size), fmt)}?{query} {int(width)}w"
+                for size, width in zip(sizes, widths)
+            ),
+        }
+        for fmt in formats
+        if fmt in FORMAT_CONTENT_TYPE
+    ]
+
 
 def handle_media_list(event):
     invite, auth_err = require_invite(event)
@@ -18,8 +58,14 @@ def handle_media_list(event):
     limit = int(qs.get("limit", ["30"])[0])
     limit = max(1, min(limit, 50))
     cursor = qs.get("cursor", [None])[0]
+    # sort=captured orders by EXIF/container capture time (falls back to upload time;
+    # older items get their capture_sk from scripts/backfill_capture_sk.py)
+    sort = qs.get("sort", ["uploaded"])[0]
+    index_name = CAPTURE_INDEX if sort == "captured" else None
 
-    items, next_cursor = query_media_items(TABLE_MEDIA, team_id=team_id, limit=limit, cursor=cursor)
+    items, next_cursor = query_media_items(TABLE_MEDIA, team_id=team_id, limit=limit, cursor=cursor, index_name=index_name)
+    # Skip records the thumbnail stage upserted for uploads that were never completed
+    items = [it for it in items if it.get("object_key")]
 
     # Add CloudFront signed URLs for thumbnails and previews
     for it in items:
@@ -42,6 +88,13 @@ def handle_media_list(event):
         else:
             it["thumb_url"] = None
 
+        # Responsive renditions (see common.derivatives)
+        try:
+            it["sources"] = _image_sources(it) if content_type.startswith("image/") else None
+        except Exception as e:
+            print(f"Failed to sign renditions: {e}")
+            it["sources"] = None
+
         # Preview URL: CloudFront signed URL for images; direct signed URL for videos
         if content_type.startswith("image/"):
             preview_key = it.get("preview_key") or it.get("object_key")
@@ -60,7 +113,26 @@ def handle_media_list(event):
             else:
                 it["preview_url"] = None
         elif content_type.startswith("video/"):
-            video_key = it.get("object_key")
+            # Adaptive HLS once the transcode lane has finished; the original is the fallback
+            it["stream_url"] = (
+                stream_url(api_base_url(event), team_id, it["media_id"]) if it.get("stream_key") else None
+            )
+            # Muted loop the grid plays on hover
+            hover_key = it.get("hover_key")
+            it["hover_url"] = None
+            if hover_key:
+                try:
+                    it["hover_url"] = create_signed_url(
+                        domain_name=CLOUDFRONT_DOMAIN,
+                        object_key=hover_key,
+                        key_pair_id=CLOUDFRONT_KEY_PAIR_ID,
+                        private_key_pem=CLOUDFRONT_PRIVATE_KEY,
+                        expires_in_seconds=3600,
+                    )
+                except Exception as e:
+                    print(f"Failed to create CloudFront signed URL for hover clip: {e}")
+            # Fast-start playback copy when the thumbnail stage made one (see common.derivatives)
+            video_key = it.get("preview_key") or it.get("object_key")
             if video_key:
                 try:
                     it["preview_url"] = create_signed_url(
@@ -78,5 +150,5 @@ def handle_media_list(event):
         else:
             it["preview_url"] = None
 
-    write_audit(team_id, "media_list", invite_token=invite.get("_raw_token"), meta={"limit": limit})
+    write_audit(team_id, "media_list", invite_token=invite.get("_raw_token"), meta={"limit": limit, "sort": sort})
     return ok({"items": items, "next_cursor": next_cursor})
@@ -7,7 +7,7 @@ from common.config import MEDIA_BUCKET, SIGNED_URL_TTL_SECONDS, MAX_UPLOAD_BYTES
 from common.responses import ok, err
 from common.auth import require_invite, require_role
 from common.audit import write_audit
-from common.db import get_item
+from common.db import get_item, media_sort_key, MEDIA_SK_METADATA
 
 s3 = boto3.client("s3")
 
@@ -36,7 +36,7 @@ def handle_media_presign_upload(event, body):
     team_id = invite["team_id"]
     
     # Check storage limit before allowing upload initiation
-    team = get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
+    team = invite.get("_team") or get_item(TABLE_TEAMS, {"team_id": team_id}) or {}
     storage_limit_bytes = team.get("storage_limit_bytes")
     if not storage_limit_bytes:
         storage_limit_gb = team.get("storage_limit_gb", 10)
@@ -68,6 +68,9 @@ def handle_media_presign_upload(event, body):
     media_id = str(uuid.uuid4())
     safe_name = filename.replace("/", "_")
     object_key = f"media/{team_id}/{media_id}/{safe_name}"
+    # The media item's sort key is fixed now and travels with the object, so the
+    # thumbnail stage and /media/complete address the same item in either order.
+    sk = media_sort_key(int(time.time()), media_id)
 
     # Presigned PUT; we include ContentType and SSE so the client must match these params.
     params = {
@@ -76,6 +79,14 @@ def handle_media_presign_upload(event, body):
         "ContentType": content_type,
         "ServerSideEncryption": "AES256",
     }
+    required_headers = {"content-type": content_type}
+    # Signed metadata is a header the PUT must carry, so only clients that say
+    # they forward required_headers get it. Older (cached) clients upload
+    # without it: /media/complete then picks the sort key and the thumbnail
+    # stage finds the record on gsi1.
+    if (body or {}).get("forward_headers"):
+        params["Metadata"] = {MEDIA_SK_METADATA: sk}
+        required_headers[f"x-amz-meta-{MEDIA_SK_METADATA}"] = sk
 
     upload_url = s3.generate_presigned_url(
         ClientMethod="put_object",
@@ -91,7 +102,5 @@ def handle_media_presign_upload(event, body):
         "object_key": object_key,
         "upload_url": upload_url,
         "expires_in": SIGNED_URL_TTL_SECONDS,
-        "required_headers": {
-            "content-type": content_type
-        }
+        "required_headers": required_headers,
     })
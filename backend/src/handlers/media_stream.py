@@ -0,0 +1,50 @@
+import re
+import boto3
+from botocore.exceptions import ClientError
+
+from common.responses import err
+from common.config import MEDIA_BUCKET
+from common.derivatives import stream_prefix
+from common.streams import api_base_url, verify_stream_params, rewrite_playlist
+
+s3 = boto3.client("s3")
+
+PLAYLIST_RE = re.compile(r"^[A-Za-z0-9_-]+\.m3u8$")
+
+
+def handle_media_stream(event):
+    """
+    Serve an HLS playlist for a video with signed segment URLs.
+    Authenticated by the HMAC in the URL (see common.streams), not the
+    invite token - players fetch playlists without custom headers.
+    """
+    qs = event.get("queryStringParameters") or {}
+    team_id = (qs.get("team_id") or "").strip()
+    media_id = (qs.get("media_id") or "").strip()
+    playlist = (qs.get("p") or "").strip()
+
+    if not verify_stream_params(team_id, media_id, qs.get("exp") or "", qs.get("sig") or ""):
+        return err("Invalid or expired stream link.", 403, code="forbidden")
+    if not PLAYLIST_RE.match(playlist):
+        return err("Invalid playlist.", 400, code="validation_error")
+
+    try:
+        obj = s3.get_object(Bucket=MEDIA_BUCKET, Key=f"{stream_prefix(team_id, media_id)}{playlist}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return err("Stream not available.", 404, code="not_found")
+        raise
+
+    body = rewrite_playlist(
+        obj["Body"].read().decode("utf-8"), api_base_url(event),
+        team_id, media_id, qs["exp"], qs["sig"],
+    )
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/vnd.apple.mpegurl",
+            "Cache-Control": "private, max-age=300",
+            "Access-Control-Allow-Origin": "*",
+        },
+        "body": body,
+    }
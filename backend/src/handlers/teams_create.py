@@ -55,6 +55,7 @@ def handle_teams_create(event, body, user_id=None):
         "storage_limit_gb": 10,   # Default 10 GB for free tier
         "storage_limit_bytes": 10 * 1024 * 1024 * 1024,
         "used_bytes": 0,          # Track cumulative bytes used
+        "token_epoch": 0,         # Bumped to revoke all invites at once
     })
 
     # Create an admin invite token (token-only MVP).
@@ -65,11 +66,13 @@ def handle_teams_create(event, body, user_id=None):
         "role": "admin",
         "created_at": ts,
         "expires_at": ts + (365 * 24 * 3600),  # 1 year for admin token (adjust later)
+        "token_epoch": 0,
     })
 
     write_audit(team_id, "team_created", invite_token=None, meta={"team_name": team_name})
 
-    # If coach created the team, add them to TeamMembersTable with the admin token
+    # If coach created the team, add them to TeamMembersTable. The raw token isn't
+    # kept: the dashboard issues the coach their own (POST /coach/teams/token).
     if user_id:
         try:
             team_members_table = DYNAMODB.Table(os.getenv("TABLE_TEAM_MEMBERS", "TeamMembersTable"))
@@ -78,7 +81,6 @@ def handle_teams_create(event, body, user_id=None):
                 "team_id": team_id,
                 "role": "admin",
                 "created_at": ts,
-                "invite_token": raw_token,  # Store the admin token so we can return it later
             })
         except Exception as e:
             print(f"Warning: Failed to add coach to team members: {e}")
@@ -1,12 +1,11 @@
 import os
 import time
 
-from common.config import DYNAMODB, TABLE_TEAMS, TABLE_INVITES, TABLE_TEAM_MEMBERS
+from common.config import DYNAMODB, TABLE_TEAMS, TABLE_TEAM_MEMBERS
 from common.db import get_item
 from common.responses import ok, err
 from common.auth import require_invite, require_role
 from common.audit import write_audit
-from boto3.dynamodb.conditions import Key as DynamoKey
 
 
 def handle_teams_delete(event, team_id=None):
@@ -72,33 +71,16 @@ def _delete_team(team_id, event):
 
         ts = int(time.time())
 
-        # Soft delete: mark team as deleted
+        # Soft delete: mark team as deleted and bump token_epoch, which revokes
+        # every invite issued for this team in one write (see require_invite).
+        # Invite records themselves are cleaned up later by jobs.team_purge.
         teams_table = DYNAMODB.Table(TABLE_TEAMS)
         teams_table.update_item(
             Key={"team_id": team_id},
-            UpdateExpression="SET deleted_at = :ts",
-            ExpressionAttributeValues={":ts": ts}
+            UpdateExpression="SET deleted_at = :ts, token_epoch = if_not_exists(token_epoch, :zero) + :one",
+            ExpressionAttributeValues={":ts": ts, ":zero": 0, ":one": 1}
         )
 
-        # Revoke all invite tokens for this team
-        try:
-            invites_table = DYNAMODB.Table(TABLE_INVITES)
-            # Query all invites for this team using GSI
-            response = invites_table.query(
-                IndexName="gsi1pk-gsi1sk-index",
-                KeyConditionExpression=DynamoKey("gsi1pk").eq(team_id)
-            )
-            
-            for invite in response.get("Items", []):
-                invites_table.update_item(
-                    Key={"token_hash": invite["token_hash"]},
-                    UpdateExpression="SET revoked_at = :ts",
-                    ExpressionAttributeValues={":ts": ts}
-                )
-        except Exception as e:
-            print(f"[TEAMS_DELETE] Warning: Failed to revoke invites: {e}")
-            # Continue anyway - team is already marked deleted
-
         # Audit log
         write_audit(team_id, "team_deleted", invite_token=event.get("headers", {}).get("x-invite-token"),
                    meta={"team_name": team.get("team_name")})
@@ -0,0 +1,85 @@
+"""
+Ingest audit events from the log channel into the audit table.
+
+common.audit prints an {"audit": {...}} JSON line for every event (with
+AUDIT_SINK=log, the default), or for those AUDIT_SINK=table couldn't
+batch-write. A CloudWatch Logs subscription filter on the API function's log
+group delivers those lines here, gzipped and base64-encoded; they're written
+with BatchWriteItem. The items carry their own sk (ts#event_id), so
+redelivery is harmless.
+
+Anything still unprocessed after the retries raises, and Lambda's async retry
+delivers the batch again.
+
+Runs as:
+  Lambda: jobs.audit_ingest.handler (CloudWatch Logs subscription)
+  CLI:    cd backend/src && python -m jobs.audit_ingest [FILE ...] [--dry-run]
+          (reads log lines from the files, or stdin - the local stand-in for the
+          subscription, e.g. piping `sam local` or saved log output; reads TABLE_AUDIT)
+"""
+import argparse
+import base64
+import fileinput
+import gzip
+import json
+from decimal import Decimal
+from typing import Dict, Iterable, List
+
+from common.config import TABLE_AUDIT
+from common.db import batch_put_items
+
+
+def parse_lines(lines: Iterable[str]) -> List[Dict]:
+    """Audit items from raw log lines; everything else in the log is skipped."""
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{") or '"audit"' not in line:
+            continue
+        try:
+            # DynamoDB takes Decimal, not float, for meta values
+            record = json.loads(line, parse_float=Decimal)
+        except ValueError:
+            continue
+        item = record.get("audit") if isinstance(record, dict) else None
+        if isinstance(item, dict) and item.get("team_id") and item.get("sk"):
+            items.append(item)
+    return items
+
+
+def decode_subscription(event: Dict) -> List[str]:
+    """Log messages from a CloudWatch Logs subscription payload."""
+    data = json.loads(gzip.decompress(base64.b64decode(event["awslogs"]["data"])))
+    if data.get("messageType") != "DATA_MESSAGE":  # CONTROL_MESSAGE: the subscription's health check
+        return []
+    return [e["message"] for e in data.get("logEvents", [])]
+
+
+def ingest(items: List[Dict], dry_run: bool = False) -> Dict:
+    if dry_run or not items:
+        return {"events": len(items), "written": 0, "unprocessed": 0}
+    unprocessed = batch_put_items(TABLE_AUDIT, items)
+    return {"events": len(items), "written": len(items) - len(unprocessed), "unprocessed": len(unprocessed)}
+
+
+def handler(event, context):
+    result = ingest(parse_lines(decode_subscription(event)))
+    print(f"[AUDIT] Ingested {result['written']}/{result['events']} event(s) from the log channel")
+    if result["unprocessed"]:
+        raise RuntimeError(f"{result['unprocessed']} audit event(s) unprocessed; retrying the batch")
+    return {"ok": True, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write audit log lines into the audit table")
+    parser.add_argument("files", nargs="*", help="Log files to read (default: stdin)")
+    parser.add_argument("--dry-run", action="store_true", help="Count audit events without writing them")
+    args = parser.parse_args()
+
+    with fileinput.input(files=args.files or ("-",)) as lines:
+        result = ingest(parse_lines(lines), dry_run=args.dry_run)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
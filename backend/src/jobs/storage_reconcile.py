@@ -0,0 +1,281 @@
+"""
+Reconcile every team's used_bytes against its media records.
+
+used_bytes is maintained incrementally - /media/complete adds size_bytes,
+media delete subtracts it - and has drifted from failed best-effort updates.
+This job enumerates the Teams table (soft-deleted teams are left to
+team_purge) and, RECONCILE_CONCURRENCY teams at a time, sums size_bytes over
+each team's finalized records (those with object_key) and compares the total
+with used_bytes.
+
+Corrections never clobber a concurrent upload or delete. /media/complete and
+media deletes change the record and used_bytes in one transaction that also
+bumps the team's usage_version (common.db.used_bytes_action). usage_version is
+read (consistently) before the records are summed, and the new total is
+written with a condition that it hasn't changed; if it moved, the team is read
+and summed again, up to MAX_ATTEMPTS times. Because record and counter change
+together, there's no window in which a sum can see one without the other.
+
+With include_s3 the team's prefixes are also listed, and the report carries
+the bytes actually stored: originals (and how many differ from the size the
+client declared, or have no record), plus thumbnails/, previews/ and streams/,
+which used_bytes does not count. These are reported only; the correction is
+always to the record total, which is what quota checks compare against.
+
+Every run produces a drift report: one entry per team whose used_bytes was off
+(or, with include_s3, whose stored bytes disagree with its records), and
+StorageDriftBytes / StorageDriftTeams metrics.
+
+Runs as:
+  Lambda: jobs.storage_reconcile.handler (scheduled; event may carry
+          {"team_id": "...", "dry_run": true, "include_s3": true})
+  CLI:    cd backend/src && python -m jobs.storage_reconcile [--team-id ID] [--s3] [--dry-run] [--report FILE]
+          (reads TABLE_TEAMS, TABLE_MEDIA, MEDIA_BUCKET from the environment)
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from common.config import TABLE_TEAMS, TABLE_MEDIA, MEDIA_BUCKET, RECONCILE_CONCURRENCY
+from common.db import table, _normalize
+from common.metrics import put_metric
+from common.s3 import iter_object_pages
+
+ORIGINALS_PREFIX = "media"
+DERIVED_PREFIXES = ("thumbnails", "previews", "streams")
+
+# Conditional write lost to a concurrent upload/delete this many times: report a conflict
+MAX_ATTEMPTS = 3
+
+# Stop when the Lambda has less than this much time left; the next run starts over
+MIN_REMAINING_MS = 30_000
+
+
+def _out_of_time(context) -> bool:
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return False
+    return context.get_remaining_time_in_millis() < MIN_REMAINING_MS
+
+
+def _used_bytes(team_id: str) -> Optional[Dict]:
+    """{"used_bytes", "usage_version"} (each int or None) for an existing team, None if there is no team."""
+    resp = table(TABLE_TEAMS).get_item(
+        Key={"team_id": team_id},
+        ConsistentRead=True,
+        ProjectionExpression="team_id, used_bytes, usage_version",
+    )
+    item = resp.get("Item")
+    if not item:
+        return None
+    item = _normalize(item)
+    return {"used_bytes": item.get("used_bytes"), "usage_version": item.get("usage_version")}
+
+
+def record_totals(team_id: str) -> Dict:
+    """Sum size_bytes over the team's finalized records; also object_key -> size for the S3 comparison."""
+    totals = {"items": 0, "bytes": 0, "sizes": {}}
+    kwargs = {
+        "KeyConditionExpression": Key("team_id").eq(team_id),
+        "ProjectionExpression": "object_key, size_bytes",
+        "ConsistentRead": True,
+    }
+    while True:
+        resp = table(TABLE_MEDIA).query(**kwargs)
+        for item in resp.get("Items", []):
+            item = _normalize(item)
+            size = item.get("size_bytes") or 0
+            if not item.get("object_key") or size <= 0:
+                continue
+            totals["items"] += 1
+            totals["bytes"] += size
+            totals["sizes"][item["object_key"]] = size
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            return totals
+        kwargs["ExclusiveStartKey"] = lek
+
+
+def _set_used_bytes(team_id: str, seen: Dict, total: int) -> bool:
+    """Write total if no upload or delete has changed usage since seen was read; False otherwise."""
+    if seen["usage_version"] is not None:
+        condition = Attr("usage_version").eq(seen["usage_version"])
+    else:
+        # No transactional write yet: nothing but used_bytes itself to go by
+        condition = Attr("usage_version").not_exists() & (
+            Attr("used_bytes").not_exists() if seen["used_bytes"] is None else Attr("used_bytes").eq(seen["used_bytes"])
+        )
+    try:
+        table(TABLE_TEAMS).update_item(
+            Key={"team_id": team_id},
+            UpdateExpression="SET used_bytes = :total",
+            ConditionExpression=condition,
+            ExpressionAttributeValues={":total": total},
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def _stored_bytes(team_id: str, sizes: Dict[str, int]) -> Dict:
+    """What the bucket actually holds for the team, compared with its records."""
+    stored = {
+        "s3_original_bytes": 0, "s3_unrecorded_bytes": 0, "s3_size_mismatches": 0,
+        "s3_missing_originals": 0, "s3_derived_bytes": 0,
+    }
+    seen = set()
+    for page in iter_object_pages(MEDIA_BUCKET, f"{ORIGINALS_PREFIX}/{team_id}/"):
+        for obj in page:
+            stored["s3_original_bytes"] += obj["Size"]
+            if obj["Key"] not in sizes:
+                stored["s3_unrecorded_bytes"] += obj["Size"]
+                continue
+            seen.add(obj["Key"])
+            if obj["Size"] != sizes[obj["Key"]]:
+                stored["s3_size_mismatches"] += 1
+    stored["s3_missing_originals"] = len(sizes.keys() - seen)
+    for prefix in DERIVED_PREFIXES:
+        for page in iter_object_pages(MEDIA_BUCKET, f"{prefix}/{team_id}/"):
+            stored["s3_derived_bytes"] += sum(o["Size"] for o in page)
+    return stored
+
+
+def reconcile_team(team_id: str, include_s3: bool = False, dry_run: bool = False) -> Dict:
+    """
+    Compare (and unless dry_run, correct) one team's used_bytes.
+    Returns a report with status in_sync | corrected | drift (dry run) | conflict | not_found.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        team = _used_bytes(team_id)
+        if team is None:
+            return {"team_id": team_id, "status": "not_found"}
+        used = team["used_bytes"]
+        totals = record_totals(team_id)
+        report = {
+            "team_id": team_id,
+            "used_bytes": used,
+            "record_bytes": totals["bytes"],
+            "items": totals["items"],
+            "drift": (used or 0) - totals["bytes"],
+            "attempts": attempt,
+        }
+        if used == totals["bytes"] or (used is None and not totals["bytes"]):
+            report["status"] = "in_sync"
+        elif dry_run:
+            report["status"] = "drift"
+        elif _set_used_bytes(team_id, team, totals["bytes"]):
+            report["status"] = "corrected"
+        elif attempt < MAX_ATTEMPTS:
+            continue
+        else:
+            report["status"] = "conflict"
+        break
+
+    if include_s3:
+        report.update(_stored_bytes(team_id, totals["sizes"]))
+    return report
+
+
+def _has_drift(report: Dict) -> bool:
+    return bool(
+        report.get("drift")
+        or report.get("s3_unrecorded_bytes")
+        or report.get("s3_size_mismatches")
+        or report.get("s3_missing_originals")
+    )
+
+
+def list_team_ids() -> List[str]:
+    """Every team that isn't soft-deleted (those belong to team_purge)."""
+    kwargs = {"FilterExpression": Attr("deleted_at").not_exists(), "ProjectionExpression": "team_id"}
+    team_ids = []
+    while True:
+        resp = table(TABLE_TEAMS).scan(**kwargs)
+        team_ids.extend(t["team_id"] for t in resp.get("Items", []))
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            return team_ids
+        kwargs["ExclusiveStartKey"] = lek
+
+
+def run(team_ids: List[str], include_s3: bool = False, dry_run: bool = False,
+        concurrency: int = RECONCILE_CONCURRENCY, context=None) -> Dict:
+    started = time.monotonic()
+
+    def reconcile(team_id):
+        # Teams not started before the deadline are left for the next run
+        if _out_of_time(context):
+            return None
+        return reconcile_team(team_id, include_s3=include_s3, dry_run=dry_run)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = [r for r in pool.map(reconcile, team_ids) if r is not None]
+
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+    reports = [r for r in results if r["status"] != "in_sync" or _has_drift(r)]
+    for r in reports:
+        print(f"[RECONCILE] {'(dry run) ' if dry_run else ''}team={r['team_id']} {r}")
+
+    drift_bytes = sum(abs(r.get("drift", 0)) for r in reports)
+    drift_teams = sum(1 for r in reports if r.get("drift"))
+    summary = {
+        "ok": True,
+        "dry_run": dry_run,
+        "include_s3": include_s3,
+        "teams_checked": len(results),
+        "teams_total": len(team_ids),
+        "statuses": statuses,
+        "drift_teams": drift_teams,
+        "drift_bytes": drift_bytes,
+        "elapsed_s": round(time.monotonic() - started, 2),
+        "reports": reports,
+    }
+    put_metric("StorageDriftBytes", drift_bytes, "Bytes", dry_run=dry_run)
+    put_metric("StorageDriftTeams", drift_teams, "Count", dry_run=dry_run, statuses=statuses)
+    print(
+        f"[RECONCILE] {'(dry run) ' if dry_run else ''}{drift_teams} of {len(results)} team(s) drifted "
+        f"by {drift_bytes} bytes in total; {statuses}"
+    )
+    return summary
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point. One team if given, else every team that isn't soft-deleted."""
+    event = event or {}
+    team_ids = [event["team_id"]] if event.get("team_id") else list_team_ids()
+    return run(
+        team_ids,
+        include_s3=bool(event.get("include_s3")),
+        dry_run=bool(event.get("dry_run")),
+        context=context,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile every team's used_bytes against its media records")
+    parser.add_argument("--team-id", help="Reconcile a single team (default: every team)")
+    parser.add_argument("--s3", action="store_true", help="Also list the bucket and report stored bytes, derivatives included")
+    parser.add_argument("--concurrency", type=int, default=RECONCILE_CONCURRENCY, help="Teams reconciled in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without correcting it")
+    parser.add_argument("--report", help="Write the drift report as JSON lines, one team per line")
+    args = parser.parse_args()
+
+    team_ids = [args.team_id] if args.team_id else list_team_ids()
+    summary = run(team_ids, include_s3=args.s3, dry_run=args.dry_run, concurrency=args.concurrency)
+    if args.report:
+        with open(args.report, "w") as f:
+            for r in summary["reports"]:
+                f.write(json.dumps(r) + "\n")
+    print(json.dumps({k: v for k, v in summary.items() if k != "reports"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
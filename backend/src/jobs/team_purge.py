@@ -0,0 +1,303 @@
+"""
+Background purge of soft-deleted teams.
+
+DELETE /teams/{team_id} only sets deleted_at. Once PURGE_GRACE_DAYS have passed,
+this job removes everything the team left behind, in four phases:
+
+  1. media   - stream the team's media partition page by page; delete each page's
+               originals and derived objects with DeleteObjects, then the records
+               with BatchWriteItem
+  2. objects - sweep media/, thumbnails/, previews/ and streams/ prefixes for anything left
+               without a record (abandoned uploads, failed deletes)
+  3. audit   - batch-delete the team's audit partition
+  4. invites - batch-delete the team's invite records (already dead: deleting a
+               team bumps its token_epoch, which require_invite enforces)
+
+The current phase, query cursor and running totals are checkpointed on the team
+record (purge_state) after every page, so a run cut short by the Lambda timeout
+resumes where it stopped. purged_at is set once everything is gone.
+
+Runs as:
+  Lambda: jobs.team_purge.handler (scheduled; event may carry {"team_id": "..."})
+  CLI:    cd backend/src && python -m jobs.team_purge [--team-id ID] [--grace-days N] [--dry-run]
+          (reads TABLE_TEAMS, TABLE_MEDIA, TABLE_AUDIT, TABLE_INVITES, MEDIA_BUCKET from the environment)
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from common.config import TABLE_TEAMS, TABLE_MEDIA, TABLE_AUDIT, TABLE_INVITES, MEDIA_BUCKET, PURGE_GRACE_DAYS, PURGE_CONCURRENCY
+from common.db import table, get_item, update_item, batch_delete_items, query_media_items, _normalize
+from common.derivatives import derivative_keys
+from common.s3 import delete_objects, iter_object_pages, DELETE_OBJECTS_MAX_KEYS
+
+PAGE_SIZE = 500
+OBJECT_PREFIXES = ("media", "thumbnails", "previews", "streams")
+
+# Stop and checkpoint when the Lambda has less than this much time left
+MIN_REMAINING_MS = 30_000
+
+
+def _out_of_time(context) -> bool:
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return False
+    return context.get_remaining_time_in_millis() < MIN_REMAINING_MS
+
+
+def is_purge_due(team: Dict, grace_days: int, now: int) -> bool:
+    deleted_at = team.get("deleted_at")
+    if not deleted_at or team.get("purged_at"):
+        return False
+    return now - int(deleted_at) >= grace_days * 86400
+
+
+def _new_state(now: int) -> Dict:
+    return {
+        "phase": "media",
+        "cursor": None,
+        "prefix_index": 0,
+        "items": 0,
+        "objects": 0,
+        "swept_objects": 0,
+        "audit_events": 0,
+        "invites": 0,
+        "bytes": 0,
+        "failed_objects": 0,
+        "elapsed_ms": 0,
+        "started_at": now,
+    }
+
+
+def _checkpoint(team_id: str, state: Dict) -> None:
+    update_item(TABLE_TEAMS, {"team_id": team_id}, "SET purge_state = :s", {":s": state})
+
+
+def _delete_keys(pool: ThreadPoolExecutor, bucket: str, keys: List[str]) -> List[str]:
+    """Fan DeleteObjects requests (1,000 keys each) out over the pool; returns failed keys."""
+    chunks = [keys[i:i + DELETE_OBJECTS_MAX_KEYS] for i in range(0, len(keys), DELETE_OBJECTS_MAX_KEYS)]
+    failed = []
+    for future in [pool.submit(delete_objects, bucket, chunk) for chunk in chunks]:
+        failed.extend(future.result())
+    return failed
+
+
+def _purge_media_page(pool, team_id: str, state: Dict, dry_run: bool) -> None:
+    items, next_cursor = query_media_items(TABLE_MEDIA, team_id=team_id, limit=PAGE_SIZE, cursor=state["cursor"])
+
+    keys = []
+    for item in items:
+        if item.get("object_key"):
+            keys.append(item["object_key"])
+        keys.extend(derivative_keys(item))
+        state["bytes"] += max(0, item.get("size_bytes", 0))
+
+    if not dry_run and items:
+        # Failed S3 keys are picked up by the prefix sweep in the objects phase
+        state["failed_objects"] += len(_delete_keys(pool, MEDIA_BUCKET, keys))
+        batch_delete_items(TABLE_MEDIA, [{"team_id": team_id, "sk": item["sk"]} for item in items])
+
+    state["items"] += len(items)
+    state["objects"] += len(keys)
+    state["cursor"] = next_cursor
+    if not next_cursor:
+        state["phase"] = "objects"
+
+
+def _purge_objects_prefix(pool, team_id: str, state: Dict, dry_run: bool, context) -> None:
+    prefix = f"{OBJECT_PREFIXES[state['prefix_index']]}/{team_id}/"
+    pending = []
+    for page in iter_object_pages(MEDIA_BUCKET, prefix):
+        state["swept_objects"] += len(page)
+        if not dry_run:
+            # Bounded in-flight: wait for the oldest request before queueing more
+            if len(pending) >= PURGE_CONCURRENCY:
+                state["failed_objects"] += len(pending.pop(0).result())
+            pending.append(pool.submit(delete_objects, MEDIA_BUCKET, [o["Key"] for o in page]))
+        if _out_of_time(context):
+            break
+    else:
+        state["prefix_index"] += 1
+
+    for future in pending:
+        state["failed_objects"] += len(future.result())
+
+    if state["prefix_index"] >= len(OBJECT_PREFIXES):
+        state["phase"] = "audit"
+        state["cursor"] = None
+
+
+def _purge_audit_page(team_id: str, state: Dict, dry_run: bool) -> None:
+    if not TABLE_AUDIT:
+        state["phase"] = "invites"
+        return
+
+    kwargs = {
+        "KeyConditionExpression": Key("team_id").eq(team_id),
+        "ProjectionExpression": "team_id, sk",
+        "Limit": PAGE_SIZE,
+    }
+    if state["cursor"]:
+        kwargs["ExclusiveStartKey"] = json.loads(state["cursor"])
+    resp = table(TABLE_AUDIT).query(**kwargs)
+    keys = [{"team_id": i["team_id"], "sk": i["sk"]} for i in resp.get("Items", [])]
+
+    if not dry_run:
+        batch_delete_items(TABLE_AUDIT, keys)
+
+    state["audit_events"] += len(keys)
+    lek = resp.get("LastEvaluatedKey")
+    state["cursor"] = json.dumps(_normalize(lek)) if lek else None
+    if not lek:
+        state["phase"] = "invites"
+
+
+def _purge_invites_page(team_id: str, state: Dict, dry_run: bool) -> None:
+    kwargs = {
+        "IndexName": "team-role-index",
+        "KeyConditionExpression": Key("team_id").eq(team_id),
+        "ProjectionExpression": "token_hash",
+        "Limit": PAGE_SIZE,
+    }
+    if state["cursor"]:
+        kwargs["ExclusiveStartKey"] = json.loads(state["cursor"])
+    resp = table(TABLE_INVITES).query(**kwargs)
+    keys = [{"token_hash": i["token_hash"]} for i in resp.get("Items", [])]
+
+    if not dry_run:
+        batch_delete_items(TABLE_INVITES, keys)
+
+    state["invites"] += len(keys)
+    lek = resp.get("LastEvaluatedKey")
+    state["cursor"] = json.dumps(_normalize(lek)) if lek else None
+    if not lek:
+        state["phase"] = "done"
+
+
+def _report(team_id: str, status: str, state: Dict) -> Dict:
+    elapsed_s = state["elapsed_ms"] / 1000
+
+    def rate(n):
+        return round(n / elapsed_s, 1) if elapsed_s > 0 else 0.0
+
+    return {
+        "team_id": team_id,
+        "status": status,
+        "phase": state["phase"],
+        "items": state["items"],
+        "objects": state["objects"],
+        "swept_objects": state["swept_objects"],
+        "failed_objects": state["failed_objects"],
+        "audit_events": state["audit_events"],
+        "invites": state["invites"],
+        "bytes": state["bytes"],
+        "elapsed_s": round(elapsed_s, 2),
+        "items_per_s": rate(state["items"]),
+        "objects_per_s": rate(state["objects"] + state["swept_objects"]),
+        "mb_per_s": rate(state["bytes"] / (1024 ** 2)),
+    }
+
+
+def purge_team(team_id: str, grace_days: int = PURGE_GRACE_DAYS, context=None, dry_run: bool = False, now: Optional[int] = None) -> Dict:
+    """
+    Purge (or continue purging) one soft-deleted team.
+    Returns a report with status purged | in_progress | not_due | not_found | already_purged.
+    """
+    now = now or int(time.time())
+    team = get_item(TABLE_TEAMS, {"team_id": team_id})
+    if not team:
+        return {"team_id": team_id, "status": "not_found"}
+    if team.get("purged_at"):
+        return {"team_id": team_id, "status": "already_purged", "purged_at": team["purged_at"]}
+    if not is_purge_due(team, grace_days, now):
+        deleted_at = team.get("deleted_at")
+        purge_after = int(deleted_at) + grace_days * 86400 if deleted_at else None
+        return {"team_id": team_id, "status": "not_due", "purge_after": purge_after}
+
+    state = _new_state(now)
+    if not dry_run:
+        state.update(team.get("purge_state") or {})
+
+    print(f"[PURGE] {'(dry run) ' if dry_run else ''}team={team_id} resuming at phase={state['phase']}")
+    run_started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, PURGE_CONCURRENCY)) as pool:
+        while state["phase"] != "done" and not _out_of_time(context):
+            page_started = time.monotonic()
+            if state["phase"] == "media":
+                _purge_media_page(pool, team_id, state, dry_run)
+            elif state["phase"] == "objects":
+                _purge_objects_prefix(pool, team_id, state, dry_run, context)
+            elif state["phase"] == "audit":
+                _purge_audit_page(team_id, state, dry_run)
+            else:
+                _purge_invites_page(team_id, state, dry_run)
+
+            state["elapsed_ms"] += int((time.monotonic() - page_started) * 1000)
+            if not dry_run:
+                _checkpoint(team_id, state)
+
+    if state["phase"] != "done":
+        report = _report(team_id, "in_progress", state)
+    else:
+        if not dry_run:
+            update_item(TABLE_TEAMS, {"team_id": team_id}, "SET purged_at = :ts", {":ts": int(time.time())})
+        report = _report(team_id, "purged", state)
+
+    print(f"[PURGE] team={team_id} {report['status']} in {time.monotonic() - run_started:.1f}s: {report}")
+    return report
+
+
+def find_purge_candidates(grace_days: int = PURGE_GRACE_DAYS, now: Optional[int] = None) -> List[str]:
+    """Soft-deleted, not yet purged teams whose grace period has elapsed."""
+    now = now or int(time.time())
+    kwargs = {
+        "FilterExpression": Attr("deleted_at").exists() & Attr("purged_at").not_exists(),
+        "ProjectionExpression": "team_id, deleted_at",
+    }
+    team_ids = []
+    while True:
+        resp = table(TABLE_TEAMS).scan(**kwargs)
+        for team in resp.get("Items", []):
+            if is_purge_due(_normalize(team), grace_days, now):
+                team_ids.append(team["team_id"])
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            break
+        kwargs["ExclusiveStartKey"] = lek
+    return team_ids
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point. Purges one team if given, else every team that is due."""
+    team_id = (event or {}).get("team_id")
+    team_ids = [team_id] if team_id else find_purge_candidates()
+
+    reports = []
+    for tid in team_ids:
+        if _out_of_time(context):
+            break
+        reports.append(purge_team(tid, context=context))
+
+    return {"ok": True, "reports": reports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge data for soft-deleted teams")
+    parser.add_argument("--team-id", help="Purge a single team (default: every team that is due)")
+    parser.add_argument("--grace-days", type=int, default=PURGE_GRACE_DAYS, help="Days to keep data after deleted_at")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be deleted without deleting")
+    args = parser.parse_args()
+
+    team_ids = [args.team_id] if args.team_id else find_purge_candidates(args.grace_days)
+    print(f"{'[DRY RUN] ' if args.dry_run else ''}{len(team_ids)} team(s) to purge")
+    for tid in team_ids:
+        report = purge_team(tid, grace_days=args.grace_days, dry_run=args.dry_run)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Garbage collection of uploads that were never finalized.
+
+media_presign_upload hands out a PUT URL, but the media record is only written
+by /media/complete. A client that uploads and never completes (tab closed,
+network gone) leaves an original under media/{team_id}/{media_id}/ that no
+record points to and used_bytes never counted - plus whatever the thumbnail
+Lambda derived from it, and the partial record it upserted (derivative keys,
+no object_key).
+
+For each team this lists the media/ prefix, and every original older than the
+presign TTL plus UPLOAD_GC_GRACE_HOURS whose media_id has no finalized record
+(one with object_key) is deleted along with its thumbnails/, previews/ and
+streams/ objects, in DeleteObjects batches. A partial record is deleted first,
+conditional on it still having no object_key, so an upload whose
+/media/complete lands mid-run is left alone.
+
+Runs as:
+  Lambda: jobs.upload_gc.handler (scheduled; event may carry {"team_id": "...", "dry_run": true})
+  CLI:    cd backend/src && python -m jobs.upload_gc [--team-id ID] [--grace-hours N] [--dry-run]
+          (reads TABLE_MEDIA, MEDIA_BUCKET from the environment)
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from common.config import TABLE_MEDIA, MEDIA_BUCKET, SIGNED_URL_TTL_SECONDS, UPLOAD_GC_GRACE_HOURS
+from common.db import table
+from common.s3 import delete_objects, iter_object_pages, iter_common_prefixes
+
+ORIGINALS_PREFIX = "media"
+DERIVED_PREFIXES = ("thumbnails", "previews", "streams")
+
+# Stop when the Lambda has less than this much time left; the next run starts over
+MIN_REMAINING_MS = 30_000
+
+
+def _out_of_time(context) -> bool:
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return False
+    return context.get_remaining_time_in_millis() < MIN_REMAINING_MS
+
+
+def min_age_seconds(grace_hours: int) -> int:
+    """An upload can still be in flight until its presigned URL expires; the grace covers slow completes."""
+    return SIGNED_URL_TTL_SECONDS + grace_hours * 3600
+
+
+def _team_records(team_id: str) -> Dict[str, Dict]:
+    """media_id -> {"sk", "finalized"} for every record in the team's partition."""
+    records = {}
+    kwargs = {"KeyConditionExpression": Key("team_id").eq(team_id), "ProjectionExpression": "sk, object_key"}
+    while True:
+        resp = table(TABLE_MEDIA).query(**kwargs)
+        for item in resp.get("Items", []):
+            media_id = item["sk"].rsplit("#", 1)[-1]
+            records[media_id] = {"sk": item["sk"], "finalized": bool(item.get("object_key"))}
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            return records
+        kwargs["ExclusiveStartKey"] = lek
+
+
+def find_orphans(team_id: str, grace_hours: int = UPLOAD_GC_GRACE_HOURS, now: Optional[float] = None) -> List[Dict]:
+    """Old enough originals under the team's media/ prefix with no finalized record, by media_id."""
+    now = now or time.time()
+    cutoff = now - min_age_seconds(grace_hours)
+    originals, too_young = {}, set()
+    for page in iter_object_pages(MEDIA_BUCKET, f"{ORIGINALS_PREFIX}/{team_id}/"):
+        for obj in page:
+            parts = obj["Key"].split("/", 3)
+            if len(parts) < 4:
+                continue
+            media_id = parts[2]
+            if obj["LastModified"].timestamp() > cutoff:
+                too_young.add(media_id)
+            originals.setdefault(media_id, []).append(obj)
+    if not originals:
+        return []
+
+    records = _team_records(team_id)
+    orphans = []
+    for media_id, objects in originals.items():
+        record = records.get(media_id)
+        if media_id in too_young or (record and record["finalized"]):
+            continue
+        orphans.append({
+            "media_id": media_id,
+            "keys": [o["Key"] for o in objects],
+            "bytes": sum(o["Size"] for o in objects),
+            "partial_sk": record["sk"] if record else None,
+        })
+    return orphans
+
+
+def _delete_partial_record(team_id: str, sk: str) -> bool:
+    """Delete a record that still has no object_key; False if /media/complete got there first."""
+    try:
+        table(TABLE_MEDIA).delete_item(
+            Key={"team_id": team_id, "sk": sk},
+            ConditionExpression=Attr("object_key").not_exists(),
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+
+def collect_team(team_id: str, grace_hours: int = UPLOAD_GC_GRACE_HOURS, dry_run: bool = False, now: Optional[float] = None) -> Dict:
+    """Delete (or, dry run, count) one team's abandoned uploads. Returns the team's report."""
+    report = {
+        "team_id": team_id, "uploads": 0, "objects": 0, "bytes": 0,
+        "derived_objects": 0, "derived_bytes": 0, "partial_records": 0, "failed_objects": 0,
+    }
+    keys = []
+    for orphan in find_orphans(team_id, grace_hours, now):
+        if orphan["partial_sk"] and not dry_run and not _delete_partial_record(team_id, orphan["partial_sk"]):
+            continue
+        report["partial_records"] += 1 if orphan["partial_sk"] else 0
+        report["uploads"] += 1
+        report["objects"] += len(orphan["keys"])
+        report["bytes"] += orphan["bytes"]
+        keys.extend(orphan["keys"])
+        for prefix in DERIVED_PREFIXES:
+            for page in iter_object_pages(MEDIA_BUCKET, f"{prefix}/{team_id}/{orphan['media_id']}/"):
+                report["derived_objects"] += len(page)
+                report["derived_bytes"] += sum(o["Size"] for o in page)
+                keys.extend(o["Key"] for o in page)
+
+    if keys and not dry_run:
+        # delete_objects sends 1,000 keys per DeleteObjects request
+        report["failed_objects"] = len(delete_objects(MEDIA_BUCKET, keys))
+    report["reclaimed_bytes"] = report["bytes"] + report["derived_bytes"]
+    return report
+
+
+def list_team_ids() -> List[str]:
+    prefix = f"{ORIGINALS_PREFIX}/"
+    return [p[len(prefix):].rstrip("/") for p in iter_common_prefixes(MEDIA_BUCKET, prefix)]
+
+
+def run(team_ids: List[str], grace_hours: int = UPLOAD_GC_GRACE_HOURS, dry_run: bool = False, context=None) -> Dict:
+    started = time.monotonic()
+    reports, checked = [], 0
+    for team_id in team_ids:
+        if _out_of_time(context):
+            break
+        checked += 1
+        report = collect_team(team_id, grace_hours, dry_run)
+        if report["uploads"]:
+            print(f"[GC] {'(dry run) ' if dry_run else ''}team={team_id} {report}")
+            reports.append(report)
+
+    summary = {
+        "ok": True,
+        "dry_run": dry_run,
+        "teams_checked": checked,
+        "teams_total": len(team_ids),
+        "uploads": sum(r["uploads"] for r in reports),
+        "reclaimed_bytes": sum(r["reclaimed_bytes"] for r in reports),
+        "elapsed_s": round(time.monotonic() - started, 2),
+        "reports": reports,
+    }
+    print(
+        f"[GC] {'(dry run) ' if dry_run else ''}{summary['uploads']} abandoned upload(s), "
+        f"{summary['reclaimed_bytes']} bytes in {len(reports)} of {checked} team(s)"
+    )
+    return summary
+
+
+def handler(event, context):
+    """Scheduled Lambda entry point. One team if given, else every team with a media/ prefix."""
+    event = event or {}
+    team_ids = [event["team_id"]] if event.get("team_id") else list_team_ids()
+    return run(team_ids, dry_run=bool(event.get("dry_run")), context=context)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete uploads never finalized by /media/complete")
+    parser.add_argument("--team-id", help="Collect a single team (default: every team)")
+    parser.add_argument("--grace-hours", type=int, default=UPLOAD_GC_GRACE_HOURS, help="Hours past the presign TTL to wait")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    team_ids = [args.team_id] if args.team_id else list_team_ids()
+    summary = run(team_ids, grace_hours=args.grace_hours, dry_run=args.dry_run)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import json
 from typing import Any, Dict, Tuple
 
+from common.audit import flush_audit
 from common.responses import ok, err
 from handlers.health import handle_health
 from handlers.me import handle_me
@@ -14,13 +15,14 @@ from handlers.media_presign_upload import handle_media_presign_upload
 from handlers.media_complete import handle_media_complete
 from handlers.media_presign_download import handle_media_presign_download
 from handlers.media_thumbnail import handle_media_thumbnail
-from handlers.media_delete import handle_media_delete
+from handlers.media_stream import handle_media_stream
+from handlers.media_delete import handle_media_delete, handle_media_delete_batch
 from handlers.auth_join_team import handle_auth_join_team
 from handlers.auth_lookup_teams import handle_auth_lookup_teams
 from handlers.auth_verify import handle_auth_verify
 from handlers.auth_coach_signin import handle_coach_signin
 from handlers.auth_verify_coach import handle_verify_coach
-from handlers.coach_teams import handle_get_coach_teams
+from handlers.coach_teams import handle_get_coach_teams, handle_coach_team_token
 from handlers.coach_verify_access import handle_coach_verify_access
 from handlers.admin_repair_storage import handle_admin_repair_storage
 from handlers.billing_checkout_session import handle_billing_checkout_session
@@ -47,6 +49,14 @@ def _json_body(event: Dict) -> Dict:
         return {}
 
 def handler(event: Dict, context: Any) -> Dict:
+    try:
+        return _dispatch(event)
+    finally:
+        # Audit events are buffered by write_audit; by default this only prints them
+        # for the log subscription (see common/audit.py), so nothing waits on DynamoDB
+        flush_audit()
+
+def _dispatch(event: Dict) -> Dict:
     method, path = _route(event)
 
     if method == "OPTIONS":
@@ -123,6 +133,10 @@ def handler(event: Dict, context: Any) -> Dict:
         if method == "GET" and path == "/coach/teams":
             return handle_get_coach_teams(event)
 
+        if method == "POST" and path == "/coach/teams/token":
+            body = _json_body(event)
+            return handle_coach_team_token(event, body)
+
         if method == "POST" and path == "/coach/verify-access":
             body = _json_body(event)
             return handle_coach_verify_access(event, body)
@@ -141,12 +155,19 @@ def handler(event: Dict, context: Any) -> Dict:
         if method == "GET" and path == "/media/thumbnail":
             return handle_media_thumbnail(event)
 
+        if method == "GET" and path == "/media/stream":
+            return handle_media_stream(event)
+
         if method == "GET" and path == "/media":
             return handle_media_list(event)
 
         if method == "DELETE" and path == "/media":
             return handle_media_delete(event)
 
+        if method == "POST" and path == "/media/delete-batch":
+            body = _json_body(event)
+            return handle_media_delete_batch(event, body)
+
         if method == "POST" and path == "/media/upload-url":
             body = _json_body(event)
             return handle_media_presign_upload(event, body)
@@ -0,0 +1,89 @@
+"""
+Fast-start MP4 playback copies.
+
+Phones and cameras write the MP4/MOV index (the moov box) after the media
+data, because they only know it once recording stops. A browser given such a
+file has to fetch the end of it before it can play anything, which on a
+progressive download means waiting for most of the file. Remuxing with
+-c copy -movflags +faststart moves the index to the front without touching
+the encoded audio/video, so it costs about one read and one write of the file.
+
+Detection walks the top-level boxes with ranged reads (a few 16-byte
+headers), so files that are already fast-start cost almost nothing to check.
+"""
+import os
+import struct
+import subprocess
+
+FFMPEG_BIN = "/opt/bin/ffmpeg" if os.path.exists("/opt/bin/ffmpeg") else "ffmpeg"
+
+# ISO base media containers; others (WebM, AVI, ...) have no moov box
+ISO_BMFF_CONTENT_TYPES = ("video/mp4", "video/quicktime", "video/x-m4v", "video/3gpp")
+
+# Codecs every browser we support plays inside MP4
+REMUX_VIDEO_CODECS = ("h264",)
+
+MAX_TOP_LEVEL_BOXES = 32
+
+
+def top_level_boxes(read_range, size: int):
+    """
+    Yield (type, offset, size) for each top-level box. read_range(start, length)
+    returns up to length bytes from start - one ranged GET per box header.
+    """
+    offset = 0
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        if offset + 8 > size:
+            return
+        header = read_range(offset, 16)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        if box_size == 1:
+            if len(header) < 16:
+                return
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        elif box_size == 0:
+            box_size = size - offset  # box runs to the end of the file
+        if box_size < 8:
+            return
+        yield box_type.decode("latin-1"), offset, box_size
+        offset += box_size
+
+
+def moov_at_end(read_range, size: int) -> bool:
+    """True if media data comes before the index, i.e. playback has to wait for the tail."""
+    for box_type, _, _ in top_level_boxes(read_range, size):
+        if box_type == "moov":
+            return False
+        if box_type == "mdat":
+            return True
+    return False
+
+
+def needs_faststart(content_type: str, video_codec: str) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in ISO_BMFF_CONTENT_TYPES and video_codec in REMUX_VIDEO_CODECS
+
+
+def remux(source: str, out_path: str, timeout: int = 120, read_timeout: int = 15):
+    """
+    Copy source (URL or path) into a fast-start MP4 at out_path. ffmpeg reads
+    the source sequentially; +faststart rewrites the output in place, so it
+    needs a seekable file rather than a pipe.
+    """
+    subprocess.run(
+        [
+            FFMPEG_BIN, "-y", "-v", "error",
+            "-rw_timeout", str(read_timeout * 1_000_000),
+            "-i", source,
+            # First video and audio only: MOV timecode/data tracks don't fit in MP4
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            "-f", "mp4",
+            out_path,
+        ],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+    )
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        raise RuntimeError("ffmpeg produced no output")
@@ -0,0 +1,118 @@
+"""
+HLS adaptive-bitrate ladder for uploaded videos.
+
+One ffmpeg run decodes the source once, splits it into every rung of the
+ladder and writes H.264/AAC MPEG-TS segments plus a master playlist. Key
+frames are forced every HLS_SEGMENT_SECONDS so segment boundaries line up
+across rungs and players can switch bitrate at any segment.
+
+The lowest rung is listed first in the master playlist: players start on it,
+so the first segment is small enough to arrive quickly on mobile data, then
+step up once they've measured throughput.
+"""
+import os
+import json
+import subprocess
+
+from common.derivatives import HLS_MASTER, hls_variant_name
+
+FFMPEG_BIN = "/opt/bin/ffmpeg" if os.path.exists("/opt/bin/ffmpeg") else "ffmpeg"
+FFPROBE_BIN = "/opt/bin/ffprobe" if os.path.exists("/opt/bin/ffprobe") else "ffprobe"
+
+HLS_SEGMENT_SECONDS = 4
+
+# (short edge, video kbps, audio kbps)
+HLS_LADDER = [
+    (360, 800, 96),
+    (720, 2800, 128),
+    (1080, 5000, 160),
+]
+
+
+def ladder_for(width: int, height: int) -> list:
+    """Rungs no larger than the source's short edge; never upscale, but always at least one."""
+    short_edge = min(width or 0, height or 0)
+    if not short_edge:
+        return list(HLS_LADDER)
+    rungs = [r for r in HLS_LADDER if r[0] <= short_edge]
+    return rungs or HLS_LADDER[:1]
+
+
+def has_audio(source: str, timeout: int = 30) -> bool:
+    out = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "json", source],
+        check=True, capture_output=True, timeout=timeout,
+    )
+    return bool(json.loads(out.stdout or b"{}").get("streams"))
+
+
+def build_command(source: str, out_dir: str, rungs: list, audio: bool) -> list:
+    n = len(rungs)
+    # Scale the short edge to the rung so portrait clips get the same quality as landscape
+    filters = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    for i, (edge, _, _) in enumerate(rungs):
+        filters.append(
+            f"[s{i}]scale='if(gt(iw,ih),-2,{edge})':'if(gt(iw,ih),{edge},-2)'[v{i}]"
+        )
+    cmd = [
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-i", source,
+        "-filter_complex", ";".join(filters),
+    ]
+    stream_map = []
+    for i, (edge, video_kbps, audio_kbps) in enumerate(rungs):
+        cmd += [
+            "-map", f"[v{i}]",
+            f"-b:v:{i}", f"{video_kbps}k",
+            f"-maxrate:v:{i}", f"{int(video_kbps * 1.07)}k",
+            f"-bufsize:v:{i}", f"{video_kbps * 2}k",
+        ]
+        if audio:
+            cmd += ["-map", "0:a:0", f"-b:a:{i}", f"{audio_kbps}k"]
+            stream_map.append(f"v:{i},a:{i},name:{hls_variant_name(edge)}")
+        else:
+            stream_map.append(f"v:{i},name:{hls_variant_name(edge)}")
+    cmd += [
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})", "-sc_threshold", "0",
+    ]
+    if audio:
+        cmd += ["-c:a", "aac", "-ac", "2"]
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_type", "mpegts",
+        "-hls_segment_filename", os.path.join(out_dir, "%v_%03d.ts"),
+        "-master_pl_name", HLS_MASTER,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(out_dir, "%v.m3u8"),
+    ]
+    return cmd
+
+
+def transcode(source: str, out_dir: str, width: int, height: int, audio: bool = None, timeout: int = 840) -> dict:
+    """
+    Write the ladder for source (URL or path) into out_dir. Returns the
+    stream record for the media item: {"variants": [...], "segments": [...]}
+    (rung short edges and per-rung segment counts; see common.derivatives).
+    """
+    rungs = ladder_for(width, height)
+    if audio is None:
+        audio = has_audio(source)
+    subprocess.run(
+        build_command(source, out_dir, rungs, audio),
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+    )
+    if not os.path.exists(os.path.join(out_dir, HLS_MASTER)):
+        raise RuntimeError("ffmpeg produced no master playlist")
+    files = os.listdir(out_dir)
+    edges = [edge for edge, _, _ in rungs]
+    return {
+        "variants": edges,
+        "segments": [
+            sum(1 for f in files if f.startswith(f"{hls_variant_name(edge)}_") and f.endswith(".ts"))
+            for edge in edges
+        ],
+    }
@@ -0,0 +1,50 @@
+"""
+Hover-preview loops for videos in the grid.
+
+A few seconds of the clip, silent, at tile size and a low bitrate: enough to
+tell one video from the next for a couple of hundred KB instead of opening the
+original. H.264 in MP4 because it's the one format every browser (iOS
+included) will autoplay muted inline.
+"""
+import os
+import subprocess
+
+FFMPEG_BIN = "/opt/bin/ffmpeg" if os.path.exists("/opt/bin/ffmpeg") else "ffmpeg"
+
+HOVER_SECONDS = 3
+HOVER_MAX = 320
+HOVER_FPS = 15
+HOVER_KBPS = 300
+
+
+def start_time(duration_ms: int) -> float:
+    """Skip the first second (fumbling with the phone) when there's enough clip left."""
+    if duration_ms and duration_ms / 1000.0 >= HOVER_SECONDS + 1:
+        return 1.0
+    return 0.0
+
+
+def build_command(source: str, out_path: str, start: float, read_timeout: int = 15) -> list:
+    return [
+        FFMPEG_BIN, "-y", "-v", "error",
+        "-rw_timeout", str(read_timeout * 1_000_000),
+        "-ss", f"{start:.3f}", "-i", source,
+        "-t", str(HOVER_SECONDS),
+        "-map", "0:v:0", "-an", "-sn", "-dn",
+        "-vf", f"fps={HOVER_FPS},scale='if(gt(iw,ih),{HOVER_MAX},-2)':'if(gt(iw,ih),-2,{HOVER_MAX})'",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-b:v", f"{HOVER_KBPS}k", "-maxrate", f"{HOVER_KBPS * 3 // 2}k", "-bufsize", f"{HOVER_KBPS * 2}k",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        out_path,
+    ]
+
+
+def make_clip(source: str, out_path: str, duration_ms: int = None, read_timeout: int = 15, timeout: int = 60):
+    """Write the hover loop for source (URL or path) to out_path."""
+    subprocess.run(
+        build_command(source, out_path, start_time(duration_ms), read_timeout),
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+    )
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        raise RuntimeError("ffmpeg produced no hover clip")
@@ -0,0 +1,78 @@
+"""
+In-memory stand-in for the thumbnail SQS queue and its dead-letter queue.
+
+Builds the same event shape Lambda's SQS event source delivers (S3
+notifications wrapped in message bodies) and applies the handler's
+batchItemFailures response the way the event source mapping does: successes
+are deleted, failures become visible again, and a message received more than
+max_receive_count times moves to the dead-letter list. Used by tests and for
+driving the pipeline locally without AWS.
+"""
+import json
+import uuid
+from collections import deque
+
+
+def s3_event(bucket: str, key: str) -> dict:
+    """Minimal S3 ObjectCreated notification for one object."""
+    return {
+        "Records": [{
+            "eventSource": "aws:s3",
+            "eventName": "ObjectCreated:Put",
+            "s3": {"bucket": {"name": bucket}, "object": {"key": key}},
+        }]
+    }
+
+
+class LocalQueue:
+    def __init__(self, max_receive_count: int = 3):
+        self.max_receive_count = max_receive_count
+        self.messages = deque()
+        self.dead_letters = []
+
+    def send(self, body: str) -> str:
+        message_id = str(uuid.uuid4())
+        self.messages.append({"messageId": message_id, "body": body, "receive_count": 0})
+        return message_id
+
+    def send_s3_event(self, bucket: str, key: str) -> str:
+        return self.send(json.dumps(s3_event(bucket, key)))
+
+    def receive(self, batch_size: int = 10) -> dict:
+        """Take up to batch_size messages and wrap them as an SQS Lambda event."""
+        records = []
+        while self.messages and len(records) < batch_size:
+            msg = self.messages.popleft()
+            msg["receive_count"] += 1
+            records.append(msg)
+        return {
+            "Records": [
+                {
+                    "messageId": m["messageId"],
+                    "receiptHandle": m["messageId"],
+                    "body": m["body"],
+                    "attributes": {"ApproximateReceiveCount": str(m["receive_count"])},
+                    "eventSource": "aws:sqs",
+                    "_message": m,
+                }
+                for m in records
+            ]
+        }
+
+    def drain(self, handler, batch_size: int = 10, max_batches: int = 100) -> int:
+        """Invoke handler until the queue is empty; returns the number of batches."""
+        batches = 0
+        while self.messages and batches < max_batches:
+            event = self.receive(batch_size)
+            resp = handler(event, None) or {}
+            failed = {f["itemIdentifier"] for f in resp.get("batchItemFailures", [])}
+            for rec in event["Records"]:
+                if rec["messageId"] not in failed:
+                    continue
+                msg = rec["_message"]
+                if msg["receive_count"] >= self.max_receive_count:
+                    self.dead_letters.append(msg)
+                else:
+                    self.messages.append(msg)
+            batches += 1
+        return batches
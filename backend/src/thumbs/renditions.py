@@ -0,0 +1,342 @@
+"""
+Single-decode rendition engine for uploaded images.
+
+The original is decoded once, as close to the largest target size as the codec
+allows (JPEG DCT scaling via Image.draft), then:
+  1. downscaled to the largest rendition
+  2. EXIF orientation applied - on the small bitmap, not the full-resolution one
+  3. converted to RGB once (alpha flattened onto white)
+  4. each smaller rendition derived from the previous one, largest first
+
+render_ladder() does the same for a longest-edge ladder in several formats
+(JPEG, WebP and - where the Pillow build has libavif - AVIF).
+
+Before anything is decoded, decode_plan() works out from the header how big
+the decoded bitmap will be at that scale and refuses (ImageTooLarge) if it's
+over the memory budget. Sources may be bytes or a file path, so large
+originals can be decoded straight from a spooled copy on disk.
+
+For the small slots, render_ladder() can skip the decode of the original
+altogether: phones and cameras embed a reduced copy (HEIF thumbnail items,
+MPF large thumbnails, EXIF IFD1 JPEGs) that embedded_preview() finds from
+the headers.
+
+Used by the thumbnail Lambda and by the backfill tooling so every path produces
+identical derivatives.
+"""
+import io
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from PIL import ExifTags, Image
+
+# Register HEIC/HEIF support if pillow-heif is available in the layer
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pass
+
+# Pillow's bomb check counts declared pixels, so it would refuse a 200 MP
+# JPEG panorama that DCT scaling decodes in a few MB. decode_plan() checks
+# the bytes that will actually be decoded against a budget instead.
+Image.MAX_IMAGE_PIXELS = None
+
+DEFAULT_DECODE_BUDGET_BYTES = 512 * 1024 * 1024
+
+# Bytes per pixel of Pillow's in-memory bitmap (RGB is stored padded to 4)
+_PIXEL_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2, "I;16N": 2}
+
+# Bytes (in memory) or a path to the original
+Source = Union[bytes, str]
+
+
+class ImageTooLarge(ValueError):
+    """Decoding would exceed the memory budget even at the smallest scale the codec offers."""
+
+
+# EXIF orientation tag → transpose that brings the image upright
+ORIENTATION_TAG = 274
+EXIF_IFD = 0x8769
+JPEG_IF_OFFSET_TAG = 0x0201
+JPEG_IF_LENGTH_TAG = 0x0202
+DATETIME_ORIGINAL_TAG = 36867
+OFFSET_TIME_ORIGINAL_TAG = 36881
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# (name, max edge in px, JPEG quality)
+Rendition = Tuple[str, int, int]
+
+# format → (Pillow format name, save options)
+ENCODERS = {
+    "jpeg": ("JPEG", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 76, "method": 4}),
+    "avif": ("AVIF", {"quality": 58, "speed": 8}),
+}
+
+# Older Pillow builds get AVIF from the pillow-avif-plugin package
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+
+def _exif(im: Image.Image) -> Image.Exif:
+    """EXIF without decoding pixels (PNG getexif() loads the image to look for a trailing eXIf chunk)."""
+    if im.format == "PNG" and "exif" not in im.info:
+        return Image.Exif()
+    return im.getexif()
+
+
+def _orientation(im: Image.Image) -> int:
+    try:
+        return int(_exif(im).get(ORIENTATION_TAG) or 1)
+    except Exception:
+        return 1
+
+
+def _captured_at(exif) -> Optional[int]:
+    """EXIF DateTimeOriginal as epoch seconds (UTC unless OffsetTimeOriginal says otherwise)."""
+    try:
+        ifd = exif.get_ifd(EXIF_IFD)
+        raw = str(ifd.get(DATETIME_ORIGINAL_TAG) or "").strip("\x00 ")
+        if not raw:
+            return None
+        taken = datetime.strptime(raw[:19], "%Y:%m:%d %H:%M:%S")
+        offset = str(ifd.get(OFFSET_TIME_ORIGINAL_TAG) or "").strip("\x00 ")
+        if offset:
+            taken = datetime.strptime(f"{raw[:19]} {offset.replace(':', '')}", "%Y:%m:%d %H:%M:%S %z")
+        else:
+            taken = taken.replace(tzinfo=timezone.utc)
+        return int(taken.timestamp())
+    except Exception:
+        return None
+
+
+def _open(source: Source) -> Image.Image:
+    """Lazy open: reads the header, no pixels."""
+    return Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def decode_plan(im: Image.Image, largest: int, budget_bytes: int = DEFAULT_DECODE_BUDGET_BYTES) -> Dict:
+    """
+    Pick the decode scale for an opened (not yet loaded) image and check the
+    decoded bitmap fits the budget. JPEGs decode at 1/2, 1/4 or 1/8 scale when
+    that still covers `largest`; other formats decode at full size.
+    Raises ImageTooLarge; otherwise returns the plan (sizes, bytes, scale).
+    """
+    width, height = im.size
+    # The bounding box is square, so rotation doesn't change which scale is safe
+    im.draft(None, (largest, largest))
+    decoded_width, decoded_height = im.size
+    decoded_bytes = decoded_width * decoded_height * _PIXEL_BYTES.get(im.mode, 4)
+    if decoded_bytes > budget_bytes:
+        raise ImageTooLarge(
+            f"{width}x{height} {im.format} needs {decoded_bytes // (1024 * 1024)} MB to decode "
+            f"(budget {budget_bytes // (1024 * 1024)} MB)"
+        )
+    return {
+        "width": width,
+        "height": height,
+        "decoded_width": decoded_width,
+        "decoded_height": decoded_height,
+        "decoded_bytes": decoded_bytes,
+        "scale": round(width / decoded_width) if decoded_width else 1,
+    }
+
+
+def _same_aspect(a: Tuple[int, int], b: Tuple[int, int]) -> bool:
+    # Embedded thumbnails are sometimes letterboxed to 4:3 or 16:9
+    return abs(a[0] * b[1] - a[1] * b[0]) <= 0.02 * a[0] * b[1]
+
+
+def _embedded_candidates(source: Source, im: Image.Image):
+    """(kind, unloaded image) for every reduced copy the file declares."""
+    if im.format == "HEIF":
+        # pillow-heif's draft() switches the decode to the smallest thumbnail
+        # that covers the requested size (on both axes)
+        width, height = im.size
+        for box in sorted((b for b in im.info.get("thumbnails") or [] if b), reverse=True):
+            thumb = _open(source)
+            if thumb.draft(None, (box * width // max(im.size), box * height // max(im.size))) is not None:
+                yield "heif", thumb
+    for index, entry in enumerate((getattr(im, "mpinfo", None) or {}).get(0xB002) or []):
+        if index and str(entry.get("Attribute", {}).get("MPType", "")).startswith("Large Thumbnail"):
+            thumb = _open(source)
+            thumb.seek(index)
+            yield "mpf", thumb
+    raw = im.info.get("exif") or b""
+    if raw:
+        ifd1 = _exif(im).get_ifd(ExifTags.IFD.IFD1)
+        offset, length = ifd1.get(JPEG_IF_OFFSET_TAG), ifd1.get(JPEG_IF_LENGTH_TAG)
+        if offset and length:
+            tiff = raw[6:] if raw.startswith(b"Exif\x00\x00") else raw
+            yield "exif", Image.open(io.BytesIO(tiff[offset:offset + length]))
+
+
+def embedded_preview(source: Source, im: Image.Image, min_edge: int) -> Optional[Tuple[str, Image.Image]]:
+    """
+    The largest reduced copy embedded in the file whose long edge is at least
+    min_edge (and smaller than the original, with the same aspect ratio), as
+    (kind, unloaded image); None if there isn't one. Headers only.
+    """
+    best = None
+    try:
+        for kind, thumb in _embedded_candidates(source, im):
+            edge = max(thumb.size)
+            if min_edge <= edge < max(im.size) and _same_aspect(thumb.size, im.size):
+                if best is None or edge > max(best[1].size):
+                    best = (kind, thumb)
+    except Exception:
+        # A malformed thumbnail just means the normal decode
+        return best
+    return best
+
+
+def image_metadata(source: Source) -> Dict:
+    """
+    Display dimensions (after EXIF orientation), orientation and capture time.
+    Reads headers only - no pixel decode.
+    """
+    im = _open(source)
+    orientation = _orientation(im)
+    width, height = im.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    meta = {"width": width, "height": height, "orientation": orientation}
+    captured_at = _captured_at(_exif(im))
+    if captured_at:
+        meta["captured_at"] = captured_at
+    return meta
+
+
+def _to_rgb(im: Image.Image) -> Image.Image:
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        rgba = im.convert("RGBA")
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.split()[-1])
+        return bg
+    if im.mode != "RGB":
+        return im.convert("RGB")
+    return im
+
+
+def _encode_jpeg(im: Image.Image, quality: int) -> bytes:
+    out = io.BytesIO()
+    im.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def supported_formats(requested: Iterable[str]) -> List[str]:
+    """Requested formats this Pillow build can encode, in request order."""
+    Image.init()
+    return [f for f in requested if f in ENCODERS and ENCODERS[f][0] in Image.SAVE]
+
+
+def _decode(
+    im: Image.Image,
+    largest: int,
+    budget_bytes: int = DEFAULT_DECODE_BUDGET_BYTES,
+    orientation: Optional[int] = None,
+) -> Tuple[Image.Image, Dict]:
+    """Decode near `largest` within the budget, downscale to it, then orient and convert to RGB."""
+    if orientation is None:
+        orientation = _orientation(im)
+
+    # Let the decoder skip detail we'd throw away (JPEG: 1/2, 1/4, 1/8 DCT scaling)
+    plan = decode_plan(im, largest, budget_bytes)
+    # thumbnail() box-reduces (Image.reduce) most of the way before resampling
+    im.thumbnail((largest, largest))
+
+    transpose = _TRANSPOSE.get(orientation)
+    if transpose is not None:
+        im = im.transpose(transpose)
+    return _to_rgb(im), plan
+
+
+def render_image(source: Source, renditions: Iterable[Rendition], budget_bytes: int = DEFAULT_DECODE_BUDGET_BYTES) -> Dict[str, bytes]:
+    """
+    Produce JPEG renditions of an image from a single decode.
+    Returns {name: jpeg_bytes}. Images are never upscaled.
+    """
+    ladder = sorted(renditions, key=lambda r: r[1], reverse=True)
+    if not ladder:
+        return {}
+    im, _ = _decode(_open(source), ladder[0][1], budget_bytes)
+
+    results = {}
+    for name, max_size, quality in ladder:
+        if max(im.size) > max_size:
+            im.thumbnail((max_size, max_size))
+        results[name] = _encode_jpeg(im, quality)
+    return results
+
+
+def ladder_slots(sizes: Iterable[int], edge: int) -> List[int]:
+    """The slots an original with this longest edge gets: never upscaled, one full-size slot at most."""
+    sizes = sorted(set(int(s) for s in sizes))
+    covering = [s for s in sizes if s >= edge]
+    return [s for s in sizes if s < edge] + covering[:1]
+
+
+def render_ladder(
+    source: Source,
+    sizes: Iterable[int],
+    formats: Iterable[str],
+    budget_bytes: int = DEFAULT_DECODE_BUDGET_BYTES,
+    plan: Optional[Dict] = None,
+    embedded_min_edge: int = 0,
+) -> List[Dict]:
+    """
+    Produce a longest-edge rendition ladder in every format from a single decode.
+
+    Slots above the original's longest edge collapse into one full-resolution
+    slot (the smallest slot that covers it), so nothing is upscaled or duplicated.
+    Returns [{size, width, height, format, body}], largest slot first. If plan
+    is given it's filled in with the decode_plan() used.
+
+    With embedded_min_edge set, an embedded preview at least that big is used
+    instead of the original, for just the slots it covers (plan["embedded"]
+    names its kind); the caller renders the rest with a full decode later.
+    """
+    formats = supported_formats(formats)
+    sizes = sorted(set(int(s) for s in sizes))
+    if not sizes or not formats:
+        return []
+
+    im = _open(source)
+    slots = ladder_slots(sizes, max(im.size))
+
+    embedded = embedded_preview(source, im, embedded_min_edge) if embedded_min_edge else None
+    if embedded is not None:
+        kind, thumb = embedded
+        covered = [s for s in slots if s <= max(thumb.size)]
+        if covered:
+            slots = covered
+            # The embedded copy carries no orientation of its own
+            im, used = _decode(thumb, max(slots), budget_bytes, orientation=_orientation(im))
+            used["embedded"] = kind
+        else:
+            embedded = None
+    if embedded is None:
+        im, used = _decode(im, max(slots), budget_bytes)
+    if plan is not None:
+        plan.update(used)
+    results = []
+    for size in sorted(slots, reverse=True):
+        if max(im.size) > size:
+            im.thumbnail((size, size))
+        for fmt in formats:
+            pil_format, options = ENCODERS[fmt]
+            out = io.BytesIO()
+            im.save(out, format=pil_format, **options)
+            results.append({"size": size, "width": im.width, "height": im.height, "format": fmt, "body": out.getvalue()})
+    return results
@@ -1,31 +1,51 @@
-import io
 import os
 import re
+import json
 import time
 import subprocess
 import tempfile
 import boto3
 import logging
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 from urllib.parse import unquote_plus
-from PIL import Image
 
-# Register HEIC/HEIF support if pillow-heif is available in the layer
+from boto3.dynamodb.types import TypeSerializer
+
+from common.derivatives import (
+    RENDITION_SIZES, RENDITION_FORMATS, FORMAT_CONTENT_TYPE, THUMB_TARGET, PREVIEW_TARGET, HLS_MASTER,
+    PIPELINE_VERSION, rendition_key, pick_size, stream_prefix, playback_key, hover_key,
+    normalize_etag, derivatives_current,
+)
+from common.db import capture_sort_key, MEDIA_SK_METADATA
+from common.metrics import put_metric
+from thumbs.renditions import render_image, render_ladder, ladder_slots, supported_formats, image_metadata, ImageTooLarge
+from thumbs.workers import PipePool, default_processes
+from thumbs import hls, faststart, hover
+
+# BlurHash needs NumPy; without it in the layer we just skip placeholders
+try:
+    from thumbs.blurhash import encode_image as blurhash_encode
+except ImportError:
+    blurhash_encode = None
+
+# Poster scoring needs NumPy too; without it videos get a fixed-seek frame
 try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
+    from thumbs.poster import pick_poster
 except ImportError:
-    pass
+    pick_poster = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 DDB_TABLE = os.environ["TABLE_MEDIA"]
 BUCKET = os.environ["MEDIA_BUCKET"]
-GSI_NAME = os.environ.get("MEDIA_GSI_NAME", "gsi1")
 
 s3 = boto3.client("s3")
 ddb = boto3.client("dynamodb")
+sqs = boto3.client("sqs")
 
 # media/{team_id}/{media_id}/{filename}
 KEY_RE = re.compile(r"^media/([^/]+)/([^/]+)/(.+)$")
@@ -35,10 +55,79 @@ JPEG_QUALITY = 78
 
 # ffmpeg binary: provided by Lambda layer at /opt/bin/ffmpeg, fallback to PATH for local dev
 FFMPEG_BIN = "/opt/bin/ffmpeg" if os.path.exists("/opt/bin/ffmpeg") else "ffmpeg"
+FFPROBE_BIN = "/opt/bin/ffprobe" if os.path.exists("/opt/bin/ffprobe") else "ffprobe"
+
+# ffmpeg reads videos straight from S3 via a short-lived presigned URL
+VIDEO_URL_TTL_SECONDS = 300
+VIDEO_READ_TIMEOUT_SECONDS = 15
+
+# Posters are encoded by Pillow from the chosen frame (about ffmpeg's -q:v 3)
+JPEG_QUALITY_POSTER = 85
 
 PREVIEW_MAX = 1600
 JPEG_QUALITY_PREVIEW = 82
 
+# Responsive ladder for images; JPEG is always produced so thumb_key/preview_key
+# keep working for clients that don't read the renditions map
+IMAGE_FORMATS = supported_formats(RENDITION_FORMATS + ([] if "jpeg" in RENDITION_FORMATS else ["jpeg"]))
+
+_serializer = TypeSerializer()
+
+# Priority lanes, highest first. thumb: grid-sized image renditions (every
+# upload enters here); preview: the larger renditions; video: posters/metadata;
+# transcode: the HLS ladder (its own, longer-running function).
+LANE_THUMB, LANE_PREVIEW, LANE_VIDEO, LANE_TRANSCODE = "thumb", "preview", "video", "transcode"
+LANES = (LANE_THUMB, LANE_PREVIEW, LANE_VIDEO, LANE_TRANSCODE)
+LANE_QUEUE_URLS = {
+    LANE_PREVIEW: os.environ.get("PREVIEW_QUEUE_URL"),
+    LANE_VIDEO: os.environ.get("VIDEO_QUEUE_URL"),
+    LANE_TRANSCODE: os.environ.get("TRANSCODE_QUEUE_URL"),
+}
+
+def _lane_concurrency(spec: str) -> dict:
+    """"thumb=8,preview=3,video=2" -> objects processed concurrently per batch, per lane."""
+    budget = {LANE_THUMB: 8, LANE_PREVIEW: 3, LANE_VIDEO: 2, LANE_TRANSCODE: 1}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        lane, _, n = part.partition("=")
+        if lane in budget and n.isdigit():
+            budget[lane] = max(1, int(n))
+    return budget
+
+LANE_CONCURRENCY = _lane_concurrency(os.environ.get("THUMB_LANE_CONCURRENCY", ""))
+
+# HLS transcodes read the whole original, so their URL outlives the ffmpeg run
+TRANSCODE_URL_TTL_SECONDS = 3600
+TRANSCODE_TIMEOUT_SECONDS = int(os.environ.get("TRANSCODE_TIMEOUT_SECONDS", "780"))
+
+# Fast-start remuxes spool through /tmp (+faststart rewrites the file in place);
+# bigger originals wait for the HLS ladder instead
+REMUX_MAX_BYTES = int(os.environ.get("THUMB_REMUX_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+REMUX_TIMEOUT_SECONDS = 120
+
+HLS_CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
+# Images above this go straight to the preview lane instead of holding a thumb slot
+LARGE_IMAGE_BYTES = int(os.environ.get("THUMB_LARGE_IMAGE_BYTES", str(40 * 1024 * 1024)))
+
+# Originals up to this size are fetched into memory; bigger ones are streamed
+# to /tmp and the worker decodes them from disk
+SPOOL_MEMORY_BYTES = int(os.environ.get("THUMB_SPOOL_MEMORY_BYTES", str(16 * 1024 * 1024)))
+# Largest decoded bitmap a worker may hold (see renditions.decode_plan)
+DECODE_BUDGET_BYTES = int(os.environ.get("THUMB_DECODE_BUDGET_MB", "512")) * 1024 * 1024
+
+# The thumb lane renders grid slots from a preview embedded in the file (HEIC
+# thumbnail, EXIF/MPF JPEG) when it's at least this big, skipping the full
+# decode; slots it can't cover wait for the preview lane. 0 turns it off.
+EMBEDDED_PREVIEW_MIN_EDGE = int(os.environ.get("THUMB_EMBEDDED_MIN_EDGE", "256"))
+
+# The ladder split between the thumb and preview lanes
+THUMB_SIZES = [s for s in RENDITION_SIZES if s <= THUMB_TARGET] or RENDITION_SIZES[:1]
+PREVIEW_SIZES = [s for s in RENDITION_SIZES if s not in THUMB_SIZES]
+
+# Worker processes for the CPU-bound image step. One process means render inline.
+RENDER_PROCESSES = int(os.environ.get("THUMB_RENDER_PROCESSES", "0")) or default_processes()
+_render_pool = None
+
 def _parse_key(key: str):
     m = KEY_RE.match(key)
     if not m:
@@ -51,215 +140,715 @@ def _is_image(content_type: str) -> bool:
 def _is_video(content_type: str) -> bool:
     return content_type.startswith("video/")
 
-def _make_video_thumb(video_bytes: bytes) -> bytes:
-    """Extract a frame from a video using ffmpeg and return it as a JPEG thumbnail."""
+def _make_video_thumb(source: str, duration_ms: int = None) -> bytes:
+    """
+    Poster frame for a video as a JPEG thumbnail.
+
+    source is a URL (presigned S3 GET) or local path. ffmpeg reads it with HTTP
+    range requests, fetching the container index and the bytes around each seek
+    point rather than the whole file - memory and /tmp use stay at one JPEG
+    regardless of video size, including MOVs with the moov atom at the end.
+
+    With the duration known, the best of a few key frames is picked (see
+    thumbs.poster); otherwise, or if that fails, a single frame is grabbed.
+    """
+    if duration_ms and pick_poster is not None:
+        started = time.time()
+        try:
+            poster = pick_poster(FFMPEG_BIN, source, duration_ms, MAX_SIZE, JPEG_QUALITY_POSTER, VIDEO_READ_TIMEOUT_SECONDS)
+            put_metric("PosterSelectionTime", round((time.time() - started) * 1000))
+            return poster
+        except Exception as e:
+            logger.warning(f"Poster selection failed, using a fixed frame: {str(e)}")
+    return _seek_thumb(source, duration_ms)
+
+def _seek_thumb(source: str, duration_ms: int = None) -> bytes:
+    """A single frame near the start of the video."""
+    # Seek to 1s in; clips shorter than that (or where the seek finds
+    # nothing) use the first frame
+    seeks = ("00:00:01", "00:00:00") if not duration_ms or duration_ms > 1000 else ("00:00:00",)
     with tempfile.TemporaryDirectory() as tmp:
-        in_path = os.path.join(tmp, "input.mp4")
         out_path = os.path.join(tmp, "thumb.jpg")
 
-        with open(in_path, "wb") as f:
-            f.write(video_bytes)
-
-        # Seek to 1s in, grab 1 frame, scale to fit within MAX_SIZE
-        subprocess.run(
-            [
+        # grab 1 frame, scale to fit within MAX_SIZE. A failed seek (ffmpeg exits
+        # nonzero or writes nothing) falls through to the next one; raise only
+        # when none of them produced a frame.
+        for seek in seeks:
+            cmd = [
                 FFMPEG_BIN,
                 "-y",
-                "-ss", "00:00:01",
-                "-i", in_path,
+                "-rw_timeout", str(VIDEO_READ_TIMEOUT_SECONDS * 1_000_000),
+                "-ss", seek,
+                "-i", source,
                 "-vframes", "1",
                 "-vf", f"scale='if(gt(iw,ih),{MAX_SIZE},-2)':'if(gt(iw,ih),-2,{MAX_SIZE})'",
                 "-q:v", "3",
                 out_path,
-            ],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            timeout=60,
-        )
-
-        with open(out_path, "rb") as f:
-            return f.read()
+            ]
+            result = subprocess.run(
+                cmd,
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=60,
+            )
+            if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+                with open(out_path, "rb") as f:
+                    return f.read()
+            logger.info(f"No frame at {seek} (ffmpeg exit {result.returncode})")
 
-def _make_thumb(image_bytes: bytes) -> bytes:
-    im = Image.open(io.BytesIO(image_bytes))
+        raise subprocess.CalledProcessError(result.returncode or 1, cmd)
 
-    # Best-effort orientation fix (some images)
+def _parse_iso_time(value: str):
     try:
-        exif = im.getexif()
-        orientation = exif.get(274)
-        if orientation == 3:
-            im = im.rotate(180, expand=True)
-        elif orientation == 6:
-            im = im.rotate(270, expand=True)
-        elif orientation == 8:
-            im = im.rotate(90, expand=True)
-    except Exception:
-        pass
-
-    im.thumbnail((MAX_SIZE, MAX_SIZE))
-
-    # Convert to RGB for JPEG
-    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
-        bg = Image.new("RGB", im.size, (255, 255, 255))
-        bg.paste(im.convert("RGBA"), mask=im.convert("RGBA").split()[-1])
-        im = bg
-    elif im.mode != "RGB":
-        im = im.convert("RGB")
-
-    out = io.BytesIO()
-    im.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
-    return out.getvalue()
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+def _probe_video(source: str) -> dict:
+    """
+    Duration, codec, display resolution and capture time via ffprobe.
+    Like _make_video_thumb this only range-reads the container index.
+    """
+    out = subprocess.run(
+        [
+            FFPROBE_BIN,
+            "-v", "error",
+            "-rw_timeout", str(VIDEO_READ_TIMEOUT_SECONDS * 1_000_000),
+            "-select_streams", "v:0",
+            "-show_entries", "format=duration:format_tags=creation_time:stream=codec_name,width,height:stream_tags=rotate:stream_side_data=rotation",
+            "-of", "json",
+            source,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=30,
+    )
+    info = json.loads(out.stdout or b"{}")
+    fmt = info.get("format") or {}
+    stream = (info.get("streams") or [{}])[0]
+
+    meta = {}
+    if fmt.get("duration"):
+        meta["duration_ms"] = int(float(fmt["duration"]) * 1000)
+    if stream.get("codec_name"):
+        meta["video_codec"] = stream["codec_name"]
+    if stream.get("width") and stream.get("height"):
+        rotation = stream.get("tags", {}).get("rotate")
+        for side_data in stream.get("side_data_list") or []:
+            rotation = side_data.get("rotation", rotation)
+        width, height = int(stream["width"]), int(stream["height"])
+        if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+            width, height = height, width
+        meta["width"], meta["height"] = width, height
+    captured_at = _parse_iso_time((fmt.get("tags") or {}).get("creation_time"))
+    if captured_at:
+        meta["captured_at"] = captured_at
+    return meta
+
+def _make_thumb(image_bytes: bytes) -> bytes:
+    return render_image(image_bytes, [("thumb", MAX_SIZE, JPEG_QUALITY)])["thumb"]
 
 def _make_preview(image_bytes: bytes) -> bytes:
     """Generate a larger preview image (1600px max) for modal viewing"""
-    im = Image.open(io.BytesIO(image_bytes))
+    return render_image(image_bytes, [("preview", PREVIEW_MAX, JPEG_QUALITY_PREVIEW)])["preview"]
+
+def _put_objects(bucket: str, objects: dict):
+    """Upload {key: (body, content_type)} concurrently."""
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(objects)))) as pool:
+        futures = [
+            pool.submit(
+                s3.put_object,
+                Bucket=bucket, Key=key, Body=body,
+                ContentType=content_type, CacheControl="private, max-age=86400",
+            )
+            for key, (body, content_type) in objects.items()
+        ]
+        for f in futures:
+            f.result()
+
+def _rendition_map(renditions: list) -> dict:
+    """Compact per-item record of what render_ladder produced (see common.derivatives)."""
+    by_size = {}
+    for r in renditions:
+        by_size.setdefault(r["size"], (r["width"], r["height"]))
+    sizes = sorted(by_size)
+    formats = list(dict.fromkeys(r["format"] for r in renditions))
+    return {
+        "sizes": sizes,
+        "widths": [by_size[s][0] for s in sizes],
+        "heights": [by_size[s][1] for s in sizes],
+        "formats": formats,
+    }
+
+def _placeholder(jpeg_bytes: bytes):
+    """BlurHash of a small rendition; a missing placeholder never fails ingest."""
+    if blurhash_encode is None:
+        return None
+    try:
+        return blurhash_encode(jpeg_bytes)
+    except Exception as e:
+        logger.warning(f"BlurHash failed: {e}")
+        return None
 
-    # Best-effort orientation fix
+def _update_media(team_id: str, sk: str, fields: dict):
+    """
+    SET every non-empty field on the media item. This is an upsert: if
+    /media/complete hasn't written the record yet, it merges into this one.
+    Conditional on the item not having been derived by a newer pipeline
+    version, so an old container finishing late can't overwrite its keys.
+    """
+    fields = {k: v for k, v in fields.items() if v is not None}
+    if not fields:
+        return
+    names = {f"#f{i}": k for i, k in enumerate(fields)}
+    values = {f":v{i}": _serializer.serialize(v) for i, v in enumerate(fields.values())}
+    try:
+        ddb.update_item(
+            TableName=DDB_TABLE,
+            Key={"team_id": {"S": team_id}, "sk": {"S": sk}},
+            UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+            ConditionExpression="attribute_not_exists(#dv) OR #dv <= :pv",
+            ExpressionAttributeNames={**names, "#dv": "derived_version"},
+            ExpressionAttributeValues={**values, ":pv": {"N": str(PIPELINE_VERSION)}},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        logger.info(f"{team_id}/{sk} already derived by a newer pipeline; not updating")
+
+def _derived_marker(job: dict) -> dict:
+    """Fields recording that the job's original is fully derived (see common.derivatives)."""
+    if not job.get("etag"):
+        return {}
+    return {"derived_etag": job["etag"], "derived_version": PIPELINE_VERSION}
+
+def _already_derived(job: dict) -> bool:
+    """
+    True if the item's derivatives already exist for this ETag and pipeline
+    version - a duplicate notification or a re-run - so the lane can skip
+    the download and decode. One consistent read of two attributes. Forced
+    jobs (derivatives known to be missing from the bucket) never skip.
+    """
+    if job.get("force") or not job.get("etag") or not job.get("sk"):
+        return False
+    item = ddb.get_item(
+        TableName=DDB_TABLE,
+        Key={"team_id": {"S": job["team_id"]}, "sk": {"S": job["sk"]}},
+        ProjectionExpression="derived_etag, derived_version",
+        ConsistentRead=True,
+    ).get("Item") or {}
+    current = derivatives_current({
+        "derived_etag": item.get("derived_etag", {}).get("S"),
+        "derived_version": item.get("derived_version", {}).get("N"),
+    }, job["etag"], PIPELINE_VERSION)
+    if current:
+        logger.info(f"{job['key']} already derived (etag {job['etag']}, v{PIPELINE_VERSION}); skipping")
+        put_metric("DerivativesSkipped", 1, unit="Count", dimensions={"Lane": job["lane"]}, media_id=job["media_id"])
+    return current
+
+def _capture_fields(media_id: str, meta: dict) -> dict:
+    """Metadata fields plus the capture-index sort key when we know the capture time."""
+    fields = dict(meta)
+    if meta.get("captured_at"):
+        fields["capture_sk"] = capture_sort_key(meta["captured_at"], media_id)
+    return fields
+
+def _render_image_job(source, sizes: list, formats: list, placeholder: bool = True, embedded_min_edge: int = 0):
+    """
+    CPU-bound image work; runs in a worker process (see thumbs.workers).
+    source is the original's bytes or a path to it. Returns (meta, renditions,
+    blurhash, decode plan); an image over the decode budget comes back with no
+    renditions and plan["rejected"] set.
+    """
+    meta = image_metadata(source)
+    plan = {}
+    try:
+        renditions = render_ladder(source, sizes, formats, DECODE_BUDGET_BYTES, plan, embedded_min_edge)
+    except ImageTooLarge as e:
+        return meta, [], None, {"rejected": str(e)}
+    if not renditions or not placeholder:
+        return meta, renditions, None, plan
+    smallest_jpeg = min((r for r in renditions if r["format"] == "jpeg"), key=lambda r: r["size"])
+    return meta, renditions, _placeholder(smallest_jpeg["body"]), plan
+
+def _get_render_pool():
+    """Per-container worker processes, created on first use and reused while warm."""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = PipePool(RENDER_PROCESSES)
+    return _render_pool
+
+def _head(bucket: str, key: str):
+    """head_object, or None if the object is gone (deleted before we got to it)."""
     try:
-        exif = im.getexif()
-        orientation = exif.get(274)
-        if orientation == 3:
-            im = im.rotate(180, expand=True)
-        elif orientation == 6:
-            im = im.rotate(270, expand=True)
-        elif orientation == 8:
-            im = im.rotate(90, expand=True)
-    except Exception:
-        pass
-
-    im.thumbnail((PREVIEW_MAX, PREVIEW_MAX))
-
-    # Convert to RGB for JPEG
-    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
-        bg = Image.new("RGB", im.size, (255, 255, 255))
-        bg.paste(im.convert("RGBA"), mask=im.convert("RGBA").split()[-1])
-        im = bg
-    elif im.mode != "RGB":
-        im = im.convert("RGB")
-
-    out = io.BytesIO()
-    im.save(out, format="JPEG", quality=JPEG_QUALITY_PREVIEW, optimize=True)
-    return out.getvalue()
-
-def _query_item_by_media_id(media_id: str):
+        return s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+
+def _get_bytes(bucket: str, key: str):
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return None
+        raise
+
+@contextmanager
+def _original(bucket: str, key: str, size: int):
+    """
+    The original for a worker to decode: its bytes when small, otherwise the
+    path of a copy streamed to /tmp (removed on exit). None if it's gone.
+    """
+    if size <= SPOOL_MEMORY_BYTES:
+        yield _get_bytes(bucket, key)
+        return
+    with tempfile.NamedTemporaryFile(prefix="original-") as f:
+        try:
+            s3.download_fileobj(bucket, key, f)
+            f.flush()
+            found = True
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+            found = False
+        yield f.name if found else None
+
+def _decode_ok(job: dict, plan: dict) -> bool:
+    """Decode metrics; False if the image was refused (retrying won't help)."""
+    if plan.get("rejected"):
+        logger.warning(f"Not rendering {job['key']}: {plan['rejected']}")
+        put_metric("ImageDecodeRejected", 1, unit="Count", media_id=job["media_id"], reason=plan["rejected"])
+        return False
+    if plan.get("embedded"):
+        put_metric("ThumbFromEmbeddedPreview", 1, unit="Count", dimensions={"Kind": plan["embedded"]}, media_id=job["media_id"])
+    elif plan.get("scale", 1) > 1:
+        put_metric(
+            "ImageDownscaledOnDecode", 1, unit="Count", media_id=job["media_id"],
+            scale=plan["scale"], width=plan["width"], height=plan["height"],
+        )
+    return True
+
+def _render(pool, *args):
+    return pool.run(_render_image_job, *args) if pool is not None else _render_image_job(*args)
+
+def _put_renditions(bucket: str, team_id: str, media_id: str, renditions: list):
+    _put_objects(bucket, {
+        rendition_key(team_id, media_id, r["size"], r["format"]): (r["body"], FORMAT_CONTENT_TYPE[r["format"]])
+        for r in renditions
+    })
+
+def _summary(renditions: list) -> list:
+    """Renditions without their bodies, small enough to carry in a lane message."""
+    return [{k: r[k] for k in ("size", "width", "height", "format")} for r in renditions]
+
+def _record_ready(job: dict):
+    """Time from upload to this lane linking its first derivative on the item."""
+    if job.get("uploaded_at"):
+        put_metric(
+            "TimeToFirstThumbnail",
+            round((time.time() - job["uploaded_at"]) * 1000),
+            dimensions={"Lane": job["lane"]},
+            media_id=job["media_id"],
+        )
+
+def _lookup_sk(team_id: str, media_id: str):
+    """
+    Sort key of the team's record for media_id, for originals without the
+    media-sk metadata (uploaded before presign set it, or copied by tooling).
+    One gsi1 Query on media_id, the same lookup media delete uses; None if
+    /media/complete hasn't written the record yet.
+    """
     resp = ddb.query(
         TableName=DDB_TABLE,
-        IndexName=GSI_NAME,
-        KeyConditionExpression="gsi1pk = :pk",
-        ExpressionAttributeValues={":pk": {"S": media_id}},
+        IndexName="gsi1",
+        KeyConditionExpression="gsi1pk = :m",
+        ProjectionExpression="team_id, sk",
+        ExpressionAttributeValues={":m": {"S": media_id}},
         Limit=1,
     )
-    items = resp.get("Items", [])
-    return items[0] if items else None
+    items = [i for i in resp.get("Items", []) if i["team_id"]["S"] == team_id]
+    return items[0]["sk"]["S"] if items else None
+
+def intake(bucket: str, key: str, pool=None, force: bool = False, sk: str = None):
+    """
+    Thumb lane: the first stop for every upload. Small images get their grid
+    thumbnails (and BlurHash, metadata) right here; everything heavier is
+    returned as a follow-up job for the preview or video lane.
+    Returns None when there's nothing (more) to do. force regenerates even
+    if the item is marked as derived for this ETag and pipeline version.
+    sk, when the caller already knows the item (backfills), skips the lookup.
+    """
+    parsed = _parse_key(key)
+    if not parsed:
+        return None
 
-def _update_thumb_key(team_id: str, sk: str, thumb_key: str):
-    ddb.update_item(
-        TableName=DDB_TABLE,
-        Key={"team_id": {"S": team_id}, "sk": {"S": sk}},
-        UpdateExpression="SET thumb_key = :t",
-        ExpressionAttributeValues={":t": {"S": thumb_key}},
+    head = _head(bucket, key)
+    if not head:
+        logger.info(f"{key} no longer exists, skipping")
+        return None
+    content_type = head.get("ContentType", "") or ""
+    # Media item sort key, set at presign time (see media_presign_upload)
+    sk = sk or (head.get("Metadata") or {}).get(MEDIA_SK_METADATA)
+    if not sk:
+        sk = _lookup_sk(parsed["team_id"], parsed["media_id"])
+    if not sk:
+        logger.warning(f"No {MEDIA_SK_METADATA} metadata on {key} and no record yet; derivatives won't be linked")
+
+    job = {
+        "bucket": bucket, "key": key, "sk": sk,
+        "team_id": parsed["team_id"], "media_id": parsed["media_id"],
+        "uploaded_at": head["LastModified"].timestamp() if head.get("LastModified") else None,
+        "size": int(head.get("ContentLength") or 0),
+        "etag": normalize_etag(head.get("ETag")) or None,
+    }
+    if force:
+        job["force"] = True
+
+    if not _is_image(content_type) and not _is_video(content_type):
+        logger.info(f"Skipping unsupported content_type {content_type} for {key}")
+        return None
+    if _already_derived({**job, "lane": LANE_THUMB}):
+        return None
+    if _is_video(content_type):
+        return {**job, "lane": LANE_VIDEO, "content_type": content_type}
+    if job["size"] > LARGE_IMAGE_BYTES:
+        # Big originals (panoramas, TIFF/PNG scans) would hold a thumb slot for seconds
+        return {**job, "lane": LANE_PREVIEW}
+
+    job["lane"] = LANE_THUMB
+    with _original(bucket, key, job["size"]) as source:
+        if source is None:
+            return None
+        meta, renditions, blurhash, plan = _render(pool, source, THUMB_SIZES, IMAGE_FORMATS, True, EMBEDDED_PREVIEW_MIN_EDGE)
+        del source
+    if not _decode_ok(job, plan):
+        return None
+    if not renditions:
+        raise ValueError(f"No renditions produced for {key}")
+
+    team_id, media_id = job["team_id"], job["media_id"]
+    _put_renditions(bucket, team_id, media_id, renditions)
+
+    rendition_map = _rendition_map(renditions)
+    long_edge = max(meta.get("width") or 0, meta.get("height") or 0)
+    # Originals no bigger than the thumb slot already have every rendition they'll
+    # get - unless an embedded preview only covered some of the thumb slots
+    if long_edge:
+        needs_preview = any(s not in rendition_map["sizes"] for s in ladder_slots(RENDITION_SIZES, long_edge))
+    else:
+        needs_preview = bool(PREVIEW_SIZES)
+    if sk:
+        _update_media(team_id, sk, {
+            "thumb_key": rendition_key(team_id, media_id, pick_size(rendition_map["sizes"], THUMB_TARGET), "jpeg"),
+            "preview_key": None if needs_preview else rendition_key(team_id, media_id, pick_size(rendition_map["sizes"], PREVIEW_TARGET), "jpeg"),
+            "renditions": rendition_map,
+            "blurhash": blurhash,
+            **_capture_fields(media_id, meta),
+            **({} if needs_preview else _derived_marker(job)),
+        })
+        _record_ready(job)
+
+    if needs_preview:
+        return {**job, "lane": LANE_PREVIEW, "done": _summary(renditions)}
+    return None
+
+def preview_stage(job: dict, pool=None):
+    """
+    Preview lane: the renditions the thumb lane didn't make - the larger ones,
+    plus any thumb slots an embedded preview couldn't cover. For images that
+    skipped the thumb lane (too big) this renders the whole ladder instead.
+    """
+    bucket, team_id, media_id, sk = job["bucket"], job["team_id"], job["media_id"], job.get("sk")
+    if _already_derived(job):
+        return
+    done = job.get("done") or []
+    done_sizes = {r["size"] for r in done}
+    sizes = [s for s in RENDITION_SIZES if s not in done_sizes]
+    with _original(bucket, job["key"], job.get("size") or 0) as source:
+        if source is None:
+            return
+        meta, renditions, blurhash, plan = _render(pool, source, sizes, IMAGE_FORMATS, not done)
+        del source
+    if not _decode_ok(job, plan):
+        return
+    if not renditions:
+        raise ValueError(f"No renditions produced for {job['key']}")
+
+    _put_renditions(bucket, team_id, media_id, renditions)
+    rendition_map = _rendition_map(done + _summary(renditions))
+    fields = {
+        "preview_key": rendition_key(team_id, media_id, pick_size(rendition_map["sizes"], PREVIEW_TARGET), "jpeg"),
+        "renditions": rendition_map,
+        **_derived_marker(job),
+    }
+    thumb_size = pick_size(rendition_map["sizes"], THUMB_TARGET)
+    if not done or thumb_size != pick_size(sorted(done_sizes), THUMB_TARGET):
+        # New item, or one whose grid thumb came from a too-small embedded preview
+        fields["thumb_key"] = rendition_key(team_id, media_id, thumb_size, "jpeg")
+    if not done:
+        fields.update({
+            "blurhash": blurhash,
+            **_capture_fields(media_id, meta),
+        })
+    if sk:
+        _update_media(team_id, sk, fields)
+        _record_ready(job)
+
+def video_stage(job: dict, pool=None):
+    """
+    Video lane: poster frame, container metadata, the grid's hover loop and
+    (for H.264 files with a trailing index) a fast-start playback copy, all
+    read via a presigned URL; then the transcode.
+    """
+    bucket, key, team_id, media_id, sk = job["bucket"], job["key"], job["team_id"], job["media_id"], job.get("sk")
+    if _already_derived(job):
+        return None
+    url = s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=VIDEO_URL_TTL_SECONDS,
+    )
+    try:
+        meta = _probe_video(url)
+    except Exception as e:
+        logger.warning(f"ffprobe failed for {key}: {str(e)}")
+        meta = {}
+    thumb_bytes = _make_video_thumb(url, meta.get("duration_ms"))
+
+    thumb_key = f"thumbnails/{team_id}/{media_id}/thumb.jpg"
+    s3.put_object(
+        Bucket=bucket, Key=thumb_key, Body=thumb_bytes,
+        ContentType="image/jpeg", CacheControl="private, max-age=86400",
     )
 
-def _update_thumb_and_preview_keys(team_id: str, sk: str, thumb_key: str, preview_key: str):
-    ddb.update_item(
-        TableName=DDB_TABLE,
-        Key={"team_id": {"S": team_id}, "sk": {"S": sk}},
-        UpdateExpression="SET thumb_key = :t, preview_key = :p",
-        ExpressionAttributeValues={
-            ":t": {"S": thumb_key},
-            ":p": {"S": preview_key}
-        },
+    clip_key = None
+    try:
+        clip_key = _hover_clip(job, url, meta.get("duration_ms"))
+    except Exception as e:
+        logger.warning(f"Hover clip failed for {key}: {str(e)}")
+
+    preview_key = None
+    if faststart.needs_faststart(job.get("content_type"), meta.get("video_codec")):
+        try:
+            preview_key = _faststart_copy(job, url)
+        except Exception as e:
+            # The original still plays, just not until it's (mostly) downloaded
+            logger.warning(f"Fast-start remux failed for {key}: {str(e)}")
+
+    if not sk:
+        return None
+    _update_media(team_id, sk, {
+        "thumb_key": thumb_key,
+        "preview_key": preview_key,
+        "hover_key": clip_key,
+        "blurhash": _placeholder(thumb_bytes),
+        **_capture_fields(media_id, meta),
+    })
+    _record_ready(job)
+    return {**job, "lane": LANE_TRANSCODE, "width": meta.get("width"), "height": meta.get("height")}
+
+def _range_reader(bucket: str, key: str):
+    def read(start: int, length: int) -> bytes:
+        return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")["Body"].read()
+    return read
+
+def _faststart_copy(job: dict, url: str):
+    """
+    Fast-start MP4 of an original whose moov box trails the media data, or
+    None if it already plays progressively (or is too big to spool here).
+    ffmpeg reads the original from the presigned URL and the copy is uploaded
+    from /tmp in multipart chunks, so neither is ever held in memory.
+    """
+    bucket, key, size = job["bucket"], job["key"], job.get("size") or 0
+    if not size or size > REMUX_MAX_BYTES:
+        return None
+    if not faststart.moov_at_end(_range_reader(bucket, key), size):
+        return None
+
+    out_key = playback_key(job["team_id"], job["media_id"])
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "playback.mp4")
+        started = time.time()
+        faststart.remux(url, out_path, timeout=REMUX_TIMEOUT_SECONDS, read_timeout=VIDEO_READ_TIMEOUT_SECONDS)
+        s3.upload_file(
+            out_path, bucket, out_key,
+            ExtraArgs={"ContentType": "video/mp4", "CacheControl": "private, max-age=86400"},
+        )
+    put_metric("FaststartRemuxSeconds", round(time.time() - started, 1), unit="Seconds", media_id=job["media_id"], bytes=size)
+    return out_key
+
+def _hover_clip(job: dict, url: str, duration_ms: int = None) -> str:
+    """Short silent loop for the grid (see thumbs.hover); only its first seconds are read."""
+    out_key = hover_key(job["team_id"], job["media_id"])
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "hover.mp4")
+        hover.make_clip(url, out_path, duration_ms, read_timeout=VIDEO_READ_TIMEOUT_SECONDS)
+        with open(out_path, "rb") as f:
+            s3.put_object(
+                Bucket=job["bucket"], Key=out_key, Body=f.read(),
+                ContentType="video/mp4", CacheControl="private, max-age=86400",
+            )
+    return out_key
+
+def _put_files(bucket: str, prefix: str, directory: str, names: list):
+    """Upload files from directory to prefix concurrently, streaming from disk."""
+    def put(name):
+        s3.upload_file(
+            os.path.join(directory, name), bucket, prefix + name,
+            ExtraArgs={
+                "ContentType": HLS_CONTENT_TYPES[os.path.splitext(name)[1]],
+                "CacheControl": "private, max-age=86400",
+            },
+        )
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(names)))) as pool:
+        for f in [pool.submit(put, name) for name in names]:
+            f.result()
+
+def transcode_stage(job: dict, pool=None):
+    """Transcode lane: H.264 HLS ladder under streams/{team_id}/{media_id}/."""
+    bucket, key, team_id, media_id, sk = job["bucket"], job["key"], job["team_id"], job["media_id"], job.get("sk")
+    if not sk or _already_derived(job):
+        return
+    url = s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=TRANSCODE_URL_TTL_SECONDS,
     )
+    prefix = stream_prefix(team_id, media_id)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.time()
+        stream = hls.transcode(url, tmp, job.get("width"), job.get("height"), timeout=TRANSCODE_TIMEOUT_SECONDS)
+        put_metric("TranscodeSeconds", round(time.time() - started, 1), unit="Seconds", media_id=media_id)
+        names = [n for n in os.listdir(tmp) if os.path.splitext(n)[1] in HLS_CONTENT_TYPES]
+        # Master playlist last: once it exists, everything it references does too
+        _put_files(bucket, prefix, tmp, [n for n in names if n != HLS_MASTER])
+        _put_files(bucket, prefix, tmp, [HLS_MASTER])
+
+    _update_media(team_id, sk, {"stream_key": prefix + HLS_MASTER, "stream": stream, **_derived_marker(job)})
+    _record_ready(job)
+
+def process_object(bucket: str, key: str, pool=None, force: bool = False, sk: str = None):
+    """Run every lane for one object in this process (local runs and tools)."""
+    job = intake(bucket, key, pool, force, sk)
+    while job:
+        job = LANE_STAGES[job["lane"]](job, pool)
+
+LANE_STAGES = {LANE_PREVIEW: preview_stage, LANE_VIDEO: video_stage, LANE_TRANSCODE: transcode_stage}
+
+def _enqueue(lane: str, jobs: list):
+    """Send follow-up jobs to their lane's queue, 10 per SendMessageBatch."""
+    url = LANE_QUEUE_URLS[lane]
+    for i in range(0, len(jobs), 10):
+        chunk = jobs[i:i + 10]
+        resp = sqs.send_message_batch(
+            QueueUrl=url,
+            Entries=[{"Id": str(n), "MessageBody": json.dumps(job)} for n, job in enumerate(chunk)],
+        )
+        if resp.get("Failed"):
+            raise RuntimeError(f"{len(resp['Failed'])} {lane} jobs not enqueued")
 
-def handler(event, context):
-    for rec in event.get("Records", []):
+def _s3_objects(s3_event: dict):
+    """(bucket, key) pairs from an S3 notification; S3 test events have no Records."""
+    for rec in s3_event.get("Records", []):
         s3info = rec.get("s3", {})
         bucket = s3info.get("bucket", {}).get("name")
         key = s3info.get("object", {}).get("key")
-        if not bucket or not key:
-            continue
-
-        # S3 event keys are URL-encoded (spaces, commas, etc.)
-        # Decode before parsing/reading from S3
-        key = unquote_plus(key)
-
-        parsed = _parse_key(key)
-        if not parsed:
-            continue
-
-        # Retry head_object with backoff — S3 notifications can arrive
-        # before the object is fully visible (eventual consistency edge case)
-        head = None
-        for attempt in range(4):
-            try:
-                head = s3.head_object(Bucket=bucket, Key=key)
-                break
-            except ClientError as e:
-                if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
-                    if attempt < 3:
-                        wait = 2 ** attempt  # 1s, 2s, 4s
-                        logger.info(f"head_object 404 for {key}, retry {attempt + 1}/3 in {wait}s")
-                        time.sleep(wait)
-                    else:
-                        logger.error(f"head_object 404 after 4 attempts for {key}, skipping")
-                else:
-                    logger.error(f"head_object error for {key}: {e}")
-                    break
-
-        if not head:
-            continue
-        content_type = head.get("ContentType", "") or ""
-
-        if _is_image(content_type):
-            # NOTE: HEIC often can't be decoded by Pillow on Lambda without libheif.
-            # We'll try; if it fails, we skip thumbnail generation.
+        if bucket and key:
+            # S3 event keys are URL-encoded (spaces, commas, etc.)
+            yield bucket, unquote_plus(key)
+
+def _jobs(event: dict):
+    """
+    (message_id, job) for every unit of work in the invocation. Intake
+    messages wrap an S3 notification; lane messages carry a job dict from
+    intake(). Direct S3 invocations (and local runs) have message_id None.
+    """
+    for rec in event.get("Records", []):
+        if rec.get("eventSource") == "aws:sqs":
+            message_id = rec["messageId"]
             try:
-                raw = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
-                thumb_bytes = _make_thumb(raw)
-                preview_bytes = _make_preview(raw)
-            except Exception as e:
-                logger.warning(f"Failed to generate image thumbnail for {key}: {str(e)}")
+                body = json.loads(rec.get("body") or "{}")
+            except ValueError:
+                logger.error(f"Unparseable message {message_id}")
+                yield message_id, None
                 continue
-
-            thumb_key = f"thumbnails/{parsed['team_id']}/{parsed['media_id']}/thumb.jpg"
-            preview_key = f"previews/{parsed['team_id']}/{parsed['media_id']}/preview.jpg"
-
-            s3.put_object(
-                Bucket=bucket, Key=thumb_key, Body=thumb_bytes,
-                ContentType="image/jpeg", CacheControl="private, max-age=86400",
-            )
-            s3.put_object(
-                Bucket=bucket, Key=preview_key, Body=preview_bytes,
-                ContentType="image/jpeg", CacheControl="private, max-age=86400",
-            )
-
-            item = _query_item_by_media_id(parsed["media_id"])
-            if item:
-                _update_thumb_and_preview_keys(
-                    item["team_id"]["S"], item["sk"]["S"], thumb_key, preview_key
-                )
-
-        elif _is_video(content_type):
+            if body.get("lane"):
+                yield message_id, body
+            for bucket, key in _s3_objects(body):
+                yield message_id, {"lane": LANE_THUMB, "bucket": bucket, "key": key}
+        else:
+            for bucket, key in _s3_objects({"Records": [rec]}):
+                yield None, {"lane": LANE_THUMB, "bucket": bucket, "key": key}
+
+def _run_lane(lane: str, jobs: list, pool) -> tuple:
+    """Run one lane's jobs within its concurrency budget -> (failed message ids, follow-ups)."""
+    failed, followups = set(), []
+
+    def run(job):
+        if not job or not job.get("key"):
+            raise ValueError("message has no S3 object")
+        if lane == LANE_THUMB:
+            return intake(job["bucket"], job["key"], pool)
+        return LANE_STAGES[lane](job, pool)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LANE_CONCURRENCY[lane], len(jobs)))) as threads:
+        futures = {threads.submit(run, job): (message_id, job) for message_id, job in jobs}
+        for future, (message_id, job) in futures.items():
             try:
-                raw = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
-                thumb_bytes = _make_video_thumb(raw)
+                followup = future.result()
             except Exception as e:
-                logger.warning(f"Failed to generate video thumbnail for {key}: {str(e)}")
+                logger.error(f"{lane} job failed for {(job or {}).get('key')} (message {message_id}): {e}")
+                failed.add(message_id)
                 continue
+            if followup:
+                followups.append((message_id, followup))
+    return failed, followups
 
-            thumb_key = f"thumbnails/{parsed['team_id']}/{parsed['media_id']}/thumb.jpg"
-
-            s3.put_object(
-                Bucket=bucket, Key=thumb_key, Body=thumb_bytes,
-                ContentType="image/jpeg", CacheControl="private, max-age=86400",
-            )
-
-            item = _query_item_by_media_id(parsed["media_id"])
-            if item:
-                _update_thumb_key(item["team_id"]["S"], item["sk"]["S"], thumb_key)
-
-        else:
-            logger.info(f"Skipping unsupported content_type {content_type} for {key}")
-
-    return {"ok": True}
+def handler(event, context):
+    """
+    SQS batch handler for all three lanes (see LANES). S3 notifications land
+    on the thumb lane queue; intake() does the cheap image work and hands
+    previews and videos to their own queues, whose event source mappings
+    have their own concurrency limits - so a batch of phone photos never
+    waits behind a long video. Within a batch, I/O runs on a thread budget
+    per lane and Pillow on a worker process pool.
+
+    Only failed messages are reported back, so just those are redelivered;
+    after maxReceiveCount attempts SQS moves them to the dead-letter queue.
+    Without lane queues configured (local runs) follow-ups run inline,
+    thumbs still first.
+    """
+    by_lane = {}
+    for message_id, job in _jobs(event):
+        by_lane.setdefault((job or {}).get("lane", LANE_THUMB), []).append((message_id, job))
+    if not by_lane:
+        return {"batchItemFailures": []}
+
+    # Created before the I/O threads start, so workers fork from a single-threaded parent
+    pool = _get_render_pool() if RENDER_PROCESSES > 1 else None
+
+    failed = set()
+    for lane in LANES:
+        jobs = by_lane.pop(lane, [])
+        if not jobs:
+            continue
+        lane_failed, followups = _run_lane(lane, jobs, pool)
+        failed |= lane_failed
+        for next_lane in LANES:
+            next_jobs = [(m, j) for m, j in followups if j["lane"] == next_lane]
+            if not next_jobs:
+                continue
+            if LANE_QUEUE_URLS.get(next_lane):
+                try:
+                    _enqueue(next_lane, [j for _, j in next_jobs])
+                except Exception as e:
+                    logger.error(f"Failed to enqueue {next_lane} jobs: {e}")
+                    failed |= {m for m, _ in next_jobs}
+            else:
+                by_lane.setdefault(next_lane, []).extend(next_jobs)
+        print(f"[THUMBS] lane={lane} jobs={len(jobs)} failed={len(lane_failed)} followups={len(followups)}")
+
+    return {"batchItemFailures": [{"itemIdentifier": m} for m in sorted(m for m in failed if m)]}
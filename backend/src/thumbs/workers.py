@@ -0,0 +1,107 @@
+"""
+Small process pool for CPU-bound rendering, usable on Lambda.
+
+multiprocessing.Pool and ProcessPoolExecutor need POSIX semaphores, which
+Lambda doesn't provide (no /dev/shm), so they fail at construction there.
+Plain Process + Pipe works everywhere: each worker is a forked process with
+its own duplex pipe, and callers (I/O threads) check out an idle worker, send
+one job and block on the reply.
+"""
+import os
+import queue
+import threading
+import traceback
+import multiprocessing
+
+_ctx = multiprocessing.get_context("fork")
+
+
+class WorkerError(Exception):
+    """A job raised in the worker process, or the worker died (e.g. OOM-killed)."""
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, args = job
+        try:
+            conn.send((True, fn(*args)))
+        except BaseException as e:
+            conn.send((False, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+class PipePool:
+    """
+    N persistent worker processes. run() is thread-safe and blocking, so a
+    ThreadPoolExecutor doing S3 I/O can hand its CPU step to a free process.
+    Workers are forked eagerly in __init__ - create the pool before starting
+    threads so children don't inherit locks held mid-operation.
+    """
+
+    def __init__(self, processes: int):
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._workers = []
+        for _ in range(max(1, processes)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent, child = _ctx.Pipe()
+        proc = _ctx.Process(target=_worker_main, args=(child,), daemon=True)
+        proc.start()
+        child.close()
+        with self._lock:
+            self._workers.append((proc, parent))
+        return proc, parent
+
+    def _retire(self, worker):
+        proc, conn = worker
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        conn.close()
+        proc.join(timeout=1)
+        if proc.is_alive():
+            proc.kill()
+
+    def run(self, fn, *args):
+        """Run fn(*args) in a worker process and return its result."""
+        worker = self._idle.get()
+        proc, conn = worker
+        try:
+            conn.send((fn, args))
+            ok, value = conn.recv()
+        except (EOFError, OSError) as e:
+            # Worker died mid-job; replace it so the pool keeps its size
+            self._retire(worker)
+            self._idle.put(self._spawn())
+            raise WorkerError(f"worker pid={proc.pid} exited: {e!r}")
+        self._idle.put(worker)
+        if not ok:
+            raise WorkerError(value)
+        return value
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return len(self._workers)
+
+    def close(self):
+        with self._lock:
+            workers = list(self._workers)
+        for proc, conn in workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            self._retire(worker)
+
+
+def default_processes() -> int:
+    return max(1, os.cpu_count() or 1)
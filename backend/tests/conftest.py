@@ -71,7 +71,21 @@ def _create_tables(dynamodb):
     dynamodb.create_table(
         TableName="Invites",
         KeySchema=[{"AttributeName": "token_hash", "KeyType": "HASH"}],
-        AttributeDefinitions=[{"AttributeName": "token_hash", "AttributeType": "S"}],
+        AttributeDefinitions=[
+            {"AttributeName": "token_hash", "AttributeType": "S"},
+            {"AttributeName": "team_id", "AttributeType": "S"},
+            {"AttributeName": "role", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "team-role-index",
+                "KeySchema": [
+                    {"AttributeName": "team_id", "KeyType": "HASH"},
+                    {"AttributeName": "role", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+        ],
         BillingMode="PAY_PER_REQUEST",
     )
     dynamodb.create_table(
@@ -84,13 +98,22 @@ def _create_tables(dynamodb):
             {"AttributeName": "team_id", "AttributeType": "S"},
             {"AttributeName": "sk", "AttributeType": "S"},
             {"AttributeName": "gsi1pk", "AttributeType": "S"},
+            {"AttributeName": "capture_sk", "AttributeType": "S"},
         ],
         GlobalSecondaryIndexes=[
             {
                 "IndexName": "gsi1",
                 "KeySchema": [{"AttributeName": "gsi1pk", "KeyType": "HASH"}],
                 "Projection": {"ProjectionType": "ALL"},
-            }
+            },
+            {
+                "IndexName": "capture-index",
+                "KeySchema": [
+                    {"AttributeName": "team_id", "KeyType": "HASH"},
+                    {"AttributeName": "capture_sk", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
         ],
         BillingMode="PAY_PER_REQUEST",
     )
@@ -201,6 +224,11 @@ def aws(monkeypatch):
             "audit_table": ddb.Table("Audit"),
         }
 
+        # Events a test buffered via a handler (no main.handler flush) must not
+        # leak into the next test's tables
+        import common.audit
+        common.audit._pending.clear()
+
 
 # ---------------------------------------------------------------------------
 # Helper factories
@@ -1,7 +1,10 @@
 """Tests for common/audit.py – audit logging with hashed PII."""
 import json
 import hashlib
-from common.audit import write_audit, _sha256
+
+import pytest
+
+from common.audit import write_audit, flush_audit, _sha256
 
 
 class TestSha256:
@@ -13,9 +16,17 @@ class TestSha256:
         assert _sha256("hello") == expected
 
 
+@pytest.fixture
+def table_sink(monkeypatch):
+    """Write from the flush with BatchWriteItem, as AUDIT_SINK=table does."""
+    monkeypatch.setattr("common.audit.AUDIT_SINK", "table")
+
+
+@pytest.mark.usefixtures("table_sink")
 class TestWriteAudit:
     def test_writes_record(self, aws):
         write_audit("team-audit", "test_action", invite_token="tok123")
+        flush_audit()
         items = aws["audit_table"].scan()["Items"]
         assert len(items) == 1
         item = items[0]
@@ -29,6 +40,7 @@ class TestWriteAudit:
     def test_hashes_ip_and_ua(self, aws):
         write_audit("team-audit2", "login", invite_token="t",
                     ip="192.168.1.1", ua="Mozilla/5.0")
+        flush_audit()
         items = aws["audit_table"].scan()["Items"]
         item = items[0]
         assert "ip_hash" in item
@@ -39,6 +51,7 @@ class TestWriteAudit:
     def test_stores_meta(self, aws):
         write_audit("team-audit3", "upload", invite_token="t",
                     meta={"size": 1024})
+        flush_audit()
         items = aws["audit_table"].scan()["Items"]
         assert items[0]["meta"]["size"] == 1024
 
@@ -51,3 +64,91 @@ class TestWriteAudit:
         monkeypatch.setattr("common.audit.TABLE_AUDIT", "")
         # Should not raise
         write_audit("team-x", "test", invite_token="t")
+
+
+@pytest.mark.usefixtures("table_sink")
+class TestBufferedFlush:
+    def test_nothing_written_until_flush(self, aws):
+        write_audit("team-buf", "media_list", invite_token="t")
+        assert aws["audit_table"].scan()["Items"] == []
+        assert flush_audit() == 1
+        assert len(aws["audit_table"].scan()["Items"]) == 1
+        assert flush_audit() == 0
+
+    def test_batches_past_25(self, aws):
+        for i in range(60):
+            write_audit("team-buf", "media_list", invite_token="t", meta={"i": i})
+        assert flush_audit() == 60
+        assert aws["audit_table"].scan(Select="COUNT")["Count"] == 60
+
+    def test_full_buffer_flushes_inline(self, aws, monkeypatch):
+        monkeypatch.setattr("common.audit.AUDIT_BUFFER_MAX", 3)
+        for _ in range(3):
+            write_audit("team-buf", "media_list", invite_token="t")
+        assert aws["audit_table"].scan(Select="COUNT")["Count"] == 3
+
+    def test_unprocessed_events_fall_back_to_log(self, aws, monkeypatch, capsys):
+        monkeypatch.setattr("common.audit.batch_put_items", lambda table, items: items[1:])
+        write_audit("team-buf", "a", invite_token="t")
+        write_audit("team-buf", "b", invite_token="t")
+        flush_audit()
+        lines = [json.loads(l) for l in capsys.readouterr().out.splitlines() if l.startswith("{")]
+        assert [l["audit"]["action"] for l in lines if "audit" in l] == ["b"]
+        assert any(l.get("AuditEventsFallback") == 1 for l in lines)
+        assert any("AuditFlushLatency" in l for l in lines)
+
+    def test_write_failure_falls_back_to_log(self, aws, monkeypatch, capsys):
+        def boom(table, items):
+            raise RuntimeError("throttled")
+        monkeypatch.setattr("common.audit.batch_put_items", boom)
+        write_audit("team-buf", "a", invite_token="t")
+        assert flush_audit() == 1
+        assert '"audit": {' in capsys.readouterr().out
+
+    def test_log_sink_skips_the_table(self, aws, monkeypatch, capsys):
+        monkeypatch.setattr("common.audit.AUDIT_SINK", "log")
+        write_audit("team-buf", "a", invite_token="t")
+        flush_audit()
+        assert aws["audit_table"].scan()["Items"] == []
+        assert '"action": "a"' in capsys.readouterr().out
+
+    def test_log_sink_is_the_default(self, aws, monkeypatch, capsys):
+        import common.config
+        assert common.config.AUDIT_SINK == "log"
+
+        monkeypatch.setattr("common.audit.AUDIT_SINK", common.config.AUDIT_SINK)
+        monkeypatch.setattr("common.audit.batch_put_items", lambda *a: pytest.fail("request path wrote to DynamoDB"))
+        write_audit("team-buf", "media_list", invite_token="t")
+        assert flush_audit() == 1
+        assert '"action": "media_list"' in capsys.readouterr().out
+
+    def test_main_handler_flushes(self, aws, monkeypatch):
+        import main
+        from conftest import make_event
+
+        def audited(event):
+            write_audit("team-buf", "health", invite_token=None)
+            raise RuntimeError("handler failed after auditing")
+        monkeypatch.setattr(main, "handle_health", audited)
+        resp = main.handler(make_event("GET", "/health"), None)
+        assert resp["statusCode"] == 500
+        assert aws["audit_table"].scan()["Items"][0]["action"] == "health"
+
+
+class TestAuditIngest:
+    def test_log_lines_round_trip(self, aws, monkeypatch, capsys):
+        import base64, gzip
+        from jobs import audit_ingest
+
+        monkeypatch.setattr("common.audit.AUDIT_SINK", "log")
+        write_audit("team-ing", "upload", invite_token="t", meta={"size": 1024})
+        flush_audit()
+        messages = capsys.readouterr().out.splitlines() + ["START RequestId: abc", "[UPLOAD] not an audit line"]
+        payload = {"messageType": "DATA_MESSAGE", "logEvents": [{"id": str(i), "message": m} for i, m in enumerate(messages)]}
+        event = {"awslogs": {"data": base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+
+        # Redelivery writes the same item again: still one record
+        for _ in range(2):
+            assert audit_ingest.handler(event, None)["written"] == 1
+        items = aws["audit_table"].scan()["Items"]
+        assert len(items) == 1 and items[0]["action"] == "upload" and items[0]["meta"]["size"] == 1024
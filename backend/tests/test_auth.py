@@ -63,6 +63,27 @@ class TestRequireInvite:
         assert invite is None
         assert error["statusCode"] == 401
 
+    def test_invite_from_older_epoch_returns_401(self, aws):
+        token, h, record = make_invite_token("team-1")
+        aws["invites_table"].put_item(Item=record)  # issued at epoch 0
+        aws["teams_table"].put_item(Item={"team_id": "team-1", "token_epoch": 1})
+
+        event = make_event(headers={"x-invite-token": token})
+        invite, error = require_invite(event)
+        assert invite is None
+        assert error["statusCode"] == 401
+
+    def test_invite_from_current_epoch_attaches_team(self, aws):
+        token, h, record = make_invite_token("team-1")
+        record["token_epoch"] = 2
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "team-1", "token_epoch": 2, "team_name": "Epoch FC"})
+
+        event = make_event(headers={"x-invite-token": token})
+        invite, error = require_invite(event)
+        assert error is None
+        assert invite["_team"]["team_name"] == "Epoch FC"
+
     def test_required_role_mismatch_returns_403(self, aws):
         token, h, record = make_invite_token("team-1", role="viewer")
         aws["invites_table"].put_item(Item=record)
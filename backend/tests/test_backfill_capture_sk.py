@@ -0,0 +1,51 @@
+"""Tests for scripts/backfill_capture_sk.py – capture-index keys for items that predate it."""
+import json
+import os
+import sys
+
+import boto3
+
+from conftest import make_event, make_invite_token
+from handlers.media_list import handle_media_list
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import backfill_capture_sk
+
+
+def _item(aws, media_id, uploaded, **extra):
+    aws["media_table"].put_item(Item={
+        "team_id": "t1", "sk": f"{uploaded}#{media_id}", "media_id": media_id,
+        "object_key": f"media/t1/{media_id}/photo.jpg", "content_type": "image/jpeg", **extra,
+    })
+
+
+def _captured(token):
+    event = make_event(path="/media", headers={"x-invite-token": token}, query="sort=captured")
+    return [i["media_id"] for i in json.loads(handle_media_list(event)["body"])["items"]]
+
+
+def test_items_without_capture_sk_appear_in_the_captured_feed(aws):
+    token, _, invite = make_invite_token("t1", role="viewer", token="cap-tok")
+    aws["invites_table"].put_item(Item=invite)
+    # Completed before capture_sk existed; "legacy-b" has no created_at either
+    _item(aws, "legacy-a", 1000, created_at=1000)
+    _item(aws, "legacy-b", 3000)
+    _item(aws, "new", 2000, created_at=2000, capture_sk="0000000500#new")
+    # Upserted by the thumbnail Lambda, never finalized: left alone
+    aws["media_table"].put_item(Item={"team_id": "t1", "sk": "4000#partial", "thumb_key": "thumbnails/t1/partial/512.jpg"})
+    assert _captured(token) == ["new"]
+
+    ddb = boto3.client("dynamodb", region_name="us-east-1")
+    assert backfill_capture_sk.backfill(ddb, "Media", segments=2, dry_run=True) == {"updated": 2, "gone": 0}
+    assert _captured(token) == ["new"]
+
+    assert backfill_capture_sk.backfill(ddb, "Media", segments=2) == {"updated": 2, "gone": 0}
+    # Upload time for the legacy items; the known capture time is kept
+    assert _captured(token) == ["legacy-b", "legacy-a", "new"]
+    item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "2000#new"})["Item"]
+    assert item["capture_sk"] == "0000000500#new"
+    assert "capture_sk" not in aws["media_table"].get_item(Key={"team_id": "t1", "sk": "4000#partial"})["Item"]
+
+    # Re-running finds nothing left to do
+    assert backfill_capture_sk.backfill(ddb, "Media", segments=2) == {"updated": 0, "gone": 0}
@@ -0,0 +1,170 @@
+"""Tests for scripts/backfill_thumbnails.py – derivative backfill on the thumbnail pipeline."""
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import backfill_thumbnails as backfill
+
+BUCKET = "test-media-bucket"
+
+
+def _jpeg(width=400, height=300) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _args(**overrides):
+    args = {
+        "stage": "staging", "dry_run": False, "segments": 1, "processes": 2, "max_inflight_mb": 64,
+        "checkpoint": None, "only_missing": False, "images_only": False, "work_list": None, "verbose": True,
+    }
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def backfill_env(aws, monkeypatch):
+    from thumbs import thumbnail_handler
+    monkeypatch.setattr(thumbnail_handler, "s3", aws["s3"])
+    monkeypatch.setattr(thumbnail_handler, "ddb", boto3.client("dynamodb", region_name="us-east-1"))
+    monkeypatch.setattr(thumbnail_handler, "IMAGE_FORMATS", ["jpeg"])
+    # What _init_worker sets up in each worker process
+    monkeypatch.setattr(backfill, "_handler", thumbnail_handler)
+    monkeypatch.setattr(backfill, "_bucket", BUCKET)
+    return aws
+
+
+def _seed(aws, media_id, sk, **extra):
+    key = f"media/t1/{media_id}/photo.jpg"
+    body = _jpeg()
+    # No media-sk metadata: uploaded before presign started setting it
+    aws["s3"].put_object(Bucket=BUCKET, Key=key, Body=body, ContentType="image/jpeg")
+    aws["media_table"].put_item(Item={
+        "team_id": "t1", "sk": sk, "media_id": media_id, "object_key": key,
+        "content_type": "image/jpeg", "size_bytes": len(body), **extra,
+    })
+    return key
+
+
+def test_legacy_original_is_linked_to_its_record(backfill_env, monkeypatch):
+    from thumbs import thumbnail_handler
+    _seed(backfill_env, "m1", "1000#m1")
+
+    def no_lookup(*args):
+        raise AssertionError("backfill knows the sk; no partition query needed")
+    monkeypatch.setattr(thumbnail_handler, "_lookup_sk", no_lookup)
+
+    ddb = boto3.client("dynamodb", region_name="us-east-1")
+    [(entries, _)] = list(backfill._scan_source(ddb, "Media", 0, _args(), None))
+    assert entries == [("media/t1/m1/photo.jpg", entries[0][1], "1000#m1")]
+    for key, _, sk in entries:
+        backfill._process(key, sk)
+
+    item = backfill_env["media_table"].get_item(Key={"team_id": "t1", "sk": "1000#m1"})["Item"]
+    assert item["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+    assert item["derived_version"] == thumbnail_handler.PIPELINE_VERSION
+    # Now derived for this pipeline version: a re-run selects nothing
+    assert list(backfill._scan_source(ddb, "Media", 0, _args(), None)) == [([], None)]
+
+
+def test_interrupted_run_resumes_from_the_checkpoint(backfill_env, monkeypatch, tmp_path):
+    keys = [_seed(backfill_env, f"m{i}", f"100{i}#m{i}") for i in range(5)]
+    work_list = tmp_path / "missing.jsonl"
+    work_list.write_text("".join(
+        json.dumps({"object_key": k, "size_bytes": 10, "sk": f"100{i}#m{i}"}) + "\n" for i, k in enumerate(keys)
+    ))
+    checkpoint = tmp_path / "backfill.checkpoint.json"
+    args = _args(work_list=str(work_list), checkpoint=str(checkpoint))
+
+    monkeypatch.setattr(backfill, "PAGE_SIZE", 2)
+    monkeypatch.setattr(backfill, "stack_resources", lambda stage: {"MediaTable": "Media", "MediaBucket": BUCKET})
+    monkeypatch.setattr(backfill, "_worker_pool", lambda args, table, bucket: ThreadPoolExecutor(max_workers=2))
+    processed = []
+    real_process = backfill._process
+
+    def record(key, sk=None, force=False):
+        processed.append(key)
+        return real_process(key, sk, force)
+    monkeypatch.setattr(backfill, "_process", record)
+
+    real_write = backfill.write_json
+
+    def write_then_interrupt(path, data):
+        real_write(path, data)
+        raise KeyboardInterrupt  # Ctrl-C right after the first page is checkpointed
+    monkeypatch.setattr(backfill, "write_json", write_then_interrupt)
+    backfill.run(args)
+    assert sorted(processed) == keys[:2]
+    assert json.loads(checkpoint.read_text())["positions"] == {"work-list": 2}
+
+    monkeypatch.setattr(backfill, "write_json", real_write)
+    backfill.run(args)
+    # Resumed after the checkpointed page: nothing processed twice
+    assert sorted(processed) == keys
+    saved = json.loads(checkpoint.read_text())
+    assert saved["finished"] == ["work-list"] and saved["positions"] == {}
+    for i in range(5):
+        item = backfill_env["media_table"].get_item(Key={"team_id": "t1", "sk": f"100{i}#m{i}"})["Item"]
+        assert item["derived_version"] == backfill._handler.PIPELINE_VERSION
+
+
+def test_failed_items_are_retried_on_the_next_run(backfill_env, monkeypatch, tmp_path):
+    keys = [_seed(backfill_env, f"m{i}", f"100{i}#m{i}") for i in range(3)]
+    work_list = tmp_path / "missing.jsonl"
+    work_list.write_text("".join(
+        json.dumps({"object_key": k, "size_bytes": 10, "sk": f"100{i}#m{i}"}) + "\n" for i, k in enumerate(keys)
+    ))
+    checkpoint = tmp_path / "backfill.checkpoint.json"
+    args = _args(work_list=str(work_list), checkpoint=str(checkpoint))
+
+    monkeypatch.setattr(backfill, "PAGE_SIZE", 2)
+    monkeypatch.setattr(backfill, "stack_resources", lambda stage: {"MediaTable": "Media", "MediaBucket": BUCKET})
+    monkeypatch.setattr(backfill, "_worker_pool", lambda args, table, bucket: ThreadPoolExecutor(max_workers=2))
+    processed, failures = [], [keys[0]]
+    real_process = backfill._process
+
+    def flaky(key, sk=None, force=False):
+        processed.append(key)
+        if key in failures:
+            failures.remove(key)
+            raise RuntimeError("throttled")
+        return real_process(key, sk, force)
+    monkeypatch.setattr(backfill, "_process", flaky)
+
+    backfill.run(args)
+    saved = json.loads(checkpoint.read_text())
+    assert saved["finished"] == ["work-list"]
+    assert saved["retry"] == {keys[0]: {"size": 10, "sk": "1000#m0"}}
+
+    processed.clear()
+    backfill.run(args)
+    # Only the failed item is tried again, and it leaves the retry list
+    assert processed == [keys[0]]
+    assert json.loads(checkpoint.read_text())["retry"] == {}
+    item = backfill_env["media_table"].get_item(Key={"team_id": "t1", "sk": "1000#m0"})["Item"]
+    assert item["derived_version"] == backfill._handler.PIPELINE_VERSION
+
+
+def test_workers_ignore_ctrl_c(monkeypatch):
+    # Restored after the test; _init_worker sets all of them
+    monkeypatch.setenv("TABLE_MEDIA", "Media")
+    monkeypatch.setenv("MEDIA_BUCKET", BUCKET)
+    monkeypatch.setattr(backfill, "_handler", None)
+    monkeypatch.setattr(backfill, "_bucket", None)
+    previous = signal.getsignal(signal.SIGINT)
+    try:
+        backfill._init_worker("Media", BUCKET, True)
+        assert signal.getsignal(signal.SIGINT) == signal.SIG_IGN
+    finally:
+        signal.signal(signal.SIGINT, previous)
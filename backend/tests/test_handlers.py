@@ -156,6 +156,75 @@ class TestMediaListHandler:
             assert item["preview_url"] is not None
             assert item["preview_url"].startswith("https://dtest.cloudfront.net/")
 
+    @patch("handlers.media_list.create_signed_prefix_query", return_value="Policy=p&Signature=s&Key-Pair-Id=k")
+    def test_sources_are_srcset_ready(self, mock_sign, aws):
+        """Renditions come back as <picture> sources, best format first, one signature per item."""
+        token = self._seed(aws, team_id="team-rs", count=1)
+        aws["media_table"].update_item(
+            Key={"team_id": "team-rs", "sk": "1000#ml-0"},
+            UpdateExpression="SET renditions = :r",
+            ExpressionAttributeValues={":r": {"sizes": [256, 512, 1024], "widths": [256, 512, 900], "heights": [192, 384, 675], "formats": ["jpeg", "avif", "webp"]}},
+        )
+        resp = handle_media_list(make_event(method="GET", path="/media", headers={"x-invite-token": token}))
+        item = json.loads(resp["body"])["items"][0]
+
+        assert [s["type"] for s in item["sources"]] == ["image/avif", "image/webp", "image/jpeg"]
+        assert item["sources"][1]["srcset"] == ", ".join([
+            "https://dtest.cloudfront.net/thumbnails/team-rs/ml-0/256.webp?Policy=p&Signature=s&Key-Pair-Id=k 256w",
+            "https://dtest.cloudfront.net/thumbnails/team-rs/ml-0/512.webp?Policy=p&Signature=s&Key-Pair-Id=k 512w",
+            "https://dtest.cloudfront.net/thumbnails/team-rs/ml-0/1024.webp?Policy=p&Signature=s&Key-Pair-Id=k 900w",
+        ])
+        mock_sign.assert_called_once()
+        assert mock_sign.call_args.kwargs["key_prefix"] == "thumbnails/team-rs/ml-0/"
+
+    @patch("handlers.media_list.create_signed_url", side_effect=lambda **kw: f"https://dtest.cloudfront.net/{kw['object_key']}?sig")
+    def test_video_hover_and_playback_urls(self, mock_sign, aws):
+        token = self._seed(aws, team_id="team-hv", count=1)
+        aws["media_table"].update_item(
+            Key={"team_id": "team-hv", "sk": "1000#ml-0"},
+            UpdateExpression="SET content_type = :c, hover_key = :h, preview_key = :p",
+            ExpressionAttributeValues={
+                ":c": "video/quicktime",
+                ":h": "previews/team-hv/ml-0/hover.mp4",
+                ":p": "previews/team-hv/ml-0/playback.mp4",
+            },
+        )
+        resp = handle_media_list(make_event(method="GET", path="/media", headers={"x-invite-token": token}))
+        item = json.loads(resp["body"])["items"][0]
+        assert item["hover_url"] == "https://dtest.cloudfront.net/previews/team-hv/ml-0/hover.mp4?sig"
+        assert item["preview_url"] == "https://dtest.cloudfront.net/previews/team-hv/ml-0/playback.mp4?sig"
+
+    def test_blurhash_returned_inline(self, aws):
+        token = self._seed(aws, team_id="team-bh", count=1)
+        aws["media_table"].update_item(
+            Key={"team_id": "team-bh", "sk": "1000#ml-0"},
+            UpdateExpression="SET blurhash = :b",
+            ExpressionAttributeValues={":b": "L7H2vGyZ$.}+,2S*SuWc+LTqN@T0"},
+        )
+        resp = handle_media_list(make_event(method="GET", path="/media", headers={"x-invite-token": token}))
+        assert json.loads(resp["body"])["items"][0]["blurhash"] == "L7H2vGyZ$.}+,2S*SuWc+LTqN@T0"
+
+    def test_sort_by_capture_time(self, aws):
+        token = self._seed(aws, team_id="team-cap", count=3)
+        # Uploaded in order ml-0, ml-1, ml-2 but captured in order ml-2, ml-0, ml-1
+        for media_id, sk, captured in (("ml-0", "1000#ml-0", 200), ("ml-1", "1001#ml-1", 300), ("ml-2", "1002#ml-2", 100)):
+            aws["media_table"].update_item(
+                Key={"team_id": "team-cap", "sk": sk},
+                UpdateExpression="SET capture_sk = :c, captured_at = :t",
+                ExpressionAttributeValues={":c": f"{captured:010d}#{media_id}", ":t": captured},
+            )
+        headers = {"x-invite-token": token}
+        uploaded = json.loads(handle_media_list(make_event(path="/media", headers=headers))["body"])["items"]
+        captured = json.loads(handle_media_list(make_event(path="/media", headers=headers, query="sort=captured"))["body"])["items"]
+        assert [i["media_id"] for i in uploaded] == ["ml-2", "ml-1", "ml-0"]
+        assert [i["media_id"] for i in captured] == ["ml-1", "ml-0", "ml-2"]
+        assert captured[0]["captured_at"] == 300
+
+    def test_no_sources_without_renditions(self, aws):
+        token = self._seed(aws, team_id="team-nors", count=1)
+        resp = handle_media_list(make_event(method="GET", path="/media", headers={"x-invite-token": token}))
+        assert json.loads(resp["body"])["items"][0]["sources"] is None
+
 
 # ---------------------------------------------------------------------------
 # /media (delete)
@@ -193,6 +262,349 @@ class TestMediaDeleteHandler:
         resp = handle_media_delete(event)
         assert resp["statusCode"] == 400
 
+    def test_delete_removes_renditions(self, aws, monkeypatch):
+        monkeypatch.setattr("common.s3._s3", aws["s3"])
+        token, h, record = make_invite_token("team-del", role="admin", token="del-admin-tok3")
+        aws["invites_table"].put_item(Item=record)
+        keys = ["media/team-del/m-r/a.jpg"] + [f"thumbnails/team-del/m-r/{s}.{e}" for s in (256, 512) for e in ("jpg", "webp")]
+        for k in keys:
+            aws["s3"].put_object(Bucket="test-media-bucket", Key=k, Body=b"x")
+        aws["media_table"].put_item(Item={
+            "team_id": "team-del", "sk": "1#m-r", "media_id": "m-r", "gsi1pk": "m-r",
+            "object_key": keys[0], "thumb_key": "thumbnails/team-del/m-r/512.jpg",
+            "renditions": {"sizes": [256, 512], "widths": [256, 512], "heights": [192, 384], "formats": ["webp", "jpeg"]},
+        })
+        event = make_event(method="DELETE", path="/media", headers={"x-invite-token": "del-admin-tok3"}, query="media_id=m-r")
+        assert handle_media_delete(event)["statusCode"] == 200
+        assert aws["s3"].list_objects_v2(Bucket="test-media-bucket").get("KeyCount") == 0
+
+    def test_delete_removes_hls_stream(self, aws, monkeypatch):
+        monkeypatch.setattr("common.s3._s3", aws["s3"])
+        token, h, record = make_invite_token("team-del", role="admin", token="del-admin-tok4")
+        aws["invites_table"].put_item(Item=record)
+        prefix = "streams/team-del/m-v/"
+        keys = ["media/team-del/m-v/a.mov", prefix + "master.m3u8"] + [
+            f"{prefix}{v}p.m3u8" for v in (360, 720)
+        ] + [f"{prefix}{v}p_{i:03d}.ts" for v in (360, 720) for i in range(3)]
+        for k in keys:
+            aws["s3"].put_object(Bucket="test-media-bucket", Key=k, Body=b"x")
+        aws["media_table"].put_item(Item={
+            "team_id": "team-del", "sk": "1#m-v", "media_id": "m-v", "gsi1pk": "m-v",
+            "object_key": keys[0], "stream_key": prefix + "master.m3u8",
+            "stream": {"variants": [360, 720], "segments": [3, 3]},
+        })
+        event = make_event(method="DELETE", path="/media", headers={"x-invite-token": "del-admin-tok4"}, query="media_id=m-v")
+        assert handle_media_delete(event)["statusCode"] == 200
+        assert aws["s3"].list_objects_v2(Bucket="test-media-bucket").get("KeyCount") == 0
+
+
+
+# ---------------------------------------------------------------------------
+# /media/stream (HLS playlists)
+# ---------------------------------------------------------------------------
+class TestMediaStream:
+    MASTER = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=985600,RESOLUTION=640x360\n360p.m3u8\n"
+    VARIANT = "#EXTM3U\n#EXT-X-TARGETDURATION:4\n#EXTINF:4.000000,\n360p_000.ts\n#EXT-X-ENDLIST\n"
+
+    def _setup(self, aws, monkeypatch):
+        import handlers.media_stream as media_stream
+        monkeypatch.setattr("common.streams.CLOUDFRONT_PRIVATE_KEY", "test-private-key")
+        monkeypatch.setattr("common.streams.create_signed_prefix_query", lambda **kw: f"Policy=p&Key-Prefix={kw['key_prefix']}")
+        monkeypatch.setattr(media_stream, "s3", aws["s3"])
+        monkeypatch.setattr(media_stream, "MEDIA_BUCKET", "test-media-bucket")
+        for name, body in (("master.m3u8", self.MASTER), ("360p.m3u8", self.VARIANT)):
+            aws["s3"].put_object(Bucket="test-media-bucket", Key=f"streams/t-hls/m1/{name}", Body=body.encode())
+
+    def _get(self, url):
+        from urllib.parse import urlsplit, parse_qsl
+        from handlers.media_stream import handle_media_stream
+        parts = urlsplit(url)
+        event = make_event(path=parts.path, headers={"host": parts.netloc}, query=parts.query)
+        event["queryStringParameters"] = dict(parse_qsl(parts.query))
+        return handle_media_stream(event)
+
+    def test_list_returns_stream_url_and_playlists_are_signed(self, aws, monkeypatch):
+        self._setup(aws, monkeypatch)
+        token, h, record = make_invite_token("t-hls", role="viewer", token="hls-tok")
+        aws["invites_table"].put_item(Item=record)
+        aws["media_table"].put_item(Item={
+            "team_id": "t-hls", "sk": "1#m1", "media_id": "m1", "content_type": "video/quicktime",
+            "object_key": "media/t-hls/m1/clip.mov", "stream_key": "streams/t-hls/m1/master.m3u8",
+            "stream": {"variants": [360], "segments": [1]},
+        })
+        event = make_event(path="/media", headers={"x-invite-token": token, "host": "api.example.com"})
+        item = json.loads(handle_media_list(event)["body"])["items"][0]
+        assert item["stream_url"].startswith("https://api.example.com/media/stream?team_id=t-hls&media_id=m1&p=master.m3u8&")
+
+        master = self._get(item["stream_url"])
+        assert master["statusCode"] == 200
+        assert master["headers"]["Content-Type"] == "application/vnd.apple.mpegurl"
+        variant_url = master["body"].splitlines()[2]
+        assert variant_url.startswith("https://api.example.com/media/stream?") and "p=360p.m3u8" in variant_url
+
+        variant = self._get(variant_url)
+        assert variant["statusCode"] == 200
+        assert "https://dtest.cloudfront.net/streams/t-hls/m1/360p_000.ts?Policy=p&Key-Prefix=streams/t-hls/m1/" in variant["body"]
+
+    def test_rejects_bad_or_expired_signature(self, aws, monkeypatch):
+        from common.streams import stream_url
+        self._setup(aws, monkeypatch)
+        url = stream_url("https://api.example.com", "t-hls", "m1")
+        assert self._get(url.replace("team_id=t-hls", "team_id=other"))["statusCode"] == 403
+        assert self._get(url.replace("sig=", "sig=0"))["statusCode"] == 403
+        monkeypatch.setattr("common.streams.time.time", lambda: 4_000_000_000)
+        assert self._get(url)["statusCode"] == 403
+
+    def test_rejects_paths_outside_the_stream(self, aws, monkeypatch):
+        from common.streams import stream_url
+        self._setup(aws, monkeypatch)
+        url = stream_url("https://api.example.com", "t-hls", "m1", "../../media/x.m3u8")
+        assert self._get(url)["statusCode"] == 400
+
+    def test_no_stream_without_key(self, aws, monkeypatch):
+        from common.streams import verify_stream_params
+        monkeypatch.setattr("common.streams.CLOUDFRONT_PRIVATE_KEY", "")
+        assert not verify_stream_params("t", "m", "9999999999", "abc")
+
+
+# ---------------------------------------------------------------------------
+# /media/delete-batch
+# ---------------------------------------------------------------------------
+class TestMediaDeleteBatchHandler:
+    def _seed(self, aws, monkeypatch, team_id="team-bd", role="admin", token="bd-tok", items=None):
+        monkeypatch.setattr("common.s3._s3", aws["s3"])
+        _, h, record = make_invite_token(team_id, role=role, token=token)
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": team_id, "used_bytes": 10_000})
+        for media_id, owner, size in items or []:
+            object_key = f"media/{team_id}/{media_id}/photo.jpg"
+            thumb_key = f"thumbnails/{team_id}/{media_id}/thumb.jpg"
+            for key in (object_key, thumb_key):
+                aws["s3"].put_object(Bucket="test-media-bucket", Key=key, Body=b"x")
+            item = {
+                "team_id": team_id,
+                "sk": f"1000#{media_id}",
+                "media_id": media_id,
+                "gsi1pk": media_id,
+                "object_key": object_key,
+                "thumb_key": thumb_key,
+                "size_bytes": size,
+            }
+            if owner:
+                item["uploader_user_id"] = owner
+            aws["media_table"].put_item(Item=item)
+        return token
+
+    def test_admin_deletes_batch(self, aws, monkeypatch):
+        from handlers.media_delete import handle_media_delete_batch
+        token = self._seed(aws, monkeypatch, items=[("b1", "u1", 1000), ("b2", "u2", 2000)])
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        resp = handle_media_delete_batch(event, {"media_ids": ["b1", "b2", "missing"]})
+        assert resp["statusCode"] == 200
+        body = json.loads(resp["body"])
+        assert [r["deleted"] for r in body["results"]] == [True, True, False]
+        assert body["results"][2]["error"]["code"] == "not_found"
+        assert body["deleted_count"] == 2
+        assert body["freed_bytes"] == 3000
+
+        assert aws["media_table"].scan()["Items"] == []
+        assert aws["s3"].list_objects_v2(Bucket="test-media-bucket").get("KeyCount") == 0
+        team = aws["teams_table"].get_item(Key={"team_id": "team-bd"})["Item"]
+        assert team["used_bytes"] == 7000
+
+    def test_overlapping_delete_is_not_subtracted_twice(self, aws, monkeypatch):
+        from handlers import media_delete
+        token = self._seed(aws, monkeypatch, team_id="team-bd3", token="bd-race-tok",
+                           items=[("b1", "u1", 1000), ("b2", "u2", 2000)])
+        real_transact = media_delete.transact_write_items
+        calls = []
+
+        def other_request_first(actions):
+            # Another delete removes b1 (and frees its bytes) after our lookup
+            if not calls:
+                aws["media_table"].delete_item(Key={"team_id": "team-bd3", "sk": "1000#b1"})
+                aws["teams_table"].update_item(
+                    Key={"team_id": "team-bd3"}, UpdateExpression="ADD used_bytes :d",
+                    ExpressionAttributeValues={":d": -1000},
+                )
+            calls.append([a for a in actions if "Delete" in a])
+            real_transact(actions)
+
+        monkeypatch.setattr(media_delete, "transact_write_items", other_request_first)
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        body = json.loads(media_delete.handle_media_delete_batch(event, {"media_ids": ["b1", "b2"]})["body"])
+        # The first transaction is cancelled; the retry deletes only b2
+        assert [len(deletes) for deletes in calls] == [2, 1]
+        assert [r["deleted"] for r in body["results"]] == [False, True]
+        assert body["results"][0]["error"]["code"] == "not_found"
+        assert body["deleted_count"] == 1 and body["freed_bytes"] == 2000
+        assert aws["media_table"].scan()["Items"] == []
+        team = aws["teams_table"].get_item(Key={"team_id": "team-bd3"})["Item"]
+        assert team["used_bytes"] == 7000
+
+    def test_uploader_only_deletes_own(self, aws, monkeypatch):
+        from handlers.media_delete import handle_media_delete_batch
+        from handlers.media_delete import _token_hash
+        owner = _token_hash("bd-up-tok")
+        token = self._seed(aws, monkeypatch, team_id="team-bd2", role="uploader", token="bd-up-tok",
+                           items=[("mine", owner, 500), ("theirs", "someone-else", 700), ("legacy", None, 900)])
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        resp = handle_media_delete_batch(event, {"media_ids": ["mine", "theirs", "legacy"]})
+        body = json.loads(resp["body"])
+        by_id = {r["media_id"]: r for r in body["results"]}
+        assert by_id["mine"]["deleted"] is True
+        assert by_id["theirs"]["error"]["code"] == "forbidden"
+        assert by_id["legacy"]["error"]["code"] == "forbidden"
+        remaining = {i["media_id"] for i in aws["media_table"].scan()["Items"]}
+        assert remaining == {"theirs", "legacy"}
+        team = aws["teams_table"].get_item(Key={"team_id": "team-bd2"})["Item"]
+        assert team["used_bytes"] == 9500
+
+    def test_viewer_cannot_delete(self, aws, monkeypatch):
+        from handlers.media_delete import handle_media_delete_batch
+        token = self._seed(aws, monkeypatch, role="viewer", token="bd-view-tok")
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        resp = handle_media_delete_batch(event, {"media_ids": ["b1"]})
+        assert resp["statusCode"] == 403
+
+    def test_empty_or_oversized_batch_rejected(self, aws, monkeypatch):
+        from handlers.media_delete import handle_media_delete_batch, MAX_BATCH_DELETE
+        token = self._seed(aws, monkeypatch, token="bd-val-tok")
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        assert handle_media_delete_batch(event, {"media_ids": []})["statusCode"] == 400
+        too_many = [f"m{i}" for i in range(MAX_BATCH_DELETE + 1)]
+        assert handle_media_delete_batch(event, {"media_ids": too_many})["statusCode"] == 400
+
+    def test_lookups_run_in_parallel(self, aws, monkeypatch):
+        import threading
+        from handlers import media_delete
+        ids = [f"p{i}" for i in range(8)]
+        token = self._seed(aws, monkeypatch, token="bd-par-tok", items=[(m, None, 100) for m in ids])
+        real_lookup = media_delete.query_media_by_id
+        lock, active, peak = threading.Lock(), [0], [0]
+
+        def slow_lookup(table_name, media_id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return real_lookup(table_name, media_id=media_id)
+
+        monkeypatch.setattr(media_delete, "query_media_by_id", slow_lookup)
+        event = make_event(method="POST", path="/media/delete-batch", headers={"x-invite-token": token})
+        body = json.loads(media_delete.handle_media_delete_batch(event, {"media_ids": ids + ["missing"]})["body"])
+        assert peak[0] > 1
+        assert [r["media_id"] for r in body["results"]] == ids + ["missing"]
+        assert body["deleted_count"] == 8 and body["freed_bytes"] == 800
+
+
+# ---------------------------------------------------------------------------
+# DELETE /teams/{team_id}
+# ---------------------------------------------------------------------------
+class TestTeamsDelete:
+    def test_delete_revokes_all_invites_with_one_write(self, aws):
+        from handlers.teams_delete import handle_teams_delete
+        from handlers.invites_create import handle_invites_create
+        aws["teams_table"].put_item(Item={"team_id": "t-del", "team_name": "Gone FC"})
+        token, h, record = make_invite_token("t-del", role="admin", token="td-admin")
+        aws["invites_table"].put_item(Item=record)
+
+        # An invite issued later still records the (current) epoch
+        created = handle_invites_create(make_event(headers={"x-invite-token": "td-admin"}), {"role": "viewer"})
+        viewer_token = json.loads(created["body"])["invite_token"]
+        assert handle_me(make_event(headers={"x-invite-token": viewer_token}))["statusCode"] == 200
+
+        resp = handle_teams_delete(make_event(method="DELETE", headers={"x-invite-token": "td-admin"}), team_id="t-del")
+        assert resp["statusCode"] == 200
+
+        team = aws["teams_table"].get_item(Key={"team_id": "t-del"})["Item"]
+        assert team["token_epoch"] == 1
+        assert team["deleted_at"]
+        for tok in ("td-admin", viewer_token):
+            assert handle_me(make_event(headers={"x-invite-token": tok}))["statusCode"] == 401
+
+
+# ---------------------------------------------------------------------------
+# /coach/teams
+# ---------------------------------------------------------------------------
+class TestCoachTeams:
+    def _seed(self, aws, monkeypatch):
+        monkeypatch.setattr("handlers.coach_teams.dynamodb", aws["dynamodb"])
+        ddb = aws["dynamodb"]
+        ddb.Table("UserTokens").put_item(Item={"token_hash": "coach-tok", "user_id": "u-1", "coach_verified": True})
+        members = ddb.Table("TeamMembers")
+        token, h, record = make_invite_token("t-a", role="admin", token="a-admin")
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "t-a", "team_name": "A FC", "used_bytes": 1024})
+        aws["teams_table"].put_item(Item={"team_id": "t-b", "team_name": "B FC"})
+        aws["teams_table"].put_item(Item={"team_id": "t-gone", "team_name": "Gone", "deleted_at": 1})
+        members.put_item(Item={"user_id": "u-1", "team_id": "t-a", "role": "admin", "invite_token": "a-admin"})
+        members.put_item(Item={"user_id": "u-1", "team_id": "t-b", "role": "coach"})
+        members.put_item(Item={"user_id": "u-1", "team_id": "t-gone", "role": "admin"})
+        members.put_item(Item={"user_id": "u-1", "team_id": "t-v", "role": "viewer"})
+        now = int(time.time())
+        for i, ts in enumerate((now - 60, now - 8 * 86400)):
+            aws["media_table"].put_item(Item={"team_id": "t-a", "sk": f"{ts}#m{i}", "created_at": ts})
+
+    def test_returns_admin_teams_with_usage_and_activity(self, aws, monkeypatch):
+        from handlers.coach_teams import handle_get_coach_teams
+        self._seed(aws, monkeypatch)
+        resp = handle_get_coach_teams(make_event(headers={"x-user-token": "coach-tok"}))
+        assert resp["statusCode"] == 200
+        body = json.loads(resp["body"])
+        teams = {t["team_id"]: t for t in body["teams"]}
+        assert set(teams) == {"t-a", "t-b"}
+        assert body["coach_verified"] is True
+
+        a = teams["t-a"]
+        assert "invite_token" not in a
+        assert a["usage"]["used_bytes"] == 1024
+        assert a["activity"]["uploads_7d"] == 1
+        assert a["activity"]["last_upload_at"] is not None
+        assert teams["t-b"]["activity"] == {"last_upload_at": None, "uploads_7d": 0, "uploads_7d_capped": False}
+
+    def _token(self, team_id):
+        from handlers.coach_teams import handle_coach_team_token
+        return handle_coach_team_token(make_event("POST", "/coach/teams/token", headers={"x-user-token": "coach-tok"}), {"team_id": team_id})
+
+    def test_issues_token_and_revokes_the_previous_one(self, aws, monkeypatch):
+        self._seed(aws, monkeypatch)
+        monkeypatch.setattr("common.auth.DYNAMODB", aws["dynamodb"])
+        first = json.loads(self._token("t-b")["body"])["invite_token"]
+        second = json.loads(self._token("t-b")["body"])["invite_token"]
+        assert first != second
+        assert handle_me(make_event(headers={"x-invite-token": first}))["statusCode"] == 401
+        assert handle_me(make_event(headers={"x-invite-token": second}))["statusCode"] == 200
+        # Only hashes are stored; the team's other admin invites are left alone
+        stored = aws["invites_table"].scan()["Items"]
+        assert all(second not in i.values() for i in stored)
+        assert handle_me(make_event(headers={"x-invite-token": "a-admin"}))["statusCode"] == 200
+
+    def test_token_follows_the_team_epoch(self, aws, monkeypatch):
+        self._seed(aws, monkeypatch)
+        monkeypatch.setattr("common.auth.DYNAMODB", aws["dynamodb"])
+        aws["teams_table"].update_item(Key={"team_id": "t-a"}, UpdateExpression="SET token_epoch = :e", ExpressionAttributeValues={":e": 1})
+        token = json.loads(self._token("t-a")["body"])["invite_token"]
+        assert handle_me(make_event(headers={"x-invite-token": token}))["statusCode"] == 200
+        # The raw token an older membership row carried is dropped
+        member = aws["dynamodb"].Table("TeamMembers").get_item(Key={"user_id": "u-1", "team_id": "t-a"})["Item"]
+        assert "invite_token" not in member
+
+    def test_token_requires_an_admin_membership(self, aws, monkeypatch):
+        self._seed(aws, monkeypatch)
+        monkeypatch.setattr("common.auth.DYNAMODB", aws["dynamodb"])
+        assert self._token("t-v")["statusCode"] == 403
+        assert self._token("t-other")["statusCode"] == 403
+        assert self._token("t-gone")["statusCode"] == 404
+
+    def test_unknown_user_token(self, aws, monkeypatch):
+        from handlers.coach_teams import handle_get_coach_teams
+        monkeypatch.setattr("handlers.coach_teams.dynamodb", aws["dynamodb"])
+        resp = handle_get_coach_teams(make_event(headers={"x-user-token": "nope"}))
+        assert resp["statusCode"] == 401
+
 
 # ---------------------------------------------------------------------------
 # /media/upload-url (presign upload)
@@ -235,6 +647,35 @@ class TestMediaPresignUpload:
         })
         assert resp["statusCode"] == 400
 
+    def test_sort_key_travels_as_signed_metadata(self, aws):
+        from handlers.media_presign_upload import handle_media_presign_upload
+        token, h, record = make_invite_token("t-up4", role="uploader", token="up-sk")
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "t-up4", "storage_limit_bytes": 10**10, "used_bytes": 0})
+        event = make_event(headers={"x-invite-token": "up-sk"})
+        resp = handle_media_presign_upload(event, {
+            "filename": "photo.jpg", "content_type": "image/jpeg", "size_bytes": 100, "forward_headers": True,
+        })
+        assert resp["statusCode"] == 200
+        body = json.loads(resp["body"])
+        sk = body["required_headers"]["x-amz-meta-media-sk"]
+        assert sk.endswith("#" + body["media_id"])
+        assert "x-amz-meta-media-sk" in body["upload_url"]
+
+    def test_clients_without_forward_headers_get_an_unsigned_metadata_url(self, aws):
+        """Cached clients that only send content-type must still be able to PUT."""
+        from handlers.media_presign_upload import handle_media_presign_upload
+        token, h, record = make_invite_token("t-up5", role="uploader", token="up-old")
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "t-up5", "storage_limit_bytes": 10**10, "used_bytes": 0})
+        event = make_event(headers={"x-invite-token": "up-old"})
+        resp = handle_media_presign_upload(event, {
+            "filename": "photo.jpg", "content_type": "image/jpeg", "size_bytes": 100
+        })
+        body = json.loads(resp["body"])
+        assert body["required_headers"] == {"content-type": "image/jpeg"}
+        assert "x-amz-meta" not in body["upload_url"]
+
 
 # ---------------------------------------------------------------------------
 # /media/complete
@@ -271,6 +712,64 @@ class TestMediaComplete:
         # S3 object doesn't exist → 409 conflict
         assert resp["statusCode"] == 409
 
+    def test_merges_with_thumbnail_upsert(self, aws, monkeypatch):
+        """Derivatives written before /media/complete survive; the sort key comes from S3 metadata."""
+        from handlers.media_complete import handle_media_complete
+        import handlers.media_complete as media_complete
+        monkeypatch.setattr(media_complete, "s3", aws["s3"])
+        monkeypatch.setattr(media_complete, "MEDIA_BUCKET", "test-media-bucket")
+        token, h, record = make_invite_token("t-mc3", role="uploader", token="mc-tok3")
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "t-mc3", "storage_limit_bytes": 10**10, "used_bytes": 0})
+        aws["s3"].put_object(
+            Bucket="test-media-bucket", Key="media/t-mc3/m3/photo.jpg", Body=b"x",
+            Metadata={"media-sk": "1700000000#m3"},
+        )
+        # Thumbnail stage finished first and upserted its fields
+        aws["media_table"].put_item(Item={
+            "team_id": "t-mc3", "sk": "1700000000#m3",
+            "thumb_key": "thumbnails/t-mc3/m3/512.jpg", "capture_sk": "1600000000#m3",
+        })
+
+        event = make_event(headers={"x-invite-token": "mc-tok3"})
+        resp = handle_media_complete(event, {
+            "media_id": "m3",
+            "object_key": "media/t-mc3/m3/photo.jpg",
+            "filename": "photo.jpg",
+            "content_type": "image/jpeg",
+            "size_bytes": 1,
+        })
+        assert resp["statusCode"] == 201
+
+        items = aws["media_table"].scan()["Items"]
+        assert len(items) == 1
+        item = items[0]
+        assert item["sk"] == "1700000000#m3"
+        assert item["object_key"] == "media/t-mc3/m3/photo.jpg"
+        assert item["gsi1pk"] == "m3"
+        assert item["thumb_key"] == "thumbnails/t-mc3/m3/512.jpg"
+        assert item["capture_sk"] == "1600000000#m3"
+
+    def test_upload_without_metadata_gets_a_sort_key(self, aws, monkeypatch):
+        """Older clients PUT without x-amz-meta-media-sk; complete chooses the key and gsi1 finds it."""
+        from handlers.media_complete import handle_media_complete
+        from common.db import query_media_by_id
+        import handlers.media_complete as media_complete
+        monkeypatch.setattr(media_complete, "s3", aws["s3"])
+        monkeypatch.setattr(media_complete, "MEDIA_BUCKET", "test-media-bucket")
+        token, h, record = make_invite_token("t-mc4", role="uploader", token="mc-tok4")
+        aws["invites_table"].put_item(Item=record)
+        aws["teams_table"].put_item(Item={"team_id": "t-mc4", "storage_limit_bytes": 10**10, "used_bytes": 0})
+        aws["s3"].put_object(Bucket="test-media-bucket", Key="media/t-mc4/m4/photo.jpg", Body=b"x")
+
+        resp = handle_media_complete(make_event(headers={"x-invite-token": "mc-tok4"}), {
+            "media_id": "m4", "object_key": "media/t-mc4/m4/photo.jpg",
+            "filename": "photo.jpg", "content_type": "image/jpeg", "size_bytes": 1,
+        })
+        assert resp["statusCode"] == 201
+        item = query_media_by_id("Media", "m4")
+        assert item["team_id"] == "t-mc4" and item["sk"].endswith("#m4")
+
 
 # ---------------------------------------------------------------------------
 # /billing/webhook
@@ -0,0 +1,77 @@
+"""Tests for scripts/replicate_prod_to_staging.py – incremental media bucket replication."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import replicate_prod_to_staging as replicate
+
+PROD, STAGING = "prod-media", "staging-media"
+
+
+@pytest.fixture
+def buckets(aws, monkeypatch, tmp_path):
+    for bucket in (PROD, STAGING):
+        aws["s3"].create_bucket(Bucket=bucket)
+    monkeypatch.setattr(replicate, "REGION", "us-east-1")
+    copied = []
+    real_copy = replicate.copy_one
+
+    def record(s3, source_bucket, dest_bucket, key, size):
+        copied.append(key)
+        return real_copy(s3, source_bucket, dest_bucket, key, size)
+
+    monkeypatch.setattr(replicate, "copy_one", record)
+    return {"s3": aws["s3"], "copied": copied, "manifest": str(tmp_path / "manifest.json")}
+
+
+def _run(env):
+    env["copied"].clear()
+    assert replicate.replicate_s3(PROD, STAGING, dry_run=False, workers=4, manifest_path=env["manifest"])
+    return sorted(env["copied"])
+
+
+def test_rerun_copies_only_new_and_changed_objects(buckets):
+    s3 = buckets["s3"]
+    keys = ["media/t1/a/photo.jpg", "media/t1/b/clip.mp4", "thumbnails/t1/a/512.jpg", "media/t2/c/photo.jpg"]
+    for key in keys:
+        s3.put_object(Bucket=PROD, Key=key, Body=key.encode())
+    assert _run(buckets) == sorted(keys)
+    assert s3.get_object(Bucket=STAGING, Key="media/t2/c/photo.jpg")["Body"].read() == b"media/t2/c/photo.jpg"
+
+    # Nothing changed: nothing copied
+    assert _run(buckets) == []
+
+    s3.put_object(Bucket=PROD, Key="media/t1/a/photo.jpg", Body=b"re-encoded")
+    s3.put_object(Bucket=PROD, Key="previews/t1/a/1600.jpg", Body=b"new")
+    assert _run(buckets) == ["media/t1/a/photo.jpg", "previews/t1/a/1600.jpg"]
+    assert s3.get_object(Bucket=STAGING, Key="media/t1/a/photo.jpg")["Body"].read() == b"re-encoded"
+
+
+def test_manifest_covers_copies_whose_etag_differs(buckets, monkeypatch):
+    s3 = buckets["s3"]
+    s3.put_object(Bucket=PROD, Key="media/t1/big/clip.mp4", Body=b"0123456789" * 8)
+    copied = buckets["copied"]
+
+    def multipart_like(s3, source_bucket, dest_bucket, key, size):
+        # Stand-in for a multipart copy: staging's ETag never equals prod's
+        copied.append(key)
+        body = s3.get_object(Bucket=source_bucket, Key=key)["Body"].read()
+        return s3.put_object(Bucket=dest_bucket, Key=key, Body=body[::-1])["ETag"].strip('"')
+
+    monkeypatch.setattr(replicate, "copy_one", multipart_like)
+    assert _run(buckets) == ["media/t1/big/clip.mp4"]
+    assert _run(buckets) == []
+
+    # Without the manifest the differing ETags force a copy
+    os.remove(buckets["manifest"])
+    assert _run(buckets) == ["media/t1/big/clip.mp4"]
+
+
+def test_dry_run_copies_nothing(buckets):
+    buckets["s3"].put_object(Bucket=PROD, Key="media/t1/a/photo.jpg", Body=b"a")
+    assert replicate.replicate_s3(PROD, STAGING, dry_run=True, workers=2, manifest_path=buckets["manifest"])
+    assert buckets["copied"] == [] and not os.path.exists(buckets["manifest"])
+    assert buckets["s3"].list_objects_v2(Bucket=STAGING).get("KeyCount") == 0
@@ -0,0 +1,196 @@
+"""Tests for jobs/storage_reconcile.py – used_bytes vs media records, every team."""
+import json
+import time
+
+import pytest
+
+from conftest import make_event, make_invite_token
+from jobs import storage_reconcile
+from jobs.storage_reconcile import reconcile_team
+
+BUCKET = "test-media-bucket"
+OLD = int(time.time()) - 86400
+
+
+@pytest.fixture
+def recon_env(aws, monkeypatch):
+    monkeypatch.setattr("common.s3._s3", aws["s3"])
+    return aws
+
+
+def _team(aws, team_id, used_bytes=None, **extra):
+    item = {"team_id": team_id, **extra}
+    if used_bytes is not None:
+        item["used_bytes"] = used_bytes
+    aws["teams_table"].put_item(Item=item)
+
+
+def _media(aws, team_id, media_id, size, created_at=OLD, stored=None):
+    key = f"media/{team_id}/{media_id}/original.jpg"
+    aws["media_table"].put_item(Item={
+        "team_id": team_id, "sk": f"{created_at}#{media_id}", "media_id": media_id,
+        "object_key": key, "size_bytes": size, "created_at": created_at,
+    })
+    aws["s3"].put_object(Bucket=BUCKET, Key=key, Body=b"x" * (size if stored is None else stored))
+
+
+def _used(aws, team_id):
+    return aws["teams_table"].get_item(Key={"team_id": team_id})["Item"].get("used_bytes")
+
+
+class TestReconcileTeam:
+    def test_in_sync(self, recon_env):
+        _team(recon_env, "t1", used_bytes=30)
+        _media(recon_env, "t1", "a", 10)
+        _media(recon_env, "t1", "b", 20)
+        report = reconcile_team("t1")
+        assert report["status"] == "in_sync" and report["drift"] == 0 and report["items"] == 2
+
+    def test_corrects_drift_and_ignores_partial_records(self, recon_env):
+        _team(recon_env, "t1", used_bytes=500)
+        _media(recon_env, "t1", "a", 10)
+        # Upserted by the thumbnail Lambda, never finalized: not counted
+        recon_env["media_table"].put_item(Item={"team_id": "t1", "sk": "1#partial", "thumb_key": "thumbnails/t1/partial/512.jpg"})
+        report = reconcile_team("t1")
+        assert report["status"] == "corrected" and report["drift"] == 490
+        assert _used(recon_env, "t1") == 10
+
+    def test_dry_run_writes_nothing(self, recon_env):
+        _team(recon_env, "t1", used_bytes=0)
+        _media(recon_env, "t1", "a", 10)
+        report = reconcile_team("t1", dry_run=True)
+        assert report["status"] == "drift" and report["drift"] == -10
+        assert _used(recon_env, "t1") == 0
+
+    def test_concurrent_upload_is_not_clobbered(self, recon_env, monkeypatch):
+        from common.db import transact_write_items, used_bytes_action
+        _team(recon_env, "t1", used_bytes=999, usage_version=4)
+        _media(recon_env, "t1", "a", 10)
+        real_totals = storage_reconcile.record_totals
+        calls = []
+
+        def totals_then_upload(team_id):
+            totals = real_totals(team_id)
+            if not calls:
+                # /media/complete lands between the read and the write
+                transact_write_items([
+                    {"Put": {"TableName": "Media", "Item": {
+                        "team_id": team_id, "sk": "2#b", "media_id": "b", "object_key": "media/t1/b/x.jpg", "size_bytes": 5,
+                    }}},
+                    used_bytes_action("Teams", team_id, 5),
+                ])
+            calls.append(team_id)
+            return totals
+
+        monkeypatch.setattr(storage_reconcile, "record_totals", totals_then_upload)
+        report = reconcile_team("t1")
+        assert report["status"] == "corrected" and report["attempts"] == 2
+        assert report["used_bytes"] == 1004 and _used(recon_env, "t1") == 15
+
+    def test_legacy_team_without_usage_version(self, recon_env, monkeypatch):
+        _team(recon_env, "t1", used_bytes=999)
+        _media(recon_env, "t1", "a", 10)
+        real_totals = storage_reconcile.record_totals
+
+        def totals_then_bump(team_id):
+            totals = real_totals(team_id)
+            recon_env["teams_table"].update_item(
+                Key={"team_id": team_id}, UpdateExpression="ADD usage_version :one",
+                ExpressionAttributeValues={":one": 1},
+            )
+            return totals
+
+        monkeypatch.setattr(storage_reconcile, "record_totals", totals_then_bump)
+        assert reconcile_team("t1")["status"] == "conflict"
+        assert _used(recon_env, "t1") == 999
+
+    def test_s3_comparison_counts_derivatives(self, recon_env):
+        _team(recon_env, "t1", used_bytes=10)
+        _media(recon_env, "t1", "a", 10, stored=12)
+        recon_env["s3"].put_object(Bucket=BUCKET, Key="media/t1/orphan/clip.mp4", Body=b"x" * 7)
+        recon_env["s3"].put_object(Bucket=BUCKET, Key="thumbnails/t1/a/512.jpg", Body=b"x" * 3)
+        recon_env["s3"].put_object(Bucket=BUCKET, Key="previews/t1/a/1600.jpg", Body=b"x" * 4)
+        report = reconcile_team("t1", include_s3=True)
+        assert report["status"] == "in_sync"
+        assert report["s3_original_bytes"] == 19 and report["s3_unrecorded_bytes"] == 7
+        assert report["s3_size_mismatches"] == 1 and report["s3_missing_originals"] == 0
+        assert report["s3_derived_bytes"] == 7
+
+    def test_unknown_team(self, recon_env):
+        assert reconcile_team("nope")["status"] == "not_found"
+
+
+class TestDeleteRace:
+    """A media delete racing the reconcile must not have its bytes subtracted twice."""
+
+    def _seed(self, env):
+        _team(env, "t1", used_bytes=999, usage_version=5)
+        _media(env, "t1", "a", 10)
+        _media(env, "t1", "b", 20)
+        # media delete finds the record by media_id on gsi1
+        item = env["media_table"].get_item(Key={"team_id": "t1", "sk": f"{OLD}#b"})["Item"]
+        env["media_table"].put_item(Item={**item, "gsi1pk": "b"})
+        token, _, invite = make_invite_token("t1", role="admin", token="recon-admin")
+        env["invites_table"].put_item(Item=invite)
+        return make_event("DELETE", "/media", headers={"x-invite-token": token}, query="media_id=b")
+
+    def test_reconcile_during_the_delete(self, recon_env, monkeypatch):
+        from handlers import media_delete
+        event = self._seed(recon_env)
+        real_transact = media_delete.transact_write_items
+        reports = []
+
+        def reconcile_then_commit(actions):
+            # The record is still there and used_bytes not yet decremented: both
+            # change in the one transaction below, never one without the other
+            reports.append(reconcile_team("t1"))
+            real_transact(actions)
+
+        monkeypatch.setattr(media_delete, "transact_write_items", reconcile_then_commit)
+        assert media_delete.handle_media_delete(event)["statusCode"] == 200
+        assert reports[0]["status"] == "corrected" and reports[0]["record_bytes"] == 30
+        assert _used(recon_env, "t1") == 10
+
+    def test_delete_during_the_sum(self, recon_env, monkeypatch):
+        from handlers import media_delete
+        event = self._seed(recon_env)
+        real_totals = storage_reconcile.record_totals
+        deleted = []
+
+        def totals_then_delete(team_id):
+            totals = real_totals(team_id)
+            if not deleted:
+                deleted.append(media_delete.handle_media_delete(event)["statusCode"])
+            return totals
+
+        monkeypatch.setattr(storage_reconcile, "record_totals", totals_then_delete)
+        report = reconcile_team("t1")
+        assert deleted == [200]
+        assert report["status"] == "corrected" and report["attempts"] == 2
+        assert _used(recon_env, "t1") == 10
+        assert reconcile_team("t1")["status"] == "in_sync"
+
+
+def test_handler_reports_only_drifted_teams(recon_env):
+    _team(recon_env, "ok", used_bytes=10)
+    _media(recon_env, "ok", "a", 10)
+    _team(recon_env, "off", used_bytes=50)
+    _media(recon_env, "off", "b", 20)
+    _team(recon_env, "gone", used_bytes=50, deleted_at=OLD)
+    result = storage_reconcile.handler({}, None)
+    assert result["teams_checked"] == 2 and result["statuses"] == {"in_sync": 1, "corrected": 1}
+    assert result["drift_teams"] == 1 and result["drift_bytes"] == 30
+    assert [r["team_id"] for r in result["reports"]] == ["off"]
+    assert _used(recon_env, "gone") == 50
+
+
+def test_admin_repair_storage_uses_conditional_reconcile(recon_env):
+    from handlers.admin_repair_storage import handle_admin_repair_storage
+
+    _team(recon_env, "t1", used_bytes=3)
+    _media(recon_env, "t1", "a", 10)
+    resp = handle_admin_repair_storage(make_event("POST", "/admin/repair-storage", headers={"x-setup-key": "test-setup-key"}, query="team_id=t1"))
+    body = json.loads(resp["body"])
+    assert resp["statusCode"] == 200
+    assert body["status"] == "corrected" and body["total_bytes"] == 10 and body["previous_bytes"] == 3
+    assert _used(recon_env, "t1") == 10
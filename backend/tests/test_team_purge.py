@@ -0,0 +1,153 @@
+"""Tests for jobs/team_purge.py – resumable purge of soft-deleted teams."""
+import time
+
+import pytest
+
+from jobs import team_purge
+from jobs.team_purge import purge_team, find_purge_candidates, is_purge_due
+
+DAY = 86400
+
+
+class _FakeContext:
+    """Lambda context stand-in that runs out of time after N checks."""
+    def __init__(self, checks_before_timeout):
+        self.remaining = checks_before_timeout
+
+    def get_remaining_time_in_millis(self):
+        self.remaining -= 1
+        return 60_000 if self.remaining > 0 else 0
+
+
+@pytest.fixture
+def purge_env(aws, monkeypatch):
+    monkeypatch.setattr("common.s3._s3", aws["s3"])
+    return aws
+
+
+def _seed_team(aws, team_id="team-purge", deleted_days_ago=40, media_count=3, audit_count=2):
+    now = int(time.time())
+    team = {"team_id": team_id, "team_name": "Old Team"}
+    if deleted_days_ago is not None:
+        team["deleted_at"] = now - deleted_days_ago * DAY
+    aws["teams_table"].put_item(Item=team)
+
+    for i in range(media_count):
+        media_id = f"{team_id}-m{i}"
+        keys = {
+            "object_key": f"media/{team_id}/{media_id}/photo.jpg",
+            "thumb_key": f"thumbnails/{team_id}/{media_id}/thumb.jpg",
+            "preview_key": f"previews/{team_id}/{media_id}/preview.jpg",
+        }
+        for key in keys.values():
+            aws["s3"].put_object(Bucket="test-media-bucket", Key=key, Body=b"x")
+        aws["media_table"].put_item(Item={
+            "team_id": team_id, "sk": f"{1000 + i}#{media_id}", "media_id": media_id,
+            "gsi1pk": media_id, "size_bytes": 100, **keys,
+        })
+
+    # Orphan left behind by an abandoned upload (no media record)
+    aws["s3"].put_object(Bucket="test-media-bucket", Key=f"media/{team_id}/orphan/clip.mp4", Body=b"x")
+
+    aws["invites_table"].put_item(Item={"token_hash": f"{team_id}-admin", "team_id": team_id, "role": "admin"})
+
+    for i in range(audit_count):
+        aws["audit_table"].put_item(Item={"team_id": team_id, "sk": f"{1000 + i}#e{i}", "action": "media_list"})
+
+
+def _objects(aws, team_id):
+    keys = []
+    for prefix in ("media", "thumbnails", "previews"):
+        resp = aws["s3"].list_objects_v2(Bucket="test-media-bucket", Prefix=f"{prefix}/{team_id}/")
+        keys.extend(o["Key"] for o in resp.get("Contents", []))
+    return keys
+
+
+class TestIsPurgeDue:
+    def test_grace_period(self):
+        now = 100 * DAY
+        assert is_purge_due({"deleted_at": now - 31 * DAY}, 30, now) is True
+        assert is_purge_due({"deleted_at": now - 29 * DAY}, 30, now) is False
+
+    def test_active_or_purged_team(self):
+        assert is_purge_due({}, 0, 1) is False
+        assert is_purge_due({"deleted_at": 1, "purged_at": 2}, 0, 10) is False
+
+
+class TestPurgeTeam:
+    def test_purges_everything(self, purge_env):
+        _seed_team(purge_env)
+        report = purge_team("team-purge", grace_days=30)
+
+        assert report["status"] == "purged"
+        assert report["items"] == 3
+        assert report["objects"] == 9
+        assert report["swept_objects"] == 1
+        assert report["audit_events"] == 2
+        assert report["invites"] == 1
+        assert report["bytes"] == 300
+        assert "items_per_s" in report and "mb_per_s" in report
+
+        assert purge_env["media_table"].scan()["Items"] == []
+        assert purge_env["audit_table"].scan()["Items"] == []
+        assert purge_env["invites_table"].scan()["Items"] == []
+        assert _objects(purge_env, "team-purge") == []
+        team = purge_env["teams_table"].get_item(Key={"team_id": "team-purge"})["Item"]
+        assert team["purged_at"]
+        assert team["purge_state"]["phase"] == "done"
+
+    def test_honors_grace_period(self, purge_env):
+        _seed_team(purge_env, deleted_days_ago=5)
+        report = purge_team("team-purge", grace_days=30)
+        assert report["status"] == "not_due"
+        assert len(purge_env["media_table"].scan()["Items"]) == 3
+
+    def test_active_team_not_purged(self, purge_env):
+        _seed_team(purge_env, deleted_days_ago=None)
+        assert purge_team("team-purge", grace_days=0)["status"] == "not_due"
+
+    def test_other_teams_untouched(self, purge_env):
+        _seed_team(purge_env)
+        _seed_team(purge_env, team_id="team-live", deleted_days_ago=None)
+        purge_team("team-purge", grace_days=30)
+        assert len(purge_env["media_table"].scan()["Items"]) == 3
+        assert len(_objects(purge_env, "team-live")) == 10
+
+    def test_dry_run_deletes_nothing(self, purge_env):
+        _seed_team(purge_env)
+        report = purge_team("team-purge", grace_days=30, dry_run=True)
+        assert report["status"] == "purged"
+        assert report["items"] == 3
+        assert len(purge_env["media_table"].scan()["Items"]) == 3
+        assert len(_objects(purge_env, "team-purge")) == 10
+        team = purge_env["teams_table"].get_item(Key={"team_id": "team-purge"})["Item"]
+        assert "purged_at" not in team
+
+    def test_resumes_from_checkpoint(self, purge_env, monkeypatch):
+        monkeypatch.setattr(team_purge, "PAGE_SIZE", 1)
+        _seed_team(purge_env)
+
+        first = purge_team("team-purge", grace_days=30, context=_FakeContext(3))
+        assert first["status"] == "in_progress"
+        team = purge_env["teams_table"].get_item(Key={"team_id": "team-purge"})["Item"]
+        assert team["purge_state"]["phase"] == "media"
+        assert len(purge_env["media_table"].scan()["Items"]) == 1
+
+        second = purge_team("team-purge", grace_days=30)
+        assert second["status"] == "purged"
+        assert second["items"] == 3
+        assert purge_env["media_table"].scan()["Items"] == []
+        assert _objects(purge_env, "team-purge") == []
+
+
+class TestFindCandidates:
+    def test_only_due_teams(self, purge_env):
+        _seed_team(purge_env, team_id="due", media_count=0, audit_count=0)
+        _seed_team(purge_env, team_id="recent", deleted_days_ago=1, media_count=0, audit_count=0)
+        _seed_team(purge_env, team_id="live", deleted_days_ago=None, media_count=0, audit_count=0)
+        assert find_purge_candidates(grace_days=30) == ["due"]
+
+    def test_handler_purges_given_team(self, purge_env):
+        _seed_team(purge_env)
+        result = team_purge.handler({"team_id": "team-purge"}, None)
+        assert result["reports"][0]["status"] == "purged"
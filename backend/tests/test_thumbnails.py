@@ -1,6 +1,10 @@
 """Tests for thumbs/thumbnail_handler.py – thumbnail and preview generation."""
 import os
 import io
+import json
+import shutil
+
+import pytest
 
 # thumbnail_handler reads os.environ at module level—set before import
 os.environ.setdefault("TABLE_MEDIA", "Media")
@@ -140,7 +144,7 @@ class TestMakeVideoThumb:
 
         monkeypatch.setattr(subprocess, "run", fake_run)
 
-        result = thumbnail_handler._make_video_thumb(b"fake-video-bytes")
+        result = thumbnail_handler._make_video_thumb("https://bucket.s3.amazonaws.com/media/t/m/clip.mp4?X-Amz-Signature=x")
 
         im = Image.open(io.BytesIO(result))
         assert im.format == "JPEG"
@@ -151,11 +155,1009 @@ class TestMakeVideoThumb:
         import subprocess
         from thumbs import thumbnail_handler
 
+        seeks = []
+
         def fake_run(cmd, **kwargs):
-            raise subprocess.CalledProcessError(1, cmd)
+            seeks.append(cmd[cmd.index("-ss") + 1])
+            return subprocess.CompletedProcess(cmd, 1)
 
         monkeypatch.setattr(subprocess, "run", fake_run)
 
         import pytest
         with pytest.raises(subprocess.CalledProcessError):
-            thumbnail_handler._make_video_thumb(b"bad-video")
+            thumbnail_handler._make_video_thumb("https://bucket.s3.amazonaws.com/media/t/m/bad.mp4")
+        # Every seek was tried before giving up
+        assert seeks == ["00:00:01", "00:00:00"]
+
+    def test_first_seek_failing_falls_back(self, monkeypatch):
+        """ffmpeg exiting nonzero at 1s must not stop the first-frame attempt."""
+        import subprocess
+        from thumbs import thumbnail_handler
+
+        seeks = []
+
+        def fake_run(cmd, **kwargs):
+            seek = cmd[cmd.index("-ss") + 1]
+            seeks.append(seek)
+            if seek == "00:00:01":
+                return subprocess.CompletedProcess(cmd, 1)
+            Image.new("RGB", (10, 10)).save(cmd[-1], format="JPEG")
+            return subprocess.CompletedProcess(cmd, 0)
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+        monkeypatch.setattr(thumbnail_handler, "pick_poster", None)
+        thumb = thumbnail_handler._make_video_thumb("https://example.com/clip.mp4", duration_ms=5000)
+        assert Image.open(io.BytesIO(thumb)).format == "JPEG"
+        assert seeks == ["00:00:01", "00:00:00"]
+
+    def test_falls_back_to_first_frame_for_short_clips(self, monkeypatch):
+        """ffmpeg writes nothing when seeking past the end of a sub-second clip."""
+        import subprocess
+        from thumbs import thumbnail_handler
+
+        seeks = []
+
+        def fake_run(cmd, **kwargs):
+            seek = cmd[cmd.index("-ss") + 1]
+            seeks.append(seek)
+            if seek == "00:00:00":
+                Image.new("RGB", (10, 10)).save(cmd[-1], format="JPEG")
+            return subprocess.CompletedProcess(cmd, 0)
+
+        monkeypatch.setattr(subprocess, "run", fake_run)
+        assert thumbnail_handler._make_video_thumb("https://example.com/short.mp4")
+        assert seeks == ["00:00:01", "00:00:00"]
+
+        # Known to be shorter than the seek offset: straight to the first frame
+        seeks.clear()
+        monkeypatch.setattr(thumbnail_handler, "pick_poster", None)
+        assert thumbnail_handler._make_video_thumb("https://example.com/short.mp4", duration_ms=400)
+        assert seeks == ["00:00:00"]
+
+    def test_handler_streams_video_from_presigned_url(self, monkeypatch):
+        """The video branch never downloads the object; ffmpeg gets a presigned URL."""
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+
+        fake_s3 = MagicMock()
+        fake_s3.head_object.return_value = {"ContentType": "video/mp4"}
+        fake_s3.generate_presigned_url.return_value = "https://signed.example/clip.mp4"
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        # No media-sk metadata and no record yet: nothing to link
+        fake_ddb = MagicMock()
+        fake_ddb.query.return_value = {"Items": []}
+        monkeypatch.setattr(thumbnail_handler, "ddb", fake_ddb)
+        sources = []
+        monkeypatch.setattr(thumbnail_handler, "_make_video_thumb", lambda src, duration_ms=None: sources.append(src) or b"jpeg")
+
+        event = {"Records": [{"s3": {"bucket": {"name": "b"}, "object": {"key": "media/t1/m1/clip.mp4"}}}]}
+        thumbnail_handler.handler(event, None)
+
+        assert sources == ["https://signed.example/clip.mp4"]
+        fake_s3.get_object.assert_not_called()
+        fake_s3.put_object.assert_called_once()
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+class TestVideoThumbOverHttp:
+    """Real ffmpeg against a local Range-capable HTTP server."""
+
+    @pytest.fixture
+    def server(self, tmp_path):
+        import functools
+        import http.server
+        import threading
+
+        served = {"bytes": 0, "ranges": 0}
+
+        class RangeHandler(http.server.SimpleHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.translate_path(self.path)
+                size = os.path.getsize(path)
+                start, end = 0, size - 1
+                rng = self.headers.get("Range")
+                if rng:
+                    served["ranges"] += 1
+                    first, _, last = rng.split("=")[1].partition("-")
+                    start = int(first)
+                    end = int(last) if last else size - 1
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    try:
+                        while remaining > 0:
+                            chunk = f.read(min(65536, remaining))
+                            self.wfile.write(chunk)
+                            served["bytes"] += len(chunk)
+                            remaining -= len(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+        httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RangeHandler, directory=str(tmp_path)))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{httpd.server_address[1]}", tmp_path, served
+        httpd.shutdown()
+
+    def _encode(self, path, seconds, faststart):
+        import subprocess
+        cmd = [
+            "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=30:duration={seconds}",
+            "-pix_fmt", "yuv420p", "-g", "30",
+        ]
+        if faststart:
+            cmd += ["-movflags", "+faststart"]
+        subprocess.run(cmd + [str(path)], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @pytest.mark.parametrize("name,faststart", [("front.mp4", True), ("moov_at_end.mov", False), ("moov_at_end.mp4", False)])
+    def test_poster_from_url(self, server, name, faststart):
+        from thumbs import thumbnail_handler
+        base, root, served = server
+        self._encode(root / name, 20, faststart)
+
+        out = thumbnail_handler._make_video_thumb(f"{base}/{name}")
+
+        im = Image.open(io.BytesIO(out))
+        assert im.format == "JPEG"
+        assert max(im.size) == MAX_SIZE
+        assert served["ranges"] >= 1
+
+    def test_short_clip(self, server):
+        from thumbs import thumbnail_handler
+        base, root, _ = server
+        self._encode(root / "short.mp4", 0.5, True)
+        assert Image.open(io.BytesIO(thumbnail_handler._make_video_thumb(f"{base}/short.mp4"))).format == "JPEG"
+        assert Image.open(io.BytesIO(thumbnail_handler._make_video_thumb(f"{base}/short.mp4", 500))).format == "JPEG"
+
+    def test_poster_skips_black_opening(self, server):
+        import subprocess
+        import numpy as np
+        from thumbs import thumbnail_handler
+        base, root, _ = server
+        # Fades in from black over the first 4 s; moov at the end like a phone export
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=1280x720:rate=30:duration=12",
+             "-vf", "fade=in:st=0:d=4", "-pix_fmt", "yuv420p", "-g", "30", str(root / "fade.mov")],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        fixed = Image.open(io.BytesIO(thumbnail_handler._seek_thumb(f"{base}/fade.mov")))
+        picked = Image.open(io.BytesIO(thumbnail_handler._make_video_thumb(f"{base}/fade.mov", 12000)))
+
+        assert max(picked.size) == MAX_SIZE
+        assert np.asarray(picked.convert("L")).mean() > np.asarray(fixed.convert("L")).mean() + 40
+
+
+class TestRenderImage:
+    """Single-decode rendition engine (thumbs/renditions.py)."""
+
+    LADDER = [("preview", 1600, 82), ("thumb", 300, 78)]
+
+    def _jpeg_with_orientation(self, width, height, orientation):
+        im = Image.new("RGB", (width, height), color=(0, 0, 255))
+        exif = Image.Exif()
+        exif[274] = orientation
+        buf = io.BytesIO()
+        im.save(buf, format="JPEG", exif=exif)
+        return buf.getvalue()
+
+    def test_all_renditions_from_one_call(self):
+        from thumbs.renditions import render_image
+        out = render_image(_make_test_image(4000, 3000), self.LADDER)
+        preview = Image.open(io.BytesIO(out["preview"]))
+        thumb = Image.open(io.BytesIO(out["thumb"]))
+        assert max(preview.size) == 1600
+        assert max(thumb.size) == 300
+        assert preview.format == thumb.format == "JPEG"
+
+    def test_decodes_original_once(self, monkeypatch):
+        from thumbs import renditions
+        opens = []
+        real_open = Image.open
+        monkeypatch.setattr(renditions.Image, "open", lambda *a, **k: opens.append(1) or real_open(*a, **k))
+        renditions.render_image(_make_test_image(2000, 1500), self.LADDER)
+        assert len(opens) == 1
+
+    def test_orientation_applied(self):
+        from thumbs.renditions import render_image
+        # Stored landscape, EXIF says rotate 90° → displayed portrait
+        out = render_image(self._jpeg_with_orientation(2400, 1200, 6), self.LADDER)
+        for name in ("preview", "thumb"):
+            im = Image.open(io.BytesIO(out[name]))
+            assert im.height > im.width
+
+    def test_small_image_not_upscaled(self):
+        from thumbs.renditions import render_image
+        out = render_image(_make_test_image(200, 100), self.LADDER)
+        assert Image.open(io.BytesIO(out["preview"])).size == (200, 100)
+        assert Image.open(io.BytesIO(out["thumb"])).size == (200, 100)
+
+
+
+class TestRenderLadder:
+    def test_ladder_in_every_format(self):
+        from thumbs.renditions import render_ladder
+        out = render_ladder(_make_test_image(2000, 1500), [256, 512, 1024, 1600, 2560], ["webp", "jpeg"])
+        # 2560 is above the original's 2000px edge: that slot holds the full-resolution copy
+        slots = sorted({r["size"] for r in out})
+        assert slots == [256, 512, 1024, 1600, 2560]
+        full = next(r for r in out if r["size"] == 2560)
+        assert (full["width"], full["height"]) == (2000, 1500)
+        for r in out:
+            im = Image.open(io.BytesIO(r["body"]))
+            assert im.format == {"jpeg": "JPEG", "webp": "WEBP"}[r["format"]]
+            assert im.size == (r["width"], r["height"])
+
+    def test_small_original_gets_one_slot(self):
+        from thumbs.renditions import render_ladder
+        out = render_ladder(_make_test_image(200, 100), [256, 512], ["jpeg"])
+        assert [(r["size"], r["width"], r["height"]) for r in out] == [(256, 200, 100)]
+
+    def test_unsupported_format_dropped(self):
+        from thumbs.renditions import render_ladder
+        out = render_ladder(_make_test_image(600, 400), [256], ["jpeg", "bogus"])
+        assert [r["format"] for r in out] == ["jpeg"]
+
+    def _ladder_handler(self, monkeypatch, src, content_length=None):
+        from unittest.mock import MagicMock
+        from datetime import datetime, timezone
+        from thumbs import thumbnail_handler
+
+        fake_s3 = MagicMock()
+        fake_s3.head_object.return_value = {
+            "ContentType": "image/jpeg", "Metadata": {"media-sk": "1#m1"},
+            "ContentLength": content_length or len(src), "LastModified": datetime.now(timezone.utc),
+        }
+        fake_s3.get_object.side_effect = lambda **kw: {"Body": io.BytesIO(src)}
+        fake_s3.download_fileobj.side_effect = lambda bucket, key, f: f.write(src)
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler, "IMAGE_FORMATS", ["webp", "jpeg"])
+        monkeypatch.setattr(thumbnail_handler, "RENDITION_SIZES", [256, 512, 1024, 1600, 2560])
+        monkeypatch.setattr(thumbnail_handler, "THUMB_SIZES", [256, 512])
+        monkeypatch.setattr(thumbnail_handler, "PREVIEW_SIZES", [1024, 1600, 2560])
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+        return thumbnail_handler, fake_s3, updates
+
+    def test_handler_writes_ladder_and_records_map(self, monkeypatch, capsys):
+        import json
+        thumbnail_handler, fake_s3, updates = self._ladder_handler(monkeypatch, _make_test_image(3000, 2000))
+
+        event = {"Records": [{"s3": {"bucket": {"name": "b"}, "object": {"key": "media/t1/m1/photo.jpg"}}}]}
+        thumbnail_handler.handler(event, None)
+
+        put_keys = [c.kwargs["Key"] for c in fake_s3.put_object.call_args_list]
+        content_types = {c.kwargs["Key"]: c.kwargs["ContentType"] for c in fake_s3.put_object.call_args_list}
+        assert len(content_types) == 10
+        assert content_types["thumbnails/t1/m1/512.webp"] == "image/webp"
+        assert content_types["thumbnails/t1/m1/2560.jpg"] == "image/jpeg"
+        # Grid sizes are written (and linked) before any of the large ones
+        assert set(put_keys[:4]) == {f"thumbnails/t1/m1/{s}.{e}" for s in (256, 512) for e in ("webp", "jpg")}
+
+        # Thumb lane links the grid image, BlurHash and metadata first
+        team_id, sk, fields = updates[0]
+        assert (team_id, sk) == ("t1", "1#m1")
+        assert len(fields["blurhash"]) == 28  # 4x3 components
+        assert fields["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+        assert fields["preview_key"] is None
+        assert (fields["width"], fields["height"], fields["orientation"]) == (3000, 2000, 1)
+        assert "captured_at" not in fields and "capture_sk" not in fields
+        assert fields["renditions"]["sizes"] == [256, 512]
+
+        # Preview lane adds the large sizes and merges the map
+        _, _, fields = updates[1]
+        assert set(fields) == {"preview_key", "renditions"}
+        assert fields["preview_key"] == "thumbnails/t1/m1/1600.jpg"
+        assert fields["renditions"] == {
+            "sizes": [256, 512, 1024, 1600, 2560],
+            "widths": [256, 512, 1024, 1600, 2560],
+            "heights": [171, 341, 683, 1067, 1707],
+            "formats": ["webp", "jpeg"],
+        }
+
+        metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+        assert [m["Lane"] for m in metrics if "TimeToFirstThumbnail" in m] == ["thumb", "preview"]
+
+    def test_large_image_skips_thumb_lane(self, monkeypatch):
+        thumbnail_handler, fake_s3, updates = self._ladder_handler(
+            monkeypatch, _make_test_image(3000, 2000), content_length=500 * 1024 * 1024,
+        )
+        job = thumbnail_handler.intake("b", "media/t1/m1/photo.jpg")
+        assert job["lane"] == "preview" and "done" not in job
+        fake_s3.get_object.assert_not_called()
+
+        thumbnail_handler.preview_stage(job)
+        fake_s3.get_object.assert_not_called()  # spooled to /tmp, decoded from disk
+        fake_s3.download_fileobj.assert_called_once()
+        (_, _, fields), = updates
+        assert fields["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+        assert fields["preview_key"] == "thumbnails/t1/m1/1600.jpg"
+        assert fields["blurhash"] and fields["width"] == 3000
+        assert fields["renditions"]["sizes"] == [256, 512, 1024, 1600, 2560]
+
+    def test_small_image_finishes_in_thumb_lane(self, monkeypatch):
+        thumbnail_handler, fake_s3, updates = self._ladder_handler(monkeypatch, _make_test_image(400, 300))
+        assert thumbnail_handler.intake("b", "media/t1/m1/photo.jpg") is None
+        (_, _, fields), = updates
+        assert fields["preview_key"] == fields["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+
+    def test_followups_go_to_lane_queues(self, monkeypatch):
+        thumbnail_handler, fake_s3, updates = self._ladder_handler(monkeypatch, _make_test_image(3000, 2000))
+        monkeypatch.setattr(thumbnail_handler, "LANE_QUEUE_URLS", {"preview": "https://q/preview", "video": "https://q/video"})
+        sent = []
+        monkeypatch.setattr(thumbnail_handler, "_enqueue", lambda lane, jobs: sent.append((lane, jobs)))
+
+        from thumbs.local_queue import LocalQueue
+        q = LocalQueue()
+        q.send_s3_event("b", "media/t1/m1/photo.jpg")
+        event = q.receive()
+        assert thumbnail_handler.handler(event, None) == {"batchItemFailures": []}
+
+        (lane, jobs), = sent
+        assert lane == "preview" and jobs[0]["sk"] == "1#m1"
+        assert sorted(d["size"] for d in jobs[0]["done"]) == [256, 256, 512, 512]
+        assert len(updates) == 1  # preview work left for the preview lane
+
+        # The preview lane consumes the same message shape
+        q.send(json.dumps(jobs[0]))
+        assert thumbnail_handler.handler(q.receive(), None) == {"batchItemFailures": []}
+        assert updates[1][2]["preview_key"] == "thumbnails/t1/m1/1600.jpg"
+
+
+class TestDecodeBudget:
+    def _png(self, width, height):
+        buf = io.BytesIO()
+        Image.new("RGB", (width, height), (0, 90, 0)).save(buf, format="PNG", compress_level=1)
+        return buf.getvalue()
+
+    def test_jpeg_decodes_at_reduced_scale(self):
+        from thumbs.renditions import decode_plan
+        im = Image.open(io.BytesIO(_make_test_image(4000, 3000)))
+        plan = decode_plan(im, 512)
+        assert plan["scale"] == 4 and (plan["decoded_width"], plan["decoded_height"]) == (1000, 750)
+        assert plan["decoded_bytes"] == 1000 * 750 * 4
+
+    def test_header_checked_before_decode(self, monkeypatch):
+        from thumbs.renditions import render_ladder, ImageTooLarge
+        # A 12000x12000 PNG compresses to almost nothing but would decode to ~550 MB
+        src = self._png(12000, 12000)
+        assert len(src) < 4 * 1024 * 1024
+        loads = []
+        monkeypatch.setattr(Image.Image, "load", lambda self: loads.append(1))
+        with pytest.raises(ImageTooLarge):
+            render_ladder(src, [256], ["jpeg"], budget_bytes=64 * 1024 * 1024)
+        assert loads == []
+
+    def test_huge_jpeg_panorama_renders_within_budget(self):
+        # Over Pillow's own bomb limit when declared, but 1/8 scale fits easily
+        from thumbs.renditions import render_ladder
+        src = _make_test_image(16000, 12000)
+        plan = {}
+        out = render_ladder(src, [256], ["jpeg"], budget_bytes=32 * 1024 * 1024, plan=plan)
+        assert out[0]["width"] == 256 and plan["scale"] == 8
+
+    def test_rejected_image_is_reported_not_retried(self, monkeypatch, capsys):
+        from unittest.mock import MagicMock
+        from datetime import datetime, timezone
+        from thumbs import thumbnail_handler
+
+        src = self._png(8000, 8000)
+        fake_s3 = MagicMock()
+        fake_s3.head_object.return_value = {
+            "ContentType": "image/png", "Metadata": {"media-sk": "1#m1"},
+            "ContentLength": len(src), "LastModified": datetime.now(timezone.utc),
+        }
+        fake_s3.get_object.side_effect = lambda **kw: {"Body": io.BytesIO(src)}
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler, "DECODE_BUDGET_BYTES", 64 * 1024 * 1024)
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+
+        assert thumbnail_handler.intake("b", "media/t1/m1/bomb.png") is None
+        assert updates == []
+        metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+        assert [m for m in metrics if "ImageDecodeRejected" in m][0]["media_id"] == "m1"
+
+    def test_large_originals_spool_to_disk(self, monkeypatch):
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+        fake_s3 = MagicMock()
+        fake_s3.download_fileobj.side_effect = lambda bucket, key, f: f.write(b"original")
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        with thumbnail_handler._original("b", "media/t/m/big.tif", thumbnail_handler.SPOOL_MEMORY_BYTES + 1) as source:
+            assert isinstance(source, str)
+            with open(source, "rb") as f:
+                assert f.read() == b"original"
+        assert not os.path.exists(source)
+
+
+
+def _jpeg_with_exif_thumb(width, height, thumb_size, orientation=1, thumb_color=(200, 30, 30)) -> bytes:
+    """A camera-style JPEG: EXIF with the orientation in IFD0 and a thumbnail JPEG in IFD1."""
+    import struct
+    buf = io.BytesIO()
+    Image.new("RGB", thumb_size, thumb_color).save(buf, format="JPEG", quality=80)
+    thumb = buf.getvalue()
+    tiff = b"II*\x00" + struct.pack("<I", 8)
+    tiff += struct.pack("<H", 1) + struct.pack("<HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack("<I", 26)
+    tiff += struct.pack("<H", 2) + struct.pack("<HHII", 0x0201, 4, 1, 56) + struct.pack("<HHII", 0x0202, 4, 1, len(thumb))
+    tiff += struct.pack("<I", 0) + thumb
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (30, 30, 200)).save(buf, format="JPEG", quality=85, exif=b"Exif\x00\x00" + tiff)
+    return buf.getvalue()
+
+
+class TestEmbeddedPreview:
+    def test_grid_slots_come_from_exif_thumbnail(self):
+        from thumbs.renditions import render_ladder
+        src = _jpeg_with_exif_thumb(4000, 3000, (512, 384))
+        plan = {}
+        out = render_ladder(src, [256, 512, 1024], ["jpeg"], plan=plan, embedded_min_edge=256)
+        assert plan["embedded"] == "exif"
+        assert sorted((r["size"], r["width"], r["height"]) for r in out) == [(256, 256, 192), (512, 512, 384)]
+        # Pixels are the thumbnail's (red), not the primary image's (blue)
+        r, g, b = Image.open(io.BytesIO(out[0]["body"])).convert("RGB").getpixel((128, 96))
+        assert r > 150 and b < 100
+
+    def test_embedded_thumbnail_follows_original_orientation(self):
+        from thumbs.renditions import render_ladder
+        src = _jpeg_with_exif_thumb(4000, 3000, (512, 384), orientation=6)
+        out = render_ladder(src, [256, 512], ["jpeg"], embedded_min_edge=256)
+        assert sorted((r["width"], r["height"]) for r in out) == [(192, 256), (384, 512)]
+
+    def test_unsuitable_thumbnails_fall_back_to_full_decode(self):
+        from thumbs.renditions import render_ladder
+        # Too small for the smallest slot, and letterboxed to a different aspect
+        for src in (_jpeg_with_exif_thumb(4000, 3000, (160, 120)), _jpeg_with_exif_thumb(3200, 1800, (512, 384))):
+            plan = {}
+            out = render_ladder(src, [256, 512], ["jpeg"], plan=plan, embedded_min_edge=256)
+            assert "embedded" not in plan and len(out) == 2
+            assert Image.open(io.BytesIO(out[0]["body"])).convert("RGB").getpixel((10, 10))[2] > 150
+
+    def test_heic_thumbnail_item(self):
+        pillow_heif = pytest.importorskip("pillow_heif")
+        pillow_heif.register_heif_opener()
+        from thumbs.renditions import render_ladder
+        buf = io.BytesIO()
+        Image.new("RGB", (2000, 1500), (30, 30, 200)).save(buf, format="HEIF", quality=60, thumbnails=[320])
+        plan = {}
+        out = render_ladder(buf.getvalue(), [256, 512], ["jpeg"], plan=plan, embedded_min_edge=256)
+        assert plan["embedded"] == "heif"
+        assert [(r["size"], r["width"], r["height"]) for r in out] == [(256, 256, 192)]
+
+    def test_preview_lane_fills_remaining_slots(self, monkeypatch, capsys):
+        thumbnail_handler, fake_s3, updates = TestRenderLadder()._ladder_handler(
+            monkeypatch, _jpeg_with_exif_thumb(3000, 2000, (384, 256)),
+        )
+        monkeypatch.setattr(thumbnail_handler, "EMBEDDED_PREVIEW_MIN_EDGE", 256)
+        job = thumbnail_handler.intake("b", "media/t1/m1/photo.jpg")
+        assert job["lane"] == "preview"
+
+        _, _, fields = updates[0]
+        assert fields["thumb_key"] == "thumbnails/t1/m1/256.jpg"
+        assert fields["renditions"]["sizes"] == [256]
+        assert (fields["width"], fields["height"]) == (3000, 2000)
+        metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+        assert [m["Kind"] for m in metrics if "ThumbFromEmbeddedPreview" in m] == ["exif"]
+
+        thumbnail_handler.preview_stage(job)
+        _, _, fields = updates[1]
+        # The full decode takes over the grid image once it has a sharper one
+        assert fields["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+        assert fields["renditions"]["sizes"] == [256, 512, 1024, 1600, 2560]
+        written = [c.kwargs["Key"] for c in fake_s3.put_object.call_args_list]
+        assert written.count("thumbnails/t1/m1/256.jpg") == 1
+
+
+
+class TestIdempotentDerivatives:
+    def _setup(self, monkeypatch, aws, body):
+        import boto3
+        from thumbs import thumbnail_handler
+        monkeypatch.setattr(thumbnail_handler, "s3", aws["s3"])
+        monkeypatch.setattr(thumbnail_handler, "ddb", boto3.client("dynamodb", region_name="us-east-1"))
+        monkeypatch.setattr(thumbnail_handler, "IMAGE_FORMATS", ["jpeg"])
+        aws["s3"].put_object(
+            Bucket="test-media-bucket", Key="media/t1/m1/photo.jpg", Body=body,
+            ContentType="image/jpeg", Metadata={"media-sk": "1#m1"},
+        )
+        renders = []
+        real_render = thumbnail_handler._render
+        monkeypatch.setattr(thumbnail_handler, "_render", lambda *a: renders.append(1) or real_render(*a))
+        return thumbnail_handler, renders
+
+    def test_duplicate_notification_is_skipped(self, aws, monkeypatch, capsys):
+        thumbnail_handler, renders = self._setup(monkeypatch, aws, _make_test_image(3000, 2000))
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg")
+        assert len(renders) == 2  # thumb + preview lane
+        item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "1#m1"})["Item"]
+        etag = aws["s3"].head_object(Bucket="test-media-bucket", Key="media/t1/m1/photo.jpg")["ETag"].strip('"')
+        assert item["derived_etag"] == etag and item["derived_version"] == thumbnail_handler.PIPELINE_VERSION
+
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg")
+        assert len(renders) == 2
+        metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+        assert [m["Lane"] for m in metrics if "DerivativesSkipped" in m] == ["thumb"]
+
+        # Forced (derivatives known to be missing from the bucket) runs regardless
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg", force=True)
+        assert len(renders) == 4
+
+    def test_new_bytes_or_pipeline_version_regenerate(self, aws, monkeypatch):
+        thumbnail_handler, renders = self._setup(monkeypatch, aws, _make_test_image(400, 300))
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg")
+        assert len(renders) == 1
+
+        monkeypatch.setattr(thumbnail_handler, "PIPELINE_VERSION", thumbnail_handler.PIPELINE_VERSION + 1)
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg")
+        assert len(renders) == 2
+        item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "1#m1"})["Item"]
+        assert item["derived_version"] == thumbnail_handler.PIPELINE_VERSION
+
+        aws["s3"].put_object(
+            Bucket="test-media-bucket", Key="media/t1/m1/photo.jpg", Body=_make_test_image(300, 400),
+            ContentType="image/jpeg", Metadata={"media-sk": "1#m1"},
+        )
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m1/photo.jpg")
+        assert len(renders) == 3
+        item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "1#m1"})["Item"]
+        assert (item["width"], item["height"]) == (300, 400)
+
+    def test_legacy_original_without_metadata_is_linked(self, aws, monkeypatch):
+        thumbnail_handler, renders = self._setup(monkeypatch, aws, b"")
+        # Uploaded before presign set media-sk: found by media_id on gsi1
+        aws["s3"].put_object(
+            Bucket="test-media-bucket", Key="media/t1/m2/photo.jpg", Body=_make_test_image(400, 300),
+            ContentType="image/jpeg",
+        )
+        aws["media_table"].put_item(Item={"team_id": "t1", "sk": "1#m1", "media_id": "m1", "gsi1pk": "m1"})
+        aws["media_table"].put_item(Item={
+            "team_id": "t1", "sk": "5#m2", "media_id": "m2", "gsi1pk": "m2", "object_key": "media/t1/m2/photo.jpg",
+        })
+        queries = []
+        real_query = thumbnail_handler.ddb.query
+        monkeypatch.setattr(thumbnail_handler.ddb, "query", lambda **kw: queries.append(kw) or real_query(**kw))
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m2/photo.jpg")
+        # A key lookup, not a read of the team's partition
+        assert [q.get("IndexName") for q in queries] == ["gsi1"]
+        item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "5#m2"})["Item"]
+        assert item["thumb_key"] == "thumbnails/t1/m2/512.jpg"
+        assert item["derived_version"] == thumbnail_handler.PIPELINE_VERSION
+
+        # A re-run is now skipped by the marker
+        thumbnail_handler.process_object("test-media-bucket", "media/t1/m2/photo.jpg")
+        assert len(renders) == 1
+
+    def test_older_pipeline_cannot_overwrite(self, aws, monkeypatch):
+        thumbnail_handler, _ = self._setup(monkeypatch, aws, b"")
+        aws["media_table"].put_item(Item={
+            "team_id": "t1", "sk": "1#m1", "thumb_key": "thumbnails/t1/m1/512.avif", "derived_version": 99,
+        })
+        thumbnail_handler._update_media("t1", "1#m1", {"thumb_key": "thumbnails/t1/m1/512.jpg"})
+        item = aws["media_table"].get_item(Key={"team_id": "t1", "sk": "1#m1"})["Item"]
+        assert item["thumb_key"] == "thumbnails/t1/m1/512.avif"
+
+    def test_derivatives_current(self):
+        from common.derivatives import derivatives_current
+        item = {"derived_etag": "abc", "derived_version": 2}
+        assert derivatives_current(item, '"abc"', version=2)
+        assert derivatives_current(item, "abc", version=1)
+        assert not derivatives_current(item, "abc", version=3)
+        assert not derivatives_current(item, "def", version=2)
+        assert not derivatives_current({}, "", version=1)
+
+
+class TestBlurHash:
+    def test_matches_reference_encoder(self):
+        """Value produced by the reference (pure Python) blurhash package for the same pixels."""
+        import numpy as np
+        from thumbs.blurhash import encode
+        pixels = np.random.default_rng(0).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+        assert encode(pixels, 4, 3) == "L7H2vGyZ$.}+,2S*SuWc+LTqN@T0"
+
+    def test_flat_colour_has_no_ac(self):
+        import numpy as np
+        from thumbs.blurhash import encode
+        pixels = np.full((8, 8, 3), (255, 0, 0), dtype=np.uint8)
+        assert encode(pixels, 1, 1) == "00TI:j"
+
+    def test_components_follow_orientation(self):
+        from thumbs.blurhash import encode_image
+        landscape = encode_image(_make_test_image(300, 200))
+        portrait = encode_image(_make_test_image(200, 300))
+        # Size flag: (x - 1) + (y - 1) * 9
+        assert landscape[0] == "L"  # 4x3 → 21
+        assert portrait[0] == "T"   # 3x4 → 29
+
+
+class TestMediaMetadata:
+    def _jpeg(self, width, height, orientation=1, taken=None, offset=None):
+        im = Image.new("RGB", (width, height))
+        exif = Image.Exif()
+        exif[274] = orientation
+        if taken:
+            ifd = exif.get_ifd(0x8769)
+            ifd[36867] = taken
+            if offset:
+                ifd[36881] = offset
+        buf = io.BytesIO()
+        im.save(buf, format="JPEG", exif=exif)
+        return buf.getvalue()
+
+    def test_dimensions_follow_orientation(self):
+        from thumbs.renditions import image_metadata
+        assert image_metadata(self._jpeg(400, 300)) == {"width": 400, "height": 300, "orientation": 1}
+        assert image_metadata(self._jpeg(400, 300, orientation=6)) == {"width": 300, "height": 400, "orientation": 6}
+
+    def test_capture_time(self):
+        from thumbs.renditions import image_metadata
+        # 2024-05-01 12:00:00 UTC
+        assert image_metadata(self._jpeg(10, 10, taken="2024:05:01 12:00:00"))["captured_at"] == 1714564800
+        assert image_metadata(self._jpeg(10, 10, taken="2024:05:01 14:00:00", offset="+02:00"))["captured_at"] == 1714564800
+
+    def test_garbage_capture_time_ignored(self):
+        from thumbs.renditions import image_metadata
+        assert "captured_at" not in image_metadata(self._jpeg(10, 10, taken="0000:00:00 00:00:00"))
+
+    def test_probe_video_parses_ffprobe(self, monkeypatch):
+        import json
+        import subprocess
+        from thumbs import thumbnail_handler
+
+        probe = {
+            "format": {"duration": "12.345", "tags": {"creation_time": "2024-05-01T12:00:00.000000Z"}},
+            "streams": [{"codec_name": "hevc", "width": 1920, "height": 1080, "side_data_list": [{"rotation": -90}]}],
+        }
+        monkeypatch.setattr(subprocess, "run", lambda cmd, **kw: subprocess.CompletedProcess(cmd, 0, json.dumps(probe).encode(), b""))
+        assert thumbnail_handler._probe_video("https://example.com/v.mov") == {
+            "duration_ms": 12345,
+            "video_codec": "hevc",
+            "width": 1080,
+            "height": 1920,
+            "captured_at": 1714564800,
+        }
+
+    def test_capture_fields_add_sort_key(self):
+        from thumbs.thumbnail_handler import _capture_fields
+        assert _capture_fields("m1", {"width": 1, "captured_at": 1714564800})["capture_sk"] == "1714564800#m1"
+        assert "capture_sk" not in _capture_fields("m1", {"width": 1})
+
+
+def _boom(msg):
+    raise RuntimeError(msg)
+
+
+class TestWorkerPool:
+    def test_runs_jobs_and_surfaces_errors(self):
+        from thumbs.workers import PipePool, WorkerError
+        pool = PipePool(2)
+        try:
+            assert pool.run(pow, 2, 10) == 1024
+            with pytest.raises(WorkerError, match="RuntimeError: bad input"):
+                pool.run(_boom, "bad input")
+            assert pool.run(len, b"abc") == 3  # worker survives a failed job
+        finally:
+            pool.close()
+
+    def test_replaces_a_dead_worker(self):
+        from thumbs.workers import PipePool, WorkerError
+        pool = PipePool(1)
+        try:
+            with pytest.raises(WorkerError, match="exited"):
+                pool.run(os._exit, 1)
+            assert pool.size == 1
+            assert pool.run(abs, -5) == 5
+        finally:
+            pool.close()
+
+
+class TestQueueBatches:
+    """SQS batch semantics, driven through the in-memory queue stand-in."""
+
+    def _setup(self, monkeypatch, objects):
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+
+        fake_s3 = MagicMock()
+        fake_s3.head_object.side_effect = lambda Bucket, Key: {
+            "ContentType": "image/jpeg", "Metadata": {"media-sk": "1#" + Key.split("/")[2]},
+        }
+        fake_s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler, "IMAGE_FORMATS", ["jpeg"])
+        monkeypatch.setattr(thumbnail_handler, "RENDITION_SIZES", [256, 512])
+        monkeypatch.setattr(thumbnail_handler, "THUMB_SIZES", [256, 512])
+        monkeypatch.setattr(thumbnail_handler, "PREVIEW_SIZES", [])
+        monkeypatch.setattr(thumbnail_handler, "RENDER_PROCESSES", 2)
+        monkeypatch.setattr(thumbnail_handler, "_render_pool", None)
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+        return thumbnail_handler, updates
+
+    def test_only_failed_messages_retry_then_dead_letter(self, monkeypatch):
+        from thumbs.local_queue import LocalQueue
+        objects = {f"media/t1/m{i}/p.jpg": _make_test_image(600, 400) for i in range(5)}
+        objects["media/t1/bad/p.jpg"] = b"not an image"
+        thumbnail_handler, updates = self._setup(monkeypatch, objects)
+
+        q = LocalQueue(max_receive_count=3)
+        for key in objects:
+            q.send_s3_event("b", key)
+        q.send("{not json")
+
+        try:
+            q.drain(thumbnail_handler.handler, batch_size=10)
+        finally:
+            thumbnail_handler._render_pool.close()
+
+        # Each good object processed exactly once; the failures were retried alone
+        assert sorted(sk for _, sk, _ in updates) == [f"1#m{i}" for i in range(5)]
+        assert len(q.dead_letters) == 2
+        assert all(m["receive_count"] == 3 for m in q.dead_letters)
+        assert not q.messages
+
+    def test_direct_s3_event_still_supported(self, monkeypatch):
+        from thumbs.local_queue import s3_event
+        objects = {"media/t1/m1/p.jpg": _make_test_image(600, 400)}
+        thumbnail_handler, updates = self._setup(monkeypatch, objects)
+        monkeypatch.setattr(thumbnail_handler, "RENDER_PROCESSES", 1)
+
+        resp = thumbnail_handler.handler(s3_event("b", "media/t1/m1/p.jpg"), None)
+
+        assert resp == {"batchItemFailures": []}
+        assert updates[0][2]["thumb_key"] == "thumbnails/t1/m1/512.jpg"
+
+
+class TestHls:
+    def test_ladder_never_upscales(self):
+        from thumbs.hls import ladder_for
+        assert [r[0] for r in ladder_for(3840, 2160)] == [360, 720, 1080]
+        assert [r[0] for r in ladder_for(1080, 1920)] == [360, 720, 1080]  # portrait: short edge
+        assert [r[0] for r in ladder_for(1280, 720)] == [360, 720]
+        assert [r[0] for r in ladder_for(320, 240)] == [360]
+        assert [r[0] for r in ladder_for(None, None)] == [360, 720, 1080]
+
+    def test_command_without_audio(self):
+        from thumbs.hls import build_command, HLS_LADDER
+        cmd = build_command("in.mp4", "/tmp/out", HLS_LADDER[:2], audio=False)
+        assert cmd[cmd.index("-var_stream_map") + 1] == "v:0,name:360p v:1,name:720p"
+        assert "0:a:0" not in cmd and "-c:a" not in cmd
+        assert cmd[cmd.index("-hls_time") + 1] == "4"
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+    def test_transcodes_aligned_ladder(self, tmp_path):
+        import subprocess
+        from thumbs import hls
+        src = str(tmp_path / "in.mp4")
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=720x1280:rate=30", "-t", "9",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", src],
+            check=True,
+        )
+        out = tmp_path / "hls"
+        out.mkdir()
+        stream = hls.transcode(src, str(out), 720, 1280, audio=False)
+        assert stream == {"variants": [360, 720], "segments": [3, 3]}
+        master = (out / "master.m3u8").read_text()
+        assert master.index("360p.m3u8") < master.index("720p.m3u8")  # players start on the first rung
+        assert "RESOLUTION=360x640" in master
+
+    def test_transcode_stage_uploads_master_last(self, monkeypatch):
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+
+        def fake_transcode(url, out_dir, width, height, timeout):
+            for name in ("360p.m3u8", "360p_000.ts", "master.m3u8", "stray.tmp"):
+                open(os.path.join(out_dir, name), "w").close()
+            return {"variants": [360], "segments": [1]}
+
+        fake_s3 = MagicMock()
+        fake_s3.generate_presigned_url.return_value = "https://signed.example/clip.mov"
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler.hls, "transcode", fake_transcode)
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+
+        thumbnail_handler.transcode_stage({
+            "lane": "transcode", "bucket": "b", "key": "media/t1/m1/clip.mov", "sk": "1#m1",
+            "team_id": "t1", "media_id": "m1", "width": 1920, "height": 1080,
+        })
+
+        uploaded = [c.args[2] for c in fake_s3.upload_file.call_args_list]
+        assert sorted(uploaded[:-1]) == ["streams/t1/m1/360p.m3u8", "streams/t1/m1/360p_000.ts"]
+        assert uploaded[-1] == "streams/t1/m1/master.m3u8"
+        types = {c.args[2]: c.kwargs["ExtraArgs"]["ContentType"] for c in fake_s3.upload_file.call_args_list}
+        assert types["streams/t1/m1/360p_000.ts"] == "video/mp2t"
+        assert updates == [("t1", "1#m1", {
+            "stream_key": "streams/t1/m1/master.m3u8",
+            "stream": {"variants": [360], "segments": [1]},
+        })]
+
+
+class TestPoster:
+    def test_candidates_cover_short_clips(self):
+        from thumbs.poster import candidate_times
+        assert candidate_times(400) == [0.2]
+        assert candidate_times(3000) == [0.5, 1.5, 2.5]
+        assert len(candidate_times(3_600_000)) == 5 and max(candidate_times(3_600_000)) < 30
+
+    def test_scores_prefer_exposed_sharp_frames(self):
+        import numpy as np
+        from thumbs.poster import score_frame
+        rng = np.random.default_rng(0)
+        detailed = rng.integers(30, 230, (90, 160, 3), dtype=np.uint8)
+        black = np.full((90, 160, 3), 4, dtype=np.uint8)
+        blurred = np.asarray(Image.fromarray(detailed).resize((16, 9)).resize((160, 90), Image.BILINEAR))
+        dark = (detailed // 8).astype(np.uint8)
+        assert score_frame(detailed) > score_frame(blurred) > score_frame(black)
+        assert score_frame(detailed) > score_frame(dark)
+
+    def test_reads_concatenated_ppms(self):
+        from thumbs.poster import read_ppm_frames
+        data = b"P6\n2 1\n255\n" + bytes(6) + b"P6\n2 1\n255\n" + bytes([255] * 6)
+        frames = read_ppm_frames(data)
+        assert [f.shape for f in frames] == [(1, 2, 3), (1, 2, 3)]
+        assert frames[1].min() == 255
+
+    def test_falls_back_to_fixed_seek(self, monkeypatch):
+        from thumbs import thumbnail_handler
+
+        def broken(*args):
+            raise RuntimeError("no frames")
+
+        monkeypatch.setattr(thumbnail_handler, "pick_poster", broken)
+        monkeypatch.setattr(thumbnail_handler, "_seek_thumb", lambda src, duration_ms=None: b"fixed")
+        assert thumbnail_handler._make_video_thumb("https://example.com/clip.mp4", 5000) == b"fixed"
+
+
+class TestHoverClip:
+    def test_command_is_short_silent_and_small(self):
+        from thumbs import hover
+        cmd = hover.build_command("https://signed.example/clip.mov", "/tmp/hover.mp4", hover.start_time(60_000))
+        assert cmd[cmd.index("-ss") + 1] == "1.000"
+        assert cmd[cmd.index("-t") + 1] == "3"
+        assert "-an" in cmd and "+faststart" in cmd
+        assert hover.start_time(2_500) == 0.0  # short clips start at the beginning
+        assert hover.start_time(None) == 0.0
+
+    def test_video_stage_records_hover_key(self, monkeypatch):
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+
+        fake_s3 = MagicMock()
+        fake_s3.generate_presigned_url.return_value = "https://signed.example/clip.webm"
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler, "_make_video_thumb", lambda src, duration_ms=None: b"jpeg")
+        monkeypatch.setattr(thumbnail_handler, "_probe_video", lambda src: {"video_codec": "vp9", "duration_ms": 8000})
+        clips = []
+
+        def fake_clip(src, out_path, duration_ms=None, **kw):
+            clips.append((src, duration_ms))
+            with open(out_path, "wb") as f:
+                f.write(b"mp4")
+
+        monkeypatch.setattr(thumbnail_handler.hover, "make_clip", fake_clip)
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+
+        thumbnail_handler.video_stage({
+            "lane": "video", "bucket": "b", "key": "media/t1/m1/clip.webm", "sk": "1#m1", "team_id": "t1",
+            "media_id": "m1", "content_type": "video/webm", "size": 1024,
+        })
+
+        assert clips == [("https://signed.example/clip.webm", 8000)]
+        puts = {c.kwargs["Key"]: c.kwargs for c in fake_s3.put_object.call_args_list}
+        assert puts["previews/t1/m1/hover.mp4"]["ContentType"] == "video/mp4"
+        assert updates[0][2]["hover_key"] == "previews/t1/m1/hover.mp4"
+        assert updates[0][2]["preview_key"] is None  # VP9 isn't remuxed
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+    def test_clip_is_a_few_hundred_kb(self, tmp_path):
+        import subprocess
+        from thumbs import hover
+        src = tmp_path / "game.mp4"
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=1920x1080:rate=30", "-t", "8",
+             "-f", "lavfi", "-i", "sine", "-t", "8", "-pix_fmt", "yuv420p", str(src)],
+            check=True,
+        )
+        out = tmp_path / "hover.mp4"
+        hover.make_clip(str(src), str(out), 8000)
+
+        assert out.stat().st_size < 300 * 1024
+        info = subprocess.run(["ffmpeg", "-i", str(out)], capture_output=True, text=True).stderr
+        assert "320x180" in info and "Audio" not in info
+
+
+class TestFaststart:
+    @staticmethod
+    def _box(kind, payload=b""):
+        import struct
+        return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+    @staticmethod
+    def _reader(data, reads=None):
+        def read(start, length):
+            if reads is not None:
+                reads.append((start, length))
+            return data[start:start + length]
+        return read
+
+    def test_detects_trailing_moov_from_box_headers(self):
+        from thumbs.faststart import moov_at_end
+        mdat = self._box(b"mdat", b"\0" * 5000)
+        tail = self._box(b"ftyp", b"isom") + mdat + self._box(b"moov", b"\0" * 100)
+        front = self._box(b"ftyp", b"isom") + self._box(b"moov", b"\0" * 100) + mdat
+        reads = []
+        assert moov_at_end(self._reader(tail, reads), len(tail)) is True
+        assert all(length == 16 for _, length in reads) and len(reads) == 2  # headers only
+        assert moov_at_end(self._reader(front), len(front)) is False
+        assert moov_at_end(self._reader(b"\x1aE\xdf\xa3garbage"), 11) is False  # not ISO BMFF
+
+    def test_only_h264_mp4_family(self):
+        from thumbs.faststart import needs_faststart
+        assert needs_faststart("video/quicktime", "h264")
+        assert needs_faststart("video/mp4", "h264")
+        assert not needs_faststart("video/mp4", "hevc")
+        assert not needs_faststart("video/webm", "h264")
+
+    def test_video_stage_records_playback_copy(self, monkeypatch):
+        from unittest.mock import MagicMock
+        from thumbs import thumbnail_handler
+
+        fake_s3 = MagicMock()
+        fake_s3.generate_presigned_url.return_value = "https://signed.example/clip.mov"
+        monkeypatch.setattr(thumbnail_handler, "s3", fake_s3)
+        monkeypatch.setattr(thumbnail_handler, "_make_video_thumb", lambda src, duration_ms=None: b"jpeg")
+        monkeypatch.setattr(thumbnail_handler, "_probe_video", lambda src: {"video_codec": "h264", "width": 1920, "height": 1080})
+        monkeypatch.setattr(thumbnail_handler.faststart, "moov_at_end", lambda read, size: True)
+        remuxed = []
+        monkeypatch.setattr(thumbnail_handler.faststart, "remux", lambda src, out, **kw: remuxed.append(src))
+        updates = []
+        monkeypatch.setattr(thumbnail_handler, "_update_media", lambda *a: updates.append(a))
+
+        job = {
+            "lane": "video", "bucket": "b", "key": "media/t1/m1/clip.mov", "sk": "1#m1", "team_id": "t1",
+            "media_id": "m1", "content_type": "video/quicktime", "size": 50 * 1024 * 1024,
+        }
+        follow_up = thumbnail_handler.video_stage(job)
+
+        assert remuxed == ["https://signed.example/clip.mov"]
+        upload = fake_s3.upload_file.call_args
+        assert upload.args[1:] == ("b", "previews/t1/m1/playback.mp4")
+        assert upload.kwargs["ExtraArgs"]["ContentType"] == "video/mp4"
+        assert updates[0][2]["preview_key"] == "previews/t1/m1/playback.mp4"
+        assert follow_up["lane"] == "transcode"
+
+        # Too big to spool through /tmp: left to the HLS ladder
+        remuxed.clear()
+        thumbnail_handler.video_stage({**job, "size": thumbnail_handler.REMUX_MAX_BYTES + 1})
+        assert remuxed == []
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+    def test_remux_moves_moov_to_front(self, tmp_path):
+        import subprocess
+        from thumbs import faststart
+        src = tmp_path / "phone.mov"
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=30", "-t", "3",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", str(src)],
+            check=True,
+        )
+        data = src.read_bytes()
+        assert faststart.moov_at_end(self._reader(data), len(data))
+
+        out = tmp_path / "playback.mp4"
+        faststart.remux(str(src), str(out))
+        remuxed = out.read_bytes()
+        assert not faststart.moov_at_end(self._reader(remuxed), len(remuxed))
+        assert [t for t, _, _ in faststart.top_level_boxes(self._reader(remuxed), len(remuxed))].index("moov") < 3
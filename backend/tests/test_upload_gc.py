@@ -0,0 +1,107 @@
+"""Tests for jobs/upload_gc.py – cleanup of uploads never finalized by /media/complete."""
+import time
+
+import pytest
+
+from jobs import upload_gc
+from jobs.upload_gc import collect_team, find_orphans, min_age_seconds
+
+BUCKET = "test-media-bucket"
+LATER = time.time() + 2 * 86400
+
+
+@pytest.fixture
+def gc_env(aws, monkeypatch):
+    monkeypatch.setattr("common.s3._s3", aws["s3"])
+    return aws
+
+
+def _put(aws, key, body=b"x" * 10):
+    aws["s3"].put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def _seed(aws, team_id="team-gc"):
+    # Finalized upload
+    _put(aws, f"media/{team_id}/done/photo.jpg")
+    _put(aws, f"thumbnails/{team_id}/done/512.jpg")
+    aws["media_table"].put_item(Item={
+        "team_id": team_id, "sk": "1000#done", "media_id": "done",
+        "object_key": f"media/{team_id}/done/photo.jpg", "thumb_key": f"thumbnails/{team_id}/done/512.jpg",
+    })
+    # Abandoned before the thumbnail Lambda ran: just the original
+    _put(aws, f"media/{team_id}/bare/clip.mp4", b"x" * 1000)
+    # Abandoned after it ran: derivatives plus the record it upserted, without object_key
+    _put(aws, f"media/{team_id}/partial/photo.jpg", b"x" * 500)
+    _put(aws, f"thumbnails/{team_id}/partial/256.jpg", b"x" * 20)
+    _put(aws, f"thumbnails/{team_id}/partial/512.jpg", b"x" * 30)
+    aws["media_table"].put_item(Item={
+        "team_id": team_id, "sk": "1001#partial", "thumb_key": f"thumbnails/{team_id}/partial/512.jpg",
+    })
+
+
+def _keys(aws):
+    return sorted(o["Key"] for o in aws["s3"].list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+class TestFindOrphans:
+    def test_recent_uploads_are_not_orphans(self, gc_env):
+        _seed(gc_env)
+        # Still within the presign TTL + grace: the client may yet call /media/complete
+        assert find_orphans("team-gc", grace_hours=1) == []
+        assert min_age_seconds(1) > 3600
+
+    def test_unfinalized_originals(self, gc_env):
+        _seed(gc_env)
+        orphans = {o["media_id"]: o for o in find_orphans("team-gc", grace_hours=1, now=LATER)}
+        assert set(orphans) == {"bare", "partial"}
+        assert orphans["bare"]["bytes"] == 1000 and orphans["bare"]["partial_sk"] is None
+        assert orphans["partial"]["partial_sk"] == "1001#partial"
+
+
+class TestCollectTeam:
+    def test_dry_run_deletes_nothing(self, gc_env):
+        _seed(gc_env)
+        before = _keys(gc_env)
+        report = collect_team("team-gc", grace_hours=1, dry_run=True, now=LATER)
+        assert report["uploads"] == 2 and report["reclaimed_bytes"] == 1550
+        assert _keys(gc_env) == before
+        assert gc_env["media_table"].get_item(Key={"team_id": "team-gc", "sk": "1001#partial"}).get("Item")
+
+    def test_deletes_originals_derivatives_and_partial_records(self, gc_env):
+        _seed(gc_env)
+        report = collect_team("team-gc", grace_hours=1, now=LATER)
+        assert report == {
+            "team_id": "team-gc", "uploads": 2, "objects": 2, "bytes": 1500,
+            "derived_objects": 2, "derived_bytes": 50, "partial_records": 1, "failed_objects": 0,
+            "reclaimed_bytes": 1550,
+        }
+        assert _keys(gc_env) == ["media/team-gc/done/photo.jpg", "thumbnails/team-gc/done/512.jpg"]
+        assert not gc_env["media_table"].get_item(Key={"team_id": "team-gc", "sk": "1001#partial"}).get("Item")
+        assert gc_env["media_table"].get_item(Key={"team_id": "team-gc", "sk": "1000#done"}).get("Item")
+
+    def test_completed_mid_run_is_kept(self, gc_env, monkeypatch):
+        _seed(gc_env)
+        real_find = upload_gc.find_orphans
+
+        def find_then_complete(*args, **kwargs):
+            orphans = real_find(*args, **kwargs)
+            gc_env["media_table"].update_item(
+                Key={"team_id": "team-gc", "sk": "1001#partial"},
+                UpdateExpression="SET object_key = :k",
+                ExpressionAttributeValues={":k": "media/team-gc/partial/photo.jpg"},
+            )
+            return orphans
+
+        monkeypatch.setattr(upload_gc, "find_orphans", find_then_complete)
+        report = collect_team("team-gc", grace_hours=1, now=LATER)
+        assert report["uploads"] == 1
+        assert "media/team-gc/partial/photo.jpg" in _keys(gc_env)
+
+
+def test_handler_reports_per_team(gc_env, monkeypatch):
+    _seed(gc_env, "team-a")
+    _put(gc_env, "media/team-b/only/photo.jpg", b"x" * 7)
+    monkeypatch.setattr(upload_gc.time, "time", lambda: LATER)
+    result = upload_gc.handler({"dry_run": True}, None)
+    assert result["teams_checked"] == 2 and result["uploads"] == 3
+    assert {r["team_id"]: r["reclaimed_bytes"] for r in result["reports"]} == {"team-a": 1550, "team-b": 7}
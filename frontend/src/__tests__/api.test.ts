@@ -200,6 +200,23 @@ describe('api module', () => {
       expect(capturedHeaders['content-type']).toBe('image/jpeg')
     })
 
+    it('sends the presigned metadata headers', async () => {
+      let capturedHeaders: Record<string, string> = {}
+      vi.stubGlobal('fetch', vi.fn().mockImplementation((_url: string, opts: any) => {
+        capturedHeaders = opts.headers
+        return Promise.resolve({ ok: true, status: 200 })
+      }))
+
+      const file = fakeFile('photo.jpg', 'image/jpeg')
+      await api.putFileToPresignedUrl('https://s3.example.com/upload', file, 'image/jpeg', {
+        'content-type': 'image/jpeg',
+        'x-amz-meta-media-sk': '1700000000#m1',
+      })
+
+      expect(capturedHeaders['content-type']).toBe('image/jpeg')
+      expect(capturedHeaders['x-amz-meta-media-sk']).toBe('1700000000#m1')
+    })
+
     it('sends the file as the request body', async () => {
       let capturedBody: any = null
       vi.stubGlobal('fetch', vi.fn().mockImplementation((_url: string, opts: any) => {
@@ -0,0 +1,22 @@
+import { describe, it, expect } from 'vitest'
+import { decodeBlurHash } from '../lib/blurhash'
+
+describe('decodeBlurHash', () => {
+  it('decodes a flat colour', () => {
+    // 1x1 components, DC = #FF0000 (same value the backend test pins)
+    const pixels = decodeBlurHash('00TI:j', 4, 4)!
+    expect(pixels).toHaveLength(4 * 4 * 4)
+    expect(Array.from(pixels.slice(0, 4))).toEqual([255, 0, 0, 255])
+  })
+
+  it('decodes a 4x3 hash from the backend encoder', () => {
+    const pixels = decodeBlurHash('L7H2vGyZ$.}+,2S*SuWc+LTqN@T0', 8, 6)
+    expect(pixels).not.toBeNull()
+    expect(pixels!.every((v, i) => i % 4 !== 3 || v === 255)).toBe(true)
+  })
+
+  it('rejects hashes of the wrong length', () => {
+    expect(decodeBlurHash('L7H2vG', 4, 4)).toBeNull()
+    expect(decodeBlurHash('', 4, 4)).toBeNull()
+  })
+})
@@ -1,10 +1,10 @@
 import React, { useState, useEffect } from "react";
 import { navigate } from "../lib/navigation";
+import { getCoachTeamToken } from "../lib/api";
 
 interface Team {
   team_id: string;
   team_name: string;
-  invite_token?: string;
 }
 
 export function CoachTeamsDropdown() {
@@ -71,17 +71,23 @@ export function CoachTeamsDropdown() {
       });
   }
 
-  function handleTeamClick(teamId: string, teamName: string, inviteToken?: string) {
+  async function handleTeamClick(teamId: string, teamName: string) {
+    // Issue an admin invite token for this team so API calls use the correct team
+    let inviteToken: string;
+    try {
+      inviteToken = (await getCoachTeamToken(teamId)).invite_token;
+    } catch (err: any) {
+      console.error("[CoachTeamsDropdown] Token error:", err);
+      setError(err.message || "Failed to open team");
+      return;
+    }
+
     // Store team context
     localStorage.setItem("tmh_current_team_id", teamId);
     localStorage.setItem("team_id", teamId);
     localStorage.setItem("team_name", teamName);
     localStorage.setItem("tmh_last_team_id", teamId);
-    
-    // UPDATE: Store the admin invite token for this team so API calls use the correct team
-    if (inviteToken) {
-      localStorage.setItem("tmh_invite_token", inviteToken);
-    }
+    localStorage.setItem("tmh_invite_token", inviteToken);
 
     navigate(`/team/${teamId}`);
     setOpen(false);
@@ -127,7 +133,7 @@ export function CoachTeamsDropdown() {
     if (teamId) {
       const team = teams.find(t => t.team_id === teamId);
       if (team) {
-        handleTeamClick(team.team_id, team.team_name, team.invite_token);
+        handleTeamClick(team.team_id, team.team_name);
       }
     }
     // Reset select
@@ -215,7 +221,7 @@ export function CoachTeamsDropdown() {
           {teams.map((team) => (
             <button
               key={team.team_id}
-              onClick={() => handleTeamClick(team.team_id, team.team_name, team.invite_token)}
+              onClick={() => handleTeamClick(team.team_id, team.team_name)}
               style={{
                 display: "block",
                 width: "100%",
@@ -2,6 +2,7 @@ import React, { useEffect, useState, useRef } from "react";
 import useEmblaCarousel from "embla-carousel-react";
 import { TransformWrapper, TransformComponent } from "react-zoom-pan-pinch";
 import { MediaItem, presignDownload } from "../lib/api";
+import { StreamingVideo } from "./StreamingVideo";
 
 type Props = {
   open: boolean;
@@ -101,12 +102,16 @@ export function PreviewModal({
       return;
     }
 
-    if (item.preview_url && !isVideo(item.content_type)) {
+    // Videos with a preview_key have a fast-start copy that plays before it's fully downloaded
+    if (item.preview_url && (!isVideo(item.content_type) || item.preview_key)) {
       urlCache.set(mediaId, item.preview_url);
       setUrlFor(mediaId, item.preview_url);
       return;
     }
 
+    // Transcoded videos play from the HLS stream; no download URL needed
+    if (isVideo(item.content_type) && item.stream_url) return;
+
     if (prefetchingRef.current.has(mediaId)) return;
 
     prefetchingRef.current.add(mediaId);
@@ -270,14 +275,17 @@ export function PreviewModal({
                         </div>
                       )}
 
-                      {url ? (
+                      {url || (isVideo(item.content_type) && item.stream_url) ? (
                         isVideo(item.content_type) ? (
                           isCurrent ? (
-                            <video
+                            <StreamingVideo
                               className={`modalMedia ${isLoaded ? "modalMedia-loaded" : ""}`}
                               controls
                               playsInline
-                              src={url}
+                              streamUrl={item.stream_url}
+                              fallbackUrl={url || item.preview_url}
+                              width={item.width ?? undefined}
+                              height={item.height ?? undefined}
                               onLoadedData={() => markLoaded(mediaId)}
                             />
                           ) : (
@@ -301,6 +309,9 @@ export function PreviewModal({
                                 className={`modalMedia ${isLoaded ? "modalMedia-loaded" : ""}`}
                                 alt=""
                                 src={url}
+                                // Intrinsic size from ingest metadata reserves the box before bytes arrive
+                                width={item.width ?? undefined}
+                                height={item.height ?? undefined}
                                 onLoad={() => markLoaded(mediaId)}
                               />
                             </TransformComponent>
@@ -0,0 +1,65 @@
+import React, { useEffect, useRef } from "react";
+
+type Props = Omit<React.VideoHTMLAttributes<HTMLVideoElement>, "src"> & {
+  // HLS master playlist from /media/stream (adaptive bitrate), when transcoded
+  streamUrl?: string | null;
+  // The original upload; used until a stream exists or if HLS playback fails
+  fallbackUrl?: string | null;
+};
+
+const HLS_MIME = "application/vnd.apple.mpegurl";
+
+/**
+ * <video> that prefers the HLS ladder. Safari (incl. iOS) plays HLS natively;
+ * elsewhere hls.js is loaded on demand so it never weighs on the main bundle.
+ */
+export function StreamingVideo({ streamUrl, fallbackUrl, ...videoProps }: Props) {
+  const videoRef = useRef<HTMLVideoElement>(null);
+
+  useEffect(() => {
+    const video = videoRef.current;
+    if (!video) return;
+
+    const useFallback = () => {
+      if (fallbackUrl && video.src !== fallbackUrl) video.src = fallbackUrl;
+    };
+
+    if (!streamUrl) {
+      useFallback();
+      return;
+    }
+    if (video.canPlayType(HLS_MIME)) {
+      video.src = streamUrl;
+      return;
+    }
+
+    let destroyed = false;
+    let hls: { destroy(): void } | null = null;
+    import("hls.js")
+      .then(({ default: Hls }) => {
+        if (destroyed) return;
+        if (!Hls.isSupported()) {
+          useFallback();
+          return;
+        }
+        const player = new Hls({ startLevel: 0 });
+        hls = player;
+        player.on(Hls.Events.ERROR, (_event, data) => {
+          if (data.fatal) {
+            player.destroy();
+            useFallback();
+          }
+        });
+        player.loadSource(streamUrl);
+        player.attachMedia(video);
+      })
+      .catch(useFallback);
+
+    return () => {
+      destroyed = true;
+      hls?.destroy();
+    };
+  }, [streamUrl, fallbackUrl]);
+
+  return <video ref={videoRef} {...videoProps} />;
+}
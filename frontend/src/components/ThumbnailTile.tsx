@@ -1,5 +1,9 @@
 import React, { useState } from "react";
 import { MediaItem } from "../lib/api";
+import { blurHashToDataUrl } from "../lib/blurhash";
+
+// Matches .thumbGrid columns: 2 / 3 / 4 across
+const GRID_SIZES = "(max-width: 679px) 50vw, (max-width: 979px) 33vw, 25vw";
 
 function isVideo(contentType: string) {
   return contentType.startsWith("video/");
@@ -22,21 +26,32 @@ export function ThumbnailTile({
 }) {
   const video = isVideo(item.content_type);
   const [imageError, setImageError] = useState(false);
+  // Videos play their hover loop (a few hundred KB) while a mouse is over the tile
+  const [hovering, setHovering] = useState(false);
+  const showHoverClip = video && hovering && !!item.hover_url;
 
   // Determine if we should show the placeholder (no thumb_url OR image failed to load)
   const showPlaceholder = !item.thumb_url || imageError;
 
+  // Blurred preview painted behind the thumbnail until its bytes arrive
+  const placeholder = blurHashToDataUrl(item.blurhash);
+  const placeholderStyle = placeholder
+    ? { backgroundImage: `url(${placeholder})`, backgroundSize: "cover" }
+    : undefined;
+
   return (
     <div 
       className={`thumbCard${selected ? " thumbCardSelected" : ""}${disabled ? " thumbCardDisabled" : ""}`} 
       onClick={() => !disabled && onClick(item)}
+      onPointerEnter={(e) => e.pointerType === "mouse" && setHovering(true)}
+      onPointerLeave={() => setHovering(false)}
       title={title}
       style={{
         cursor: disabled ? "not-allowed" : "pointer",
         opacity: disabled ? 0.5 : 1,
       }}
     >
-      <div className="thumbMedia">
+      <div className="thumbMedia" style={placeholderStyle}>
         {video ? (
           !showPlaceholder && item.thumb_url ? (
             <div className="thumbVideoPlaceholder">
@@ -47,7 +62,19 @@ export function ThumbnailTile({
                 loading="lazy"
                 onError={() => setImageError(true)}
               />
-              <div className="playBadge">▶</div>
+              {showHoverClip ? (
+                <video
+                  className="thumbImg thumbHoverClip"
+                  src={item.hover_url as string}
+                  muted
+                  loop
+                  autoPlay
+                  playsInline
+                  aria-hidden="true"
+                />
+              ) : (
+                <div className="playBadge">▶</div>
+              )}
             </div>
           ) : (
             <div className="thumbVideoPlaceholder">
@@ -55,14 +82,19 @@ export function ThumbnailTile({
             </div>
           )
         ) : !showPlaceholder && item.thumb_url ? (
-          <img 
-            className="thumbImg" 
-            src={item.thumb_url} 
-            alt={item.filename}
-            loading="lazy"
-            onError={() => setImageError(true)}
-          />
-        ) : (
+          <picture>
+            {item.sources?.map((source) => (
+              <source key={source.type} type={source.type} srcSet={source.srcset} sizes={GRID_SIZES} />
+            ))}
+            <img 
+              className="thumbImg" 
+              src={item.thumb_url} 
+              alt={item.filename}
+              loading="lazy"
+              onError={() => setImageError(true)}
+            />
+          </picture>
+        ) : placeholder ? null : (
           <div className="thumbSkeleton" style={{ background: "linear-gradient(45deg, rgba(255,255,255,0.05) 25%, transparent 25%, transparent 50%, rgba(255,255,255,0.05) 50%, rgba(255,255,255,0.05) 75%, transparent 75%, transparent)", backgroundSize: "20px 20px" }} />
         )}
         {selectMode ? (
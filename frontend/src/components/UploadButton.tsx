@@ -125,7 +125,8 @@ export function UploadButton({ onUploaded, defaultAlbum }: { onUploaded: () => v
         await putFileToPresignedUrl(
           presign.upload_url,
           file,
-          presign.required_headers["content-type"]
+          presign.required_headers["content-type"],
+          presign.required_headers
         );
 
         await completeUpload({
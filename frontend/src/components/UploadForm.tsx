@@ -44,11 +44,16 @@ export const UploadForm: React.FC<UploadFormProps> = ({ token, onUploadComplete
         size_bytes: file.size,
       });
 
-      const { upload_url: uploadUrl, media_id: mediaId, object_key: objectKey } = uploadResponse;
+      const {
+        upload_url: uploadUrl,
+        media_id: mediaId,
+        object_key: objectKey,
+        required_headers: requiredHeaders,
+      } = uploadResponse;
 
       // Step 2: Upload to S3
       setProgress(50);
-      await putFileToPresignedUrl(uploadUrl, file, file.type);
+      await putFileToPresignedUrl(uploadUrl, file, file.type, requiredHeaders);
 
       // Step 3: Mark as complete
       setProgress(75);
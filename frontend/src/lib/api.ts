@@ -118,15 +118,31 @@ export type MediaItem = {
   album_name?: string;
   thumb_key?: string | null;
   thumb_url?: string | null;
+  // Responsive renditions as <picture> sources, best format first (JPEG last)
+  sources?: { type: string; srcset: string }[] | null;
+  // BlurHash placeholder computed at ingest (see lib/blurhash.ts)
+  blurhash?: string | null;
   preview_key?: string | null;
   preview_url?: string | null;
+  // Videos: HLS master playlist (adaptive bitrate) once transcoded
+  stream_url?: string | null;
+  // Videos: short muted loop for grid hover previews
+  hover_url?: string | null;
   uploader_user_id?: string | null;
   uploader_email?: string | null;
+  // Extracted at ingest: display size (after EXIF rotation), capture time, video details
+  width?: number | null;
+  height?: number | null;
+  orientation?: number | null;
+  captured_at?: number | null;
+  duration_ms?: number | null;
+  video_codec?: string | null;
 };
 
-export async function listMedia(params?: { limit?: number; cursor?: string | null }) {
+export async function listMedia(params?: { limit?: number; cursor?: string | null; sort?: "uploaded" | "captured" }) {
   const qs = new URLSearchParams();
   if (params?.limit) qs.set("limit", String(params.limit));
+  if (params?.sort) qs.set("sort", params.sort);
   if (params?.cursor) qs.set("cursor", params.cursor);
   const query = qs.toString() ? `?${qs.toString()}` : "";
   const data = await request<{ items: MediaItem[]; next_cursor: string | null }>(`/media${query}`, {
@@ -146,10 +162,12 @@ export async function presignUpload(input: {
     object_key: string;
     upload_url: string;
     expires_in: number;
-    required_headers: { "content-type": string };
+    required_headers: Record<string, string>;
   }>(`/media/upload-url`, {
     method: "POST",
-    body: JSON.stringify(input),
+    // We forward every required_headers entry on the PUT (putFileToPresignedUrl),
+    // so the server may sign the media-sk metadata into the URL
+    body: JSON.stringify({ ...input, forward_headers: true }),
   });
 }
 
@@ -174,11 +192,17 @@ export async function presignDownload(media_id: string) {
   });
 }
 
-export async function putFileToPresignedUrl(uploadUrl: string, file: File, contentType: string) {
-  // IMPORTANT: must match the ContentType used during presign
+export async function putFileToPresignedUrl(
+  uploadUrl: string,
+  file: File,
+  contentType: string,
+  requiredHeaders: Record<string, string> = {}
+) {
+  // IMPORTANT: must match the ContentType and metadata used during presign
   const res = await fetch(uploadUrl, {
     method: "PUT",
     headers: {
+      ...requiredHeaders,
       "content-type": contentType,
     },
     body: file,
@@ -236,6 +260,14 @@ export async function createInvite(input: { role: "viewer" | "uploader"; expires
   });
 }
 
+// Issue the admin token a coach opens one of their teams with (x-user-token)
+export async function getCoachTeamToken(team_id: string) {
+  return request<{ team_id: string; role: "admin"; invite_token: string }>(`/coach/teams/token`, {
+    method: "POST",
+    body: JSON.stringify({ team_id }),
+  });
+}
+
 export async function getDemoInvite() {
   return request<{
     team_id: string;
@@ -253,6 +285,19 @@ export async function deleteMedia(media_id: string) {
   return request<{ deleted: boolean; media_id: string }>(`/media?${qs}`, { method: "DELETE" });
 }
 
+export type DeleteBatchResult = {
+  media_id: string;
+  deleted: boolean;
+  error?: { message?: string; code?: string };
+};
+
+export async function deleteMediaBatch(media_ids: string[]) {
+  return request<{ results: DeleteBatchResult[]; deleted_count: number; freed_bytes: number }>(
+    "/media/delete-batch",
+    { method: "POST", body: JSON.stringify({ media_ids }) }
+  );
+}
+
 export async function createBillingCheckoutSession(input: { team_id: string; tier: "plus" | "pro" }) {
   return request<{ url: string }>("/billing/checkout-session", {
     method: "POST",
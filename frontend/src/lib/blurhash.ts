@@ -0,0 +1,109 @@
+// Minimal BlurHash decoder (https://blurha.sh) for feed placeholders.
+// The server computes the hash at ingest; we paint it into a tiny canvas and
+// use the resulting data URL as a CSS background until the thumbnail loads.
+
+const B83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~";
+
+// A blur needs very few pixels; the browser scales it up smoothly
+const PLACEHOLDER_SIZE = 32;
+
+const cache = new Map<string, string | null>();
+
+function decode83(str: string): number {
+  let value = 0;
+  for (const ch of str) {
+    value = value * 83 + B83.indexOf(ch);
+  }
+  return value;
+}
+
+function srgbToLinear(value: number): number {
+  const v = value / 255;
+  return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+}
+
+function linearToSrgb(value: number): number {
+  const v = Math.max(0, Math.min(1, value));
+  return v <= 0.0031308
+    ? Math.trunc(v * 12.92 * 255 + 0.5)
+    : Math.trunc((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255 + 0.5);
+}
+
+function signPow(value: number, exp: number): number {
+  return Math.sign(value) * Math.pow(Math.abs(value), exp);
+}
+
+export function decodeBlurHash(hash: string, width: number, height: number): Uint8ClampedArray | null {
+  if (!hash || hash.length < 6) return null;
+
+  const sizeFlag = decode83(hash[0]);
+  const numX = (sizeFlag % 9) + 1;
+  const numY = Math.floor(sizeFlag / 9) + 1;
+  if (hash.length !== 4 + 2 * numX * numY) return null;
+
+  const maxValue = (decode83(hash[1]) + 1) / 166;
+  const colors: number[][] = [];
+
+  const dc = decode83(hash.substring(2, 6));
+  colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+
+  for (let i = 1; i < numX * numY; i++) {
+    const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+    colors.push([
+      signPow((Math.floor(ac / (19 * 19)) - 9) / 9, 2) * maxValue,
+      signPow(((Math.floor(ac / 19) % 19) - 9) / 9, 2) * maxValue,
+      signPow(((ac % 19) - 9) / 9, 2) * maxValue,
+    ]);
+  }
+
+  const pixels = new Uint8ClampedArray(width * height * 4);
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      let r = 0;
+      let g = 0;
+      let b = 0;
+      for (let j = 0; j < numY; j++) {
+        const basisY = Math.cos((Math.PI * y * j) / height);
+        for (let i = 0; i < numX; i++) {
+          const basis = Math.cos((Math.PI * x * i) / width) * basisY;
+          const color = colors[i + j * numX];
+          r += color[0] * basis;
+          g += color[1] * basis;
+          b += color[2] * basis;
+        }
+      }
+      const p = 4 * (x + y * width);
+      pixels[p] = linearToSrgb(r);
+      pixels[p + 1] = linearToSrgb(g);
+      pixels[p + 2] = linearToSrgb(b);
+      pixels[p + 3] = 255;
+    }
+  }
+  return pixels;
+}
+
+/**
+ * Data URL for a BlurHash, cached per hash. Returns null when the hash is
+ * missing/invalid or there's no canvas (SSR, tests).
+ */
+export function blurHashToDataUrl(hash: string | null | undefined): string | null {
+  if (!hash) return null;
+  if (cache.has(hash)) return cache.get(hash) ?? null;
+
+  let url: string | null = null;
+  try {
+    const pixels = decodeBlurHash(hash, PLACEHOLDER_SIZE, PLACEHOLDER_SIZE);
+    const canvas = typeof document !== "undefined" ? document.createElement("canvas") : null;
+    const ctx = canvas?.getContext("2d");
+    if (pixels && canvas && ctx) {
+      canvas.width = PLACEHOLDER_SIZE;
+      canvas.height = PLACEHOLDER_SIZE;
+      ctx.putImageData(new ImageData(pixels, PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), 0, 0);
+      url = canvas.toDataURL();
+    }
+  } catch {
+    url = null;
+  }
+  cache.set(hash, url);
+  return url;
+}
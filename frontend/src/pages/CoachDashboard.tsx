@@ -4,12 +4,14 @@ import { RenameTeamModal } from "../components/RenameTeamModal";
 import { DeleteTeamModal } from "../components/DeleteTeamModal";
 import { VerifyCoachAccess } from "../components/VerifyCoachAccess";
 import { rememberLastTeam } from "../lib/navigation";
+import { getCoachTeamToken } from "../lib/api";
 
 interface Team {
   team_id: string;
   team_name: string;
   role: string;
-  invite_token: string;
+  usage?: { plan: string; used_bytes: number; storage_limit_bytes: number };
+  activity?: { last_upload_at: number | null; uploads_7d: number; uploads_7d_capped: boolean };
 }
 
 export function CoachDashboard() {
@@ -59,15 +61,23 @@ export function CoachDashboard() {
     }
   }
 
-  function handleOpenTeam(team: Team) {
+  async function handleOpenTeam(team: Team) {
     console.log("[CoachDashboard] Opening team:", {
       team_id: team.team_id,
       team_name: team.team_name,
-      invite_token: team.invite_token?.substring(0, 20) + "...",
     });
-    
+
+    // Issue this coach's admin token for the team (only its hash is stored server-side)
+    let inviteToken: string;
+    try {
+      inviteToken = (await getCoachTeamToken(team.team_id)).invite_token;
+    } catch (err: any) {
+      setError(err.message || "Failed to open team");
+      return;
+    }
+
     // Store the invite token and team context
-    localStorage.setItem("tmh_invite_token", team.invite_token);
+    localStorage.setItem("tmh_invite_token", inviteToken);
     localStorage.setItem("team_id", team.team_id);
     localStorage.setItem("team_name", team.team_name);
     localStorage.setItem("tmh_role", team.role);
@@ -4,6 +4,7 @@ from constructs import Construct
 from aws_cdk import (
     Stack,
     Duration,
+    Size,
     RemovalPolicy,
     CfnOutput,
     CfnParameter,
@@ -17,6 +18,12 @@ from aws_cdk import (
     aws_cloudfront as cloudfront,
     aws_cloudfront_origins as origins,
     aws_s3_deployment as s3deploy,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as lambda_event_sources,
+    aws_logs as logs,
+    aws_logs_destinations as logs_destinations,
 )
 
 class TeamMediaHubStack(Stack):
@@ -122,6 +129,7 @@ class TeamMediaHubStack(Stack):
         media_bucket.grant_read(media_oai, "media/*")
         media_bucket.grant_read(media_oai, "thumbnails/*")
         media_bucket.grant_read(media_oai, "previews/*")
+        media_bucket.grant_read(media_oai, "streams/*")
 
         media_distribution = cloudfront.Distribution(
             self,
@@ -134,6 +142,14 @@ class TeamMediaHubStack(Stack):
             ),
             additional_behaviors={
                 # Signed URLs only - no public access
+                # HLS segments: hls.js fetches them with XHR, so they need CORS headers
+                "streams/*": cloudfront.BehaviorOptions(
+                    origin=origins.S3Origin(media_bucket, origin_access_identity=media_oai),
+                    viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                    allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+                    cache_policy=cloudfront.CachePolicy.CACHING_OPTIMIZED,
+                    response_headers_policy=cloudfront.ResponseHeadersPolicy.CORS_ALLOW_ALL_ORIGINS,
+                ),
             },
         )
 
@@ -163,6 +179,14 @@ class TeamMediaHubStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
+        # GSI for team -> invites lookup (revoking a coach's old admin tokens, purge cleanup)
+        invites_table.add_global_secondary_index(
+            index_name="team-role-index",
+            partition_key=dynamodb.Attribute(name="team_id", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="role", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
         media_table = dynamodb.Table(
             self,
             "MediaTable",
@@ -179,6 +203,14 @@ class TeamMediaHubStack(Stack):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
+        # Feed ordered by capture time (EXIF / container), upload time as fallback
+        media_table.add_global_secondary_index(
+            index_name="capture-index",
+            partition_key=dynamodb.Attribute(name="team_id", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="capture_sk", type=dynamodb.AttributeType.STRING),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
         audit_table = dynamodb.Table(
             self,
             "AuditTable",
@@ -321,6 +353,7 @@ class TeamMediaHubStack(Stack):
                 "STRIPE_CANCEL_URL": os.getenv("STRIPE_CANCEL_URL", ""),
                 "CLOUDFRONT_KEY_PAIR_ID": os.getenv("CLOUDFRONT_KEY_PAIR_ID", ""),
                 "CLOUDFRONT_PRIVATE_KEY": os.getenv("CLOUDFRONT_PRIVATE_KEY", ""),
+                "AUDIT_SINK": "log",  # audit events reach the table via AuditLogSubscription, off the request path
                 # FRONTEND_BASE_URL will be set after we create CloudFront distribution
             },
         )
@@ -335,12 +368,37 @@ class TeamMediaHubStack(Stack):
         user_tokens_table.grant_read_write_data(api_fn)
         webhook_events_table.grant_read_write_data(api_fn)
 
+        # Audit log channel: the API prints every audit event as an {"audit": ...}
+        # line (AUDIT_SINK=log); this subscription writes them into the audit table
+        audit_ingest_fn = _lambda.Function(
+            self,
+            "AuditIngestFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="jobs.audit_ingest.handler",
+            code=_lambda.Code.from_asset("../backend/src"),
+            timeout=Duration.seconds(60),
+            memory_size=256,
+            environment={
+                "TABLE_AUDIT": audit_table.table_name,
+            },
+        )
+        audit_table.grant_write_data(audit_ingest_fn)
+
+        logs.SubscriptionFilter(
+            self,
+            "AuditLogSubscription",
+            log_group=api_fn.log_group,
+            destination=logs_destinations.LambdaDestination(audit_ingest_fn),
+            filter_pattern=logs.FilterPattern.literal('{ $.audit.event_id = "*" }'),
+        )
+
         api_fn.add_to_role_policy(iam.PolicyStatement(
             actions=["s3:PutObject", "s3:GetObject", "s3:HeadObject", "s3:DeleteObject"],
             resources=[
                 media_bucket.arn_for_objects("media/*"),
                 media_bucket.arn_for_objects("thumbnails/*"),  # Allow API to fetch thumbnails
                 media_bucket.arn_for_objects("previews/*"),  # Allow API to fetch preview images
+                media_bucket.arn_for_objects("streams/*"),  # HLS playlists (/media/stream) and deletes
             ],
         ))
 
@@ -391,6 +449,7 @@ class TeamMediaHubStack(Stack):
             ("/auth/coach-signin", apigwv2.HttpMethod.POST),
             ("/auth/verify-coach", apigwv2.HttpMethod.POST),
             ("/coach/teams", apigwv2.HttpMethod.GET),
+            ("/coach/teams/token", apigwv2.HttpMethod.POST),
             ("/coach/verify-access", apigwv2.HttpMethod.POST),
             ("/billing/checkout-session", apigwv2.HttpMethod.POST),
             ("/billing/upgrade", apigwv2.HttpMethod.POST),
@@ -398,7 +457,9 @@ class TeamMediaHubStack(Stack):
             ("/billing/webhook", apigwv2.HttpMethod.POST),
             ("/media", apigwv2.HttpMethod.GET),
             ("/media", apigwv2.HttpMethod.DELETE),
+            ("/media/delete-batch", apigwv2.HttpMethod.POST),
             ("/media/thumbnail", apigwv2.HttpMethod.GET),
+            ("/media/stream", apigwv2.HttpMethod.GET),
             ("/media/upload-url", apigwv2.HttpMethod.POST),
             ("/media/complete", apigwv2.HttpMethod.POST),
             ("/media/download-url", apigwv2.HttpMethod.GET),
@@ -421,21 +482,61 @@ class TeamMediaHubStack(Stack):
             "FfmpegLayer",
             code=_lambda.Code.from_asset("../layers/ffmpeg"),
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
-            description="Static ffmpeg binary for video frame extraction",
+            description="Static ffmpeg/ffprobe binaries for video frames and metadata",
         )
 
+        # Derivative work runs in three priority lanes, each its own queue and
+        # event source mapping so its concurrency budget is independent:
+        #   thumb   - S3 notifications; grid-sized image renditions (fast, first)
+        #   preview - the larger image renditions
+        #   video   - posters, container metadata and fast-start MP4 copies
+        #   transcode - HLS ladder, on its own longer-running function
+        # Records that fail are retried on their own and land in the DLQ after 3 attempts.
+        thumb_dlq = sqs.Queue(
+            self,
+            "ThumbnailDLQ",
+            retention_period=Duration.days(14),
+        )
+        lane_queues = {
+            lane: sqs.Queue(
+                self,
+                queue_id,
+                visibility_timeout=visibility,  # >= 6x the consuming function's timeout
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=thumb_dlq),
+            )
+            for lane, queue_id, visibility in (
+                ("thumb", "ThumbnailQueue", Duration.minutes(18)),
+                ("preview", "PreviewQueue", Duration.minutes(18)),
+                ("video", "VideoQueue", Duration.minutes(18)),
+                ("transcode", "TranscodeQueue", Duration.minutes(90)),
+            )
+        }
+        thumb_queue = lane_queues["thumb"]
+
         thumb_fn = _lambda.Function(
             self,
             "ThumbnailFunction",
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="thumbs.thumbnail_handler.handler",
             code=_lambda.Code.from_asset("../backend/src"),
-            timeout=Duration.seconds(120),  # videos need more time than images
-            memory_size=1536,               # more memory = faster ffmpeg decode
+            timeout=Duration.minutes(3),   # a batch of up to 10 objects, videos included
+            memory_size=3008,              # ~2 vCPUs for the render worker processes
+            ephemeral_storage_size=Size.gibibytes(5),  # fast-start remuxes spool via /tmp (2 GiB each, 2 at a time)
             environment={
                 "MEDIA_BUCKET": media_bucket.bucket_name,
                 "TABLE_MEDIA": media_table.table_name,
-                "MEDIA_GSI_NAME": "gsi1",
+                "PREVIEW_QUEUE_URL": lane_queues["preview"].queue_url,
+                "VIDEO_QUEUE_URL": lane_queues["video"].queue_url,
+                "TRANSCODE_QUEUE_URL": lane_queues["transcode"].queue_url,
+                # Objects in flight per batch, per lane (threads; Pillow runs in worker processes)
+                "THUMB_LANE_CONCURRENCY": "thumb=8,preview=3,video=2",
+                # Responsive rendition ladder (longest edge) and formats; AVIF is
+                # skipped automatically if the Pillow layer lacks libavif
+                "RENDITION_SIZES": "256,512,1024,1600,2560",
+                "RENDITION_FORMATS": "avif,webp,jpeg",
+                # Per render process; two of them plus S3 buffers fit in 3008 MB.
+                # Bigger decodes are refused (ImageDecodeRejected metric)
+                "THUMB_DECODE_BUDGET_MB": "512",
             },
             layers=[pillow_layer, ffmpeg_layer],
         )
@@ -447,9 +548,158 @@ class TeamMediaHubStack(Stack):
 
         media_bucket.add_event_notification(
             s3.EventType.OBJECT_CREATED,
-            s3n.LambdaDestination(thumb_fn),
+            s3n.SqsDestination(thumb_queue),
             s3.NotificationKeyFilter(prefix="media/")
         )
+        # (lane, batch size, batching window, max concurrent invocations)
+        for lane, batch_size, window_seconds, max_concurrency in (
+            ("thumb", 10, 1, 20),
+            ("preview", 5, 5, 8),
+            ("video", 2, 5, 4),
+        ):
+            thumb_fn.add_event_source(lambda_event_sources.SqsEventSource(
+                lane_queues[lane],
+                batch_size=batch_size,
+                max_batching_window=Duration.seconds(window_seconds),
+                max_concurrency=max_concurrency,
+                report_batch_item_failures=True,
+            ))
+        for lane in ("preview", "video", "transcode"):
+            lane_queues[lane].grant_send_messages(thumb_fn)
+
+        # HLS transcodes: same code, but minutes of x264 per video - more vCPUs,
+        # the full 15 minutes and /tmp room for the segments before upload
+        transcode_fn = _lambda.Function(
+            self,
+            "TranscodeFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="thumbs.thumbnail_handler.handler",
+            code=_lambda.Code.from_asset("../backend/src"),
+            timeout=Duration.minutes(15),
+            memory_size=10240,  # 6 vCPUs for libx264
+            ephemeral_storage_size=Size.gibibytes(10),
+            environment={
+                "MEDIA_BUCKET": media_bucket.bucket_name,
+                "TABLE_MEDIA": media_table.table_name,
+                "TRANSCODE_TIMEOUT_SECONDS": "780",
+            },
+            layers=[pillow_layer, ffmpeg_layer],
+        )
+        media_bucket.grant_read(transcode_fn, "media/*")
+        media_bucket.grant_put(transcode_fn, "streams/*")
+        media_table.grant_read_write_data(transcode_fn)
+        transcode_fn.add_event_source(lambda_event_sources.SqsEventSource(
+            lane_queues["transcode"],
+            batch_size=1,
+            max_concurrency=5,
+            report_batch_item_failures=True,
+        ))
+
+        # -------------------------
+        # Team Purge Job (soft-deleted teams, after grace period)
+        # -------------------------
+        purge_fn = _lambda.Function(
+            self,
+            "TeamPurgeFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="jobs.team_purge.handler",
+            code=_lambda.Code.from_asset("../backend/src"),
+            timeout=Duration.minutes(15),  # checkpoints and resumes on the next run
+            memory_size=512,
+            environment={
+                "MEDIA_BUCKET": media_bucket.bucket_name,
+                "TABLE_TEAMS": teams_table.table_name,
+                "TABLE_MEDIA": media_table.table_name,
+                "TABLE_AUDIT": audit_table.table_name,
+                "TABLE_INVITES": invites_table.table_name,
+                "PURGE_GRACE_DAYS": "30",
+                "PURGE_CONCURRENCY": "4",
+            },
+        )
+
+        media_bucket.grant_read(purge_fn)    # ListBucket for the prefix sweep
+        media_bucket.grant_delete(purge_fn)
+        teams_table.grant_read_write_data(purge_fn)
+        media_table.grant_read_write_data(purge_fn)
+        audit_table.grant_read_write_data(purge_fn)
+        invites_table.grant_read_write_data(purge_fn)
+
+        events.Rule(
+            self,
+            "TeamPurgeSchedule",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+            targets=[targets.LambdaFunction(purge_fn)],
+        )
+
+        # -------------------------
+        # Upload GC (originals never finalized by /media/complete)
+        # -------------------------
+        upload_gc_fn = _lambda.Function(
+            self,
+            "UploadGcFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="jobs.upload_gc.handler",
+            code=_lambda.Code.from_asset("../backend/src"),
+            timeout=Duration.minutes(15),  # stops between teams; the next run starts over
+            memory_size=256,
+            environment={
+                "MEDIA_BUCKET": media_bucket.bucket_name,
+                "TABLE_MEDIA": media_table.table_name,
+                "SIGNED_URL_TTL_SECONDS": "900",  # same as the API: uploads can start until this expires
+                "UPLOAD_GC_GRACE_HOURS": "24",
+            },
+        )
+
+        media_bucket.grant_read(upload_gc_fn)    # ListBucket
+        media_bucket.grant_delete(upload_gc_fn)
+        media_table.grant_read_write_data(upload_gc_fn)
+
+        events.Rule(
+            self,
+            "UploadGcSchedule",
+            schedule=events.Schedule.rate(Duration.days(1)),
+            targets=[targets.LambdaFunction(upload_gc_fn)],
+        )
+
+        # -------------------------
+        # Storage Reconcile (used_bytes vs media records, every team)
+        # -------------------------
+        reconcile_fn = _lambda.Function(
+            self,
+            "StorageReconcileFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="jobs.storage_reconcile.handler",
+            code=_lambda.Code.from_asset("../backend/src"),
+            timeout=Duration.minutes(15),  # stops starting teams near the end; the next run covers them
+            memory_size=256,
+            environment={
+                "MEDIA_BUCKET": media_bucket.bucket_name,
+                "TABLE_TEAMS": teams_table.table_name,
+                "TABLE_MEDIA": media_table.table_name,
+                "RECONCILE_CONCURRENCY": "8",
+            },
+        )
+
+        media_bucket.grant_read(reconcile_fn)    # ListBucket for the S3 comparison
+        teams_table.grant_read_write_data(reconcile_fn)
+        media_table.grant_read_data(reconcile_fn)
+
+        events.Rule(
+            self,
+            "StorageReconcileSchedule",
+            schedule=events.Schedule.rate(Duration.days(1)),
+            targets=[targets.LambdaFunction(reconcile_fn)],
+        )
+        # Weekly: also list the bucket, for stored bytes and derivatives
+        events.Rule(
+            self,
+            "StorageReconcileS3Schedule",
+            schedule=events.Schedule.rate(Duration.days(7)),
+            targets=[targets.LambdaFunction(
+                reconcile_fn,
+                event=events.RuleTargetInput.from_object({"include_s3": True}),
+            )],
+        )
 
         # -------------------------
         # Frontend Hosting: S3 + CloudFront (private bucket)
@@ -518,5 +768,6 @@ class TeamMediaHubStack(Stack):
         # -------------------------
         CfnOutput(self, "ApiBaseUrl", value=http_api.url or "")
         CfnOutput(self, "MediaBucketName", value=media_bucket.bucket_name)
+        CfnOutput(self, "ThumbnailDLQUrl", value=thumb_dlq.queue_url)
         CfnOutput(self, "MediaDistributionDomain", value=media_distribution.domain_name)
         CfnOutput(self, "SiteUrl", value=f"https://{distribution.domain_name}")
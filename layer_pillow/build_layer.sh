@@ -8,7 +8,7 @@ mkdir -p "$OUT/python"
 
 # Build in Lambda-compatible container (Amazon Linux)
 docker run --rm -v "$OUT":/var/task public.ecr.aws/lambda/python:3.12 \
-  bash -lc "pip install --no-cache-dir pillow pillow-heif -t /var/task/python"
+  bash -lc "pip install --no-cache-dir pillow pillow-heif numpy -t /var/task/python"
 
 cd "$OUT"
 zip -r "$ROOT/pillow_layer.zip" python >/dev/null
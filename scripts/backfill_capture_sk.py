@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Give every existing media item a capture-index sort key.
+
+capture-index (team_id, capture_sk) is sparse: /media/complete writes
+capture_sk (upload time until the thumbnail stage knows the capture time),
+but items completed before it did have none and are missing from the
+sort=captured feed. This sets capture_sk = capture_sort_key(created_at,
+media_id) on those items with if_not_exists, so a capture time written in
+the meantime is never overwritten, and only on items that still exist.
+
+Safe to re-run: the scan selects only items still without capture_sk.
+
+Usage:
+  python3 scripts/backfill_capture_sk.py prod --dry-run
+  python3 scripts/backfill_capture_sk.py staging --segments 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend", "src"))
+
+from ops import REGION, STAGES, stack_resources, scan_pages
+from common.db import capture_sort_key
+
+
+def upload_sort_key(item: dict) -> str:
+    """capture_sk from upload time, for an item in the low-level client's DynamoDB JSON."""
+    sk = item["sk"]["S"]
+    media_id = item.get("media_id", {}).get("S") or sk.rsplit("#", 1)[-1]
+    created_at = item.get("created_at", {}).get("N") or sk.split("#", 1)[0]
+    return capture_sort_key(int(created_at), media_id)
+
+
+def backfill(ddb, table: str, segments: int = 1, dry_run: bool = False) -> dict:
+    """Set capture_sk on every finalized item without one; returns counts."""
+    counts = {"updated": 0, "gone": 0}
+    lock = threading.Lock()
+
+    def run_segment(segment):
+        pages = scan_pages(
+            ddb, table, segment, segments,
+            FilterExpression="attribute_exists(object_key) AND attribute_not_exists(capture_sk)",
+            ProjectionExpression="team_id, sk, media_id, created_at",
+        )
+        for items, _ in pages:
+            for item in items:
+                outcome = "updated"
+                if not dry_run:
+                    try:
+                        ddb.update_item(
+                            TableName=table,
+                            Key={"team_id": item["team_id"], "sk": item["sk"]},
+                            UpdateExpression="SET capture_sk = if_not_exists(capture_sk, :c)",
+                            ConditionExpression="attribute_exists(sk)",
+                            ExpressionAttributeValues={":c": {"S": upload_sort_key(item)}},
+                        )
+                    except ClientError as e:
+                        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                            raise
+                        outcome = "gone"  # deleted since the scan read it
+                with lock:
+                    counts[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for f in [pool.submit(run_segment, s) for s in range(segments)]:
+            f.result()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set capture_sk on media items that predate capture-index")
+    parser.add_argument("stage", nargs="?", default="prod", choices=STAGES)
+    parser.add_argument("--segments", type=int, default=8, help="DynamoDB parallel scan segments")
+    parser.add_argument("--dry-run", action="store_true", help="Count the items without writing")
+    args = parser.parse_args()
+
+    table = stack_resources(args.stage)["MediaTable"]
+    print(f"Environment: {args.stage} {'(DRY RUN)' if args.dry_run else ''}\n  Table: {table}\n")
+    started = time.time()
+    counts = backfill(boto3.client("dynamodb", region_name=REGION), table, args.segments, args.dry_run)
+    print(f"{'Would update' if args.dry_run else 'Updated'} {counts['updated']} items "
+          f"({counts['gone']} deleted mid-run) in {time.time() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,201 +1,327 @@
 #!/usr/bin/env python3
 """
-Backfill missing thumbnails and previews for media items.
-
-Reads images from S3, generates thumb (512px) + preview (1600px),
-uploads them back to S3, and updates DynamoDB records.
-
-Supports HEIC via pillow-heif (install: pip3 install pillow-heif).
+Backfill derivatives (rendition ladder, BlurHash, metadata; posters, hover
+loops, fast-start copies and HLS for videos) for existing media items.
+
+Runs the thumbnail Lambda's own pipeline (thumbs.thumbnail_handler
+.process_object) so backfilled items are indistinguishable from new uploads.
+Items are found with a parallel scan of the media table; each object is
+downloaded, rendered and uploaded in a worker process, with the originals
+in flight capped at --max-inflight-mb. Progress is checkpointed per scan
+segment after each completed page, so an interrupted run picks up where it
+left off (items already derived for their ETag and the current pipeline
+version are skipped by the handler, so re-running a page is cheap). Items
+that failed are kept in the checkpoint's retry list and tried again first
+on the next run.
+
+By default this selects items not yet derived by the current pipeline
+version (derived_version, see backend/src/common/derivatives.py); use
+--only-missing for items with no thumbnail at all, or --work-list to process
+the missing_derivatives found by scripts/check_missing_thumbs.py (those are
+regenerated even if the item is marked as derived, since the bucket says
+otherwise).
+
+Needs pillow-heif for HEIC and ffmpeg/ffprobe on PATH for videos.
 
 Usage:
-  python3 scripts/backfill_thumbnails.py prod     # production
-  python3 scripts/backfill_thumbnails.py staging   # staging
+  python3 scripts/backfill_thumbnails.py prod
+  python3 scripts/backfill_thumbnails.py staging --segments 8 --processes 6
+  python3 scripts/backfill_thumbnails.py prod --images-only --only-missing
   python3 scripts/backfill_thumbnails.py prod --dry-run
+  python3 scripts/backfill_thumbnails.py prod --work-list prod-missing.jsonl
+  python3 scripts/backfill_thumbnails.py prod --checkpoint backfill-prod.json   # resume
 """
-import io
+import argparse
+import json
+import multiprocessing
 import os
+import signal
 import sys
-import boto3
-from PIL import Image
-
-# Register HEIC support if available
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-    HEIC_SUPPORT = True
-except ImportError:
-    HEIC_SUPPORT = False
-
-MAX_THUMB = 512
-JPEG_QUALITY_THUMB = 78
-MAX_PREVIEW = 1600
-JPEG_QUALITY_PREVIEW = 82
-
-ENVS = {
-    "prod": {
-        "TABLE": "TeamMediaHubStack-MediaTableCFC93525-8YTEVX5PQ0Z9",
-        "BUCKET": "teammediahubstack-mediabucketbcbb02ba-yya0tjoyk8dm",
-    },
-    "staging": {
-        "TABLE": "TeamMediaHubStack-Staging-MediaTableCFC93525-1WCAV0MVU03C7",
-        "BUCKET": "teammediahubstack-staging-mediabucketbcbb02ba-c1zsibc2uhk6",
-    },
-}
-
-
-def _fix_orientation(im):
-    try:
-        exif = im.getexif()
-        orientation = exif.get(274)
-        if orientation == 3:
-            im = im.rotate(180, expand=True)
-        elif orientation == 6:
-            im = im.rotate(270, expand=True)
-        elif orientation == 8:
-            im = im.rotate(90, expand=True)
-    except Exception:
-        pass
-    return im
-
-
-def _to_rgb(im):
-    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
-        bg = Image.new("RGB", im.size, (255, 255, 255))
-        bg.paste(im.convert("RGBA"), mask=im.convert("RGBA").split()[-1])
-        return bg
-    elif im.mode != "RGB":
-        return im.convert("RGB")
-    return im
-
-
-def make_thumb(image_bytes):
-    im = Image.open(io.BytesIO(image_bytes))
-    im = _fix_orientation(im)
-    im.thumbnail((MAX_THUMB, MAX_THUMB))
-    im = _to_rgb(im)
-    out = io.BytesIO()
-    im.save(out, format="JPEG", quality=JPEG_QUALITY_THUMB, optimize=True)
-    return out.getvalue()
-
-
-def make_preview(image_bytes):
-    im = Image.open(io.BytesIO(image_bytes))
-    im = _fix_orientation(im)
-    im.thumbnail((MAX_PREVIEW, MAX_PREVIEW))
-    im = _to_rgb(im)
-    out = io.BytesIO()
-    im.save(out, format="JPEG", quality=JPEG_QUALITY_PREVIEW, optimize=True)
-    return out.getvalue()
-
-
-def main():
-    env = sys.argv[1] if len(sys.argv) > 1 else "prod"
-    dry_run = "--dry-run" in sys.argv
-
-    if env not in ENVS:
-        print(f"Unknown env: {env}. Use 'prod' or 'staging'.")
-        sys.exit(1)
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-    cfg = ENVS[env]
-    TABLE = cfg["TABLE"]
-    BUCKET = cfg["BUCKET"]
-
-    print(f"Environment: {env} {'(DRY RUN)' if dry_run else ''}")
-    print(f"HEIC support: {HEIC_SUPPORT}")
-    print()
+import boto3
 
-    ddb = boto3.client("dynamodb", region_name="us-east-1")
-    s3 = boto3.client("s3", region_name="us-east-1")
-
-    # Scan for items missing thumb_key
-    items = []
-    kwargs = {"TableName": TABLE, "FilterExpression": "attribute_not_exists(thumb_key)"}
-    while True:
-        resp = ddb.scan(**kwargs)
-        items.extend(resp.get("Items", []))
-        lek = resp.get("LastEvaluatedKey")
-        if not lek:
-            break
-        kwargs["ExclusiveStartKey"] = lek
-
-    # Filter to images only
-    image_items = [
-        i for i in items
-        if i.get("content_type", {}).get("S", "").startswith("image/")
-    ]
-
-    print(f"Found {len(items)} items missing thumb_key ({len(image_items)} images, {len(items) - len(image_items)} videos/other)")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend", "src"))
+
+from ops import REGION, STAGES, stack_resources, scan_pages, write_json
+from common.derivatives import PIPELINE_VERSION
+
+MB = 1024 * 1024
+PAGE_SIZE = 100
+REPORT_EVERY_SECONDS = 10
+
+
+# ---------------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------------
+_handler = None
+_bucket = None
+
+
+def _init_worker(table: str, bucket: str, verbose: bool):
+    """The handler reads its table and bucket from the environment at import."""
+    global _handler, _bucket
+    # Ctrl-C reaches the whole process group; the parent handles it and lets
+    # in-flight items finish, so a worker must not die with them half done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["TABLE_MEDIA"] = table
+    os.environ["MEDIA_BUCKET"] = bucket
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+    if not verbose:
+        # The handler prints a CloudWatch EMF line per metric
+        sys.stdout = open(os.devnull, "w")
+    from thumbs import thumbnail_handler
+    _handler, _bucket = thumbnail_handler, bucket
+
+
+def _worker_pool(args, table: str, bucket: str) -> ProcessPoolExecutor:
+    # spawn, not fork: each worker builds its own boto3 clients in _init_worker
+    return ProcessPoolExecutor(
+        max_workers=args.processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker, initargs=(table, bucket, args.verbose),
+    )
+
+
+def _process(key: str, sk: str = None, force: bool = False) -> float:
+    started = time.time()
+    # sk links the derivatives even for originals uploaded without media-sk metadata
+    _handler.process_object(_bucket, key, force=force, sk=sk)
+    return time.time() - started
+
+
+# ---------------------------------------------------------------------------
+# Orchestration
+# ---------------------------------------------------------------------------
+class ByteBudget:
+    """Bounds the original bytes being worked on at once; one item always fits."""
+
+    def __init__(self, limit: int):
+        self.limit, self.used = limit, 0
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int):
+        with self._cond:
+            while self.used and self.used + n > self.limit:
+                self._cond.wait()
+            self.used += n
+
+    def release(self, n: int):
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.time()
+        self.items = self.bytes = self.failed = 0
+        self.lock = threading.Lock()
+
+    def add(self, size: int, ok: bool):
+        with self.lock:
+            if ok:
+                self.items += 1
+                self.bytes += size
+            else:
+                self.failed += 1
+
+    def line(self) -> str:
+        elapsed = max(time.time() - self.started, 1e-6)
+        return (
+            f"{self.items} items ({self.bytes / MB:.0f} MB) in {elapsed:.0f}s: "
+            f"{self.items / elapsed:.2f} items/s, {self.bytes / MB / elapsed:.2f} MB/s, failed={self.failed}"
+        )
+
+
+def _selection(args) -> dict:
+    kinds = ["image/"] if args.images_only else ["image/", "video/"]
+    values = {f":k{i}": {"S": k} for i, k in enumerate(kinds)}
+    kind_filter = " OR ".join(f"begins_with(content_type, :k{i})" for i in range(len(kinds)))
+    if args.only_missing:
+        needs = "attribute_not_exists(thumb_key)"
+    else:
+        needs = "attribute_not_exists(derived_version) OR derived_version < :v"
+        values[":v"] = {"N": str(PIPELINE_VERSION)}
+    return {
+        "FilterExpression": f"attribute_exists(object_key) AND ({kind_filter}) AND ({needs})",
+        "ExpressionAttributeValues": values,
+        "ProjectionExpression": "sk, object_key, size_bytes",
+        "Limit": PAGE_SIZE,
+    }
+
+
+def _scan_source(ddb, table: str, segment: int, args, start_key: dict):
+    """(object_key, size, sk) pages from one scan segment, with the key to resume after each."""
+    for items, last_key in scan_pages(ddb, table, segment, args.segments, start_key, **_selection(args)):
+        yield [
+            (i["object_key"]["S"], int(i.get("size_bytes", {}).get("N", 0)), i["sk"]["S"])
+            for i in items
+        ], last_key
+
+
+def _retry_source(retry: dict):
+    """(object_key, size, sk) pages of the items earlier runs failed on; no position to resume at."""
+    entries = [(key, int(e.get("size") or 0), e.get("sk")) for key, e in sorted(retry.items())]
+    for start in range(0, len(entries), PAGE_SIZE):
+        yield entries[start:start + PAGE_SIZE], None
+
+
+def _work_list_source(path: str, offset: int):
+    """(object_key, size, sk) pages from a work list, with the line offset to resume at."""
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    for start in range(offset or 0, len(lines), PAGE_SIZE):
+        end = min(start + PAGE_SIZE, len(lines))
+        entries = [json.loads(line) for line in lines[start:end]]
+        yield [(e["object_key"], int(e.get("size_bytes") or 0), e.get("sk")) for e in entries], end if end < len(lines) else None
+
+
+# Checkpoint fields that must match for a checkpoint to be resumed
+_RUN_IDENTITY = ("table", "segments", "version", "only_missing", "images_only", "work_list")
+
+# Source name of the retry list (never finished: entries leave it as they succeed)
+RETRY = "retry"
+
+
+def _load_checkpoint(path: str, table: str, args) -> dict:
+    fresh = {
+        "table": table, "segments": args.segments, "version": PIPELINE_VERSION,
+        "only_missing": args.only_missing, "images_only": args.images_only, "work_list": args.work_list,
+        "positions": {}, "finished": [], "retry": {},
+    }
+    if not os.path.exists(path):
+        return fresh
+    with open(path) as f:
+        saved = json.load(f)
+    if any(saved.get(k) != fresh[k] for k in _RUN_IDENTITY):
+        sys.exit(f"{path} is from a different run (table/segments/version/selection); remove it to start over")
+    saved.setdefault("retry", {})
+    return saved
+
+
+def run(args):
+    resources = stack_resources(args.stage)
+    table, bucket = resources["MediaTable"], resources["MediaBucket"]
+    checkpoint_path = args.checkpoint or f"backfill-{args.stage}.checkpoint.json"
+    checkpoint = _load_checkpoint(checkpoint_path, table, args)
+    checkpoint_lock = threading.Lock()
+
+    print(f"Environment: {args.stage} {'(DRY RUN)' if args.dry_run else ''}")
+    print(f"  Table:  {table}\n  Bucket: {bucket}")
+    print(f"  Pipeline v{PIPELINE_VERSION}, {args.segments} scan segments, {args.processes} processes, "
+          f"{args.max_inflight_mb} MB in flight, checkpoint {checkpoint_path}")
+    if args.work_list:
+        print(f"  Work list: {args.work_list}")
+    if checkpoint["positions"] or checkpoint["finished"] or checkpoint["retry"]:
+        print(f"  Resuming: {len(checkpoint['finished'])} sources finished, {len(checkpoint['positions'])} part-way, "
+              f"{len(checkpoint['retry'])} items to retry")
     print()
 
-    success = 0
-    failed = 0
-    skipped = 0
-
-    for item in image_items:
-        media_id = item.get("gsi1pk", {}).get("S", "?")
-        content_type = item.get("content_type", {}).get("S", "?")
-        object_key = item.get("object_key", {}).get("S", "")
-        filename = item.get("filename", {}).get("S", "?")
-        team_id = item.get("team_id", {}).get("S", "")
-        sk = item.get("sk", {}).get("S", "")
-
-        is_heic = content_type.lower() in ("image/heic", "image/heif")
-        if is_heic and not HEIC_SUPPORT:
-            print(f"  SKIP (no HEIC support): {filename}")
-            skipped += 1
-            continue
-
-        if dry_run:
-            print(f"  DRY RUN: Would process {filename} ({content_type})")
-            continue
-
-        try:
-            # Download source image
-            raw = s3.get_object(Bucket=BUCKET, Key=object_key)["Body"].read()
-            print(f"  Downloaded {filename} ({len(raw)} bytes)")
-
-            # Generate thumbnail + preview
-            thumb_bytes = make_thumb(raw)
-            preview_bytes = make_preview(raw)
-            print(f"    Thumb: {len(thumb_bytes)} bytes, Preview: {len(preview_bytes)} bytes")
-
-            # Determine keys
-            thumb_key = f"thumbnails/{team_id}/{media_id}/thumb.jpg"
-            preview_key = f"previews/{team_id}/{media_id}/preview.jpg"
-
-            # Upload to S3
-            s3.put_object(
-                Bucket=BUCKET, Key=thumb_key, Body=thumb_bytes,
-                ContentType="image/jpeg", CacheControl="private, max-age=86400",
-            )
-            s3.put_object(
-                Bucket=BUCKET, Key=preview_key, Body=preview_bytes,
-                ContentType="image/jpeg", CacheControl="private, max-age=86400",
-            )
-            print(f"    Uploaded: {thumb_key}")
-            print(f"    Uploaded: {preview_key}")
-
-            # Update DynamoDB
-            ddb.update_item(
-                TableName=TABLE,
-                Key={"team_id": {"S": team_id}, "sk": {"S": sk}},
-                UpdateExpression="SET thumb_key = :t, preview_key = :p",
-                ExpressionAttributeValues={
-                    ":t": {"S": thumb_key},
-                    ":p": {"S": preview_key},
-                },
-            )
-            print(f"    Updated DynamoDB record")
-            success += 1
-
-        except Exception as e:
-            print(f"  FAILED {filename}: {e}")
-            failed += 1
+    ddb = boto3.client("dynamodb", region_name=REGION)
+    if args.work_list:
+        sources = {"work-list": lambda start: _work_list_source(args.work_list, start)}
+    else:
+        sources = {
+            str(segment): (lambda start, segment=segment: _scan_source(ddb, table, segment, args, start))
+            for segment in range(args.segments)
+        }
+    if checkpoint["retry"]:
+        retry = dict(checkpoint["retry"])
+        sources[RETRY] = lambda start: _retry_source(retry)
+    budget = ByteBudget(args.max_inflight_mb * MB)
+    stats = Stats()
+    stop = threading.Event()
+
+    pool = None if args.dry_run else _worker_pool(args, table, bucket)
+
+    def done_callback(key, size):
+        def done(future):
+            budget.release(size)
+            error = future.exception()
+            if error:
+                print(f"  FAILED {key}: {error}")
+            stats.add(size, error is None)
+        return done
+
+    def run_source(name: str):
+        if name in checkpoint["finished"]:
+            return
+        for entries, position in sources[name](checkpoint["positions"].get(name)):
+            futures = []
+            for key, size, sk in entries:
+                if stop.is_set():
+                    return
+                if args.dry_run:
+                    stats.add(size, True)
+                    continue
+                budget.acquire(size)
+                future = pool.submit(_process, key, sk, bool(args.work_list))
+                future.add_done_callback(done_callback(key, size))
+                futures.append(((key, size, sk), future))
+            # Wait; failures are reported by the callback and kept for the next run
+            failed = [entry for entry, future in futures if future.exception() is not None]
+            if stop.is_set():
+                return
+            # The page is done: resume after it next time, retrying what failed
+            with checkpoint_lock:
+                for key, size, sk in entries:
+                    checkpoint["retry"].pop(key, None)
+                for key, size, sk in failed:
+                    checkpoint["retry"][key] = {"size": size, "sk": sk}
+                if name == RETRY:
+                    pass  # entries leave the list as they succeed
+                elif position is not None:
+                    checkpoint["positions"][name] = position
+                else:
+                    checkpoint["positions"].pop(name, None)
+                    checkpoint["finished"].append(name)
+                if not args.dry_run:
+                    write_json(checkpoint_path, checkpoint)
+
+    def report():
+        while not stop.wait(REPORT_EVERY_SECONDS):
+            print(f"[BACKFILL] {stats.line()}")
+
+    threading.Thread(target=report, daemon=True).start()
+    scanners = ThreadPoolExecutor(max_workers=len(sources))
+    try:
+        for f in [scanners.submit(run_source, name) for name in sources]:
+            f.result()
+    except KeyboardInterrupt:
+        print("\nInterrupted; waiting for in-flight items (the current pages are redone next run)")
+    finally:
+        stop.set()
+        scanners.shutdown(wait=True)
+        if pool is not None:
+            pool.shutdown(wait=True)
 
     print(f"\n--- Results ---")
-    print(f"Success: {success}")
-    print(f"Failed:  {failed}")
-    print(f"Skipped: {skipped}")
+    print(("Would process " if args.dry_run else "Processed ") + stats.line())
+    if not args.dry_run:
+        if checkpoint["retry"]:
+            print(f"{len(checkpoint['retry'])} failed items are kept in {checkpoint_path} and retried first next run")
+        if len(checkpoint["finished"]) == len(sources) - (RETRY in sources) and not checkpoint["retry"]:
+            print(f"All segments finished; {checkpoint_path} can be removed")
+        else:
+            print(f"Re-run with --checkpoint {checkpoint_path} to resume")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill media derivatives with the thumbnail Lambda's pipeline")
+    parser.add_argument("stage", nargs="?", default="prod", choices=STAGES)
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be processed without writing")
+    parser.add_argument("--segments", type=int, default=8, help="DynamoDB parallel scan segments")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument("--max-inflight-mb", type=int, default=2048, help="Cap on original bytes being processed at once")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default backfill-<stage>.checkpoint.json)")
+    parser.add_argument("--only-missing", action="store_true", help="Only items without a thumbnail")
+    parser.add_argument("--images-only", action="store_true", help="Skip videos")
+    parser.add_argument("--work-list", help="JSON lines from check_missing_thumbs.py --work-list instead of a scan")
+    parser.add_argument("--verbose", action="store_true", help="Show the handler's metric lines")
+    run(parser.parse_args())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark image rendition generation: legacy two-decode path vs the
+single-decode engine in backend/src/thumbs/renditions.py, and the thumb
+lane's grid slots from a full decode vs from the embedded preview.
+
+Builds a corpus of synthetic JPEG / PNG (/ HEIC when pillow-heif is installed,
+with an iPhone-style 320px thumbnail item) inputs, then runs each
+(implementation, input) pair in a fresh subprocess so peak RSS is measured
+per case.
+
+Usage:
+  python3 scripts/bench_renditions.py                 # default corpus
+  python3 scripts/bench_renditions.py --runs 5 --mp 12 48
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend", "src"))
+
+from PIL import Image
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIC_SUPPORT = True
+except ImportError:
+    HEIC_SUPPORT = False
+
+THUMB = ("thumb", 300, 78)
+PREVIEW = ("preview", 1600, 82)
+
+
+# ---------------------------------------------------------------------------
+# Legacy path: what thumbnail_handler did before the rendition engine
+# (full decode + full-resolution rotate, once per rendition)
+# ---------------------------------------------------------------------------
+def _legacy_one(image_bytes: bytes, max_size: int, quality: int) -> bytes:
+    im = Image.open(io.BytesIO(image_bytes))
+    try:
+        orientation = im.getexif().get(274)
+        if orientation == 3:
+            im = im.rotate(180, expand=True)
+        elif orientation == 6:
+            im = im.rotate(270, expand=True)
+        elif orientation == 8:
+            im = im.rotate(90, expand=True)
+    except Exception:
+        pass
+    im.thumbnail((max_size, max_size))
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(im.convert("RGBA"), mask=im.convert("RGBA").split()[-1])
+        im = bg
+    elif im.mode != "RGB":
+        im = im.convert("RGB")
+    out = io.BytesIO()
+    im.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def legacy(image_bytes: bytes) -> dict:
+    return {
+        "thumb": _legacy_one(image_bytes, THUMB[1], THUMB[2]),
+        "preview": _legacy_one(image_bytes, PREVIEW[1], PREVIEW[2]),
+    }
+
+
+def engine(image_bytes: bytes) -> dict:
+    from thumbs.renditions import render_image
+    return render_image(image_bytes, [PREVIEW, THUMB])
+
+
+# Thumb lane: grid slots only
+GRID_SIZES = [256, 512]
+EMBEDDED_MIN_EDGE = 256
+
+
+def grid_full(image_bytes: bytes) -> list:
+    from thumbs.renditions import render_ladder
+    return render_ladder(image_bytes, GRID_SIZES, ["jpeg"])
+
+
+def grid_embedded(image_bytes: bytes) -> list:
+    from thumbs.renditions import render_ladder
+    return render_ladder(image_bytes, GRID_SIZES, ["jpeg"], embedded_min_edge=EMBEDDED_MIN_EDGE)
+
+
+IMPLS = {"legacy": legacy, "engine": engine, "grid-full": grid_full, "grid-embedded": grid_embedded}
+
+
+# ---------------------------------------------------------------------------
+# Corpus
+# ---------------------------------------------------------------------------
+def _synthetic(width: int, height: int) -> Image.Image:
+    """Gradient + noise so encoders can't cheat on flat colour."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def build_corpus(out_dir: str, megapixels) -> list:
+    cases = []
+    for mp in megapixels:
+        width = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        im = _synthetic(width, height)
+
+        exif = Image.Exif()
+        exif[274] = 6  # phone held upright: forces a rotate in the legacy path
+        formats = [("jpeg", "JPEG", {"quality": 92, "exif": exif}), ("png", "PNG", {})]
+        if HEIC_SUPPORT:
+            # iPhones embed a 320x240 thumbnail item alongside the primary image
+            formats.append(("heic", "HEIF", {"quality": 90, "exif": exif, "thumbnails": [320]}))
+
+        for ext, fmt, kwargs in formats:
+            path = os.path.join(out_dir, f"synthetic_{mp}mp.{ext}")
+            im.save(path, format=fmt, **kwargs)
+            cases.append(path)
+    return cases
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+def run_worker(impl: str, path: str, runs: int):
+    with open(path, "rb") as f:
+        data = f.read()
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        IMPLS[impl](data)
+        times.append(time.perf_counter() - started)
+    print(json.dumps({"median_ms": statistics.median(times) * 1000, "peak_rss_mb": _peak_rss_kib() / 1024}))
+
+
+def _peak_rss_kib() -> int:
+    # VmHWM is reset on exec; ru_maxrss can carry over the parent's high-water mark
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(impl: str, path: str, runs: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", impl, path, "--runs", str(runs)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thumbnail/preview generation")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per case (median reported)")
+    parser.add_argument("--mp", type=float, nargs="+", default=[12, 24, 48], help="Corpus sizes in megapixels")
+    parser.add_argument("--worker", nargs=2, metavar=("IMPL", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.runs)
+        return
+
+    if not HEIC_SUPPORT:
+        print("pillow-heif not installed: HEIC cases skipped")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_corpus(tmp, args.mp)
+        print(f"{'input':<24}{'size':>9}  {'legacy ms':>10}{'engine ms':>10}{'speedup':>9}  {'legacy MB':>10}{'engine MB':>10}")
+        for path in cases:
+            old = measure("legacy", path, args.runs)
+            new = measure("engine", path, args.runs)
+            print(
+                f"{os.path.basename(path):<24}{os.path.getsize(path) / 1024 ** 2:>7.1f}MB  "
+                f"{old['median_ms']:>10.0f}{new['median_ms']:>10.0f}{old['median_ms'] / new['median_ms']:>8.1f}x  "
+                f"{old['peak_rss_mb']:>10.0f}{new['peak_rss_mb']:>10.0f}"
+            )
+
+        print(f"\nGrid thumbnails ({', '.join(map(str, GRID_SIZES))}): full decode vs embedded preview (>= {EMBEDDED_MIN_EDGE}px)")
+        print(f"{'input':<24}{'size':>9}  {'full ms':>10}{'embed ms':>10}{'speedup':>9}  {'full MB':>10}{'embed MB':>10}")
+        for path in cases:
+            old = measure("grid-full", path, args.runs)
+            new = measure("grid-embedded", path, args.runs)
+            print(
+                f"{os.path.basename(path):<24}{os.path.getsize(path) / 1024 ** 2:>7.1f}MB  "
+                f"{old['median_ms']:>10.0f}{new['median_ms']:>10.0f}{old['median_ms'] / new['median_ms']:>8.1f}x  "
+                f"{old['peak_rss_mb']:>10.0f}{new['peak_rss_mb']:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
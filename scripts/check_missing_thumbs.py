@@ -1,75 +1,213 @@
 #!/usr/bin/env python3
-"""Check which media items are missing thumbnails and whether source S3 objects exist."""
-import boto3
+"""
+Reconcile the media table against the media bucket.
+
+Streams the media table once (parallel scan, a handful of attributes per
+item, held per team), then lists each team's media/, thumbnails/, previews/
+and streams/ prefixes with paginated ListObjectsV2 - teams in parallel - and
+joins the two per team, keyed by media_id. Only one team's listing is held
+at a time per thread.
+
+Reports:
+  missing_derivatives  item with an original but no thumbnail, or whose
+                       recorded derivative keys aren't in the bucket
+  missing_original     item whose original isn't in the bucket
+  orphan_derivatives   derivatives under a media_id with no item
+  unfinalized          original with no item, older than --grace-hours: an
+                       upload whose /media/complete never happened
+
+--work-list writes missing_derivatives as JSON lines that
+scripts/backfill_thumbnails.py --work-list consumes.
+
+Usage:
+  python3 scripts/check_missing_thumbs.py prod
+  python3 scripts/check_missing_thumbs.py staging --report staging-recon.jsonl
+  python3 scripts/check_missing_thumbs.py prod --work-list prod-missing.jsonl
+"""
+import argparse
+import json
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
-def main():
-    env = sys.argv[1] if len(sys.argv) > 1 else "prod"
-    
-    if env == "prod":
-        TABLE = "TeamMediaHubStack-MediaTableCFC93525-8YTEVX5PQ0Z9"
-        BUCKET = "teammediahubstack-mediabucketbcbb02ba-yya0tjoyk8dm"
-    else:
-        TABLE = "TeamMediaHubStack-Staging-MediaTableCFC93525-1WCAV0MVU03C7"
-        BUCKET = "teammediahubstack-staging-mediabucketbcbb02ba-c1zsibc2uhk6"
-
-    ddb = boto3.client("dynamodb", region_name="us-east-1")
-    s3 = boto3.client("s3", region_name="us-east-1")
-
-    # Get all media items missing thumb_key
-    items = []
-    kwargs = {"TableName": TABLE, "FilterExpression": "attribute_not_exists(thumb_key)"}
-    while True:
-        resp = ddb.scan(**kwargs)
-        items.extend(resp.get("Items", []))
-        lek = resp.get("LastEvaluatedKey")
-        if not lek:
-            break
-        kwargs["ExclusiveStartKey"] = lek
-
-    print(f"Found {len(items)} items missing thumb_key in {env}")
-    print()
-
-    images_to_backfill = []
-    for item in items:
-        media_id = item.get("gsi1pk", {}).get("S", "?")
-        content_type = item.get("content_type", {}).get("S", "?")
-        object_key = item.get("object_key", {}).get("S", "")
-        filename = item.get("filename", {}).get("S", "?")
-        team_id = item.get("team_id", {}).get("S", "?")
-        sk = item.get("sk", {}).get("S", "?")
-
-        # Check if source file exists in S3
-        exists = False
-        size = 0
-        if object_key:
-            try:
-                head = s3.head_object(Bucket=BUCKET, Key=object_key)
-                exists = True
-                size = head.get("ContentLength", 0)
-            except Exception:
-                exists = False
-
-        is_image = content_type.startswith("image/")
-        status = "BACKFILL" if (exists and is_image) else ("VIDEO" if not is_image else "MISSING_S3")
-        
-        print(f"[{status}] media_id={media_id[:16]}  type={content_type:<20}  s3={exists}  size={size:>10}  file={filename}")
-
-        if exists and is_image:
-            images_to_backfill.append({
-                "media_id": media_id,
-                "team_id": team_id,
-                "sk": sk,
-                "object_key": object_key,
-                "content_type": content_type,
-                "filename": filename,
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend", "src"))
+
+from ops import REGION, STAGES, stack_resources, scan_pages
+from common.derivatives import rendition_keys
+
+MB = 1024 * 1024
+ORIGINALS_PREFIX = "media/"
+DERIVATIVE_PREFIXES = ("thumbnails/", "previews/", "streams/")
+ITEM_ATTRIBUTES = (
+    "team_id", "sk", "media_id", "object_key", "content_type", "size_bytes",
+    "thumb_key", "preview_key", "hover_key", "stream_key", "renditions",
+)
+EXAMPLES = 5
+
+_deserializer = TypeDeserializer()
+
+
+def _media_id(item: dict) -> str:
+    return item.get("media_id") or item["sk"].rsplit("#", 1)[-1]
+
+
+def expected_keys(item: dict) -> list:
+    """Derivative keys an item says exist (the HLS ladder by its master playlist only)."""
+    keys = [item.get(k) for k in ("thumb_key", "preview_key", "hover_key", "stream_key")]
+    keys.extend(rendition_keys({**item, "media_id": _media_id(item)}))
+    return sorted({k for k in keys if k})
+
+
+def load_items(ddb, table: str, segments: int) -> dict:
+    """team_id -> {media_id: item}, one pass over the table."""
+    teams, lock = {}, threading.Lock()
+    names = {f"#a{i}": a for i, a in enumerate(ITEM_ATTRIBUTES)}
+
+    def run_segment(segment):
+        pages = scan_pages(
+            ddb, table, segment, segments,
+            ProjectionExpression=", ".join(names), ExpressionAttributeNames=names,
+        )
+        for items, _ in pages:
+            for raw in items:
+                item = {k: _deserializer.deserialize(v) for k, v in raw.items()}
+                if not item.get("object_key"):
+                    continue
+                with lock:
+                    teams.setdefault(item["team_id"], {})[_media_id(item)] = item
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for f in [pool.submit(run_segment, s) for s in range(segments)]:
+            f.result()
+    return teams
+
+
+def list_objects(s3, bucket: str, prefix: str):
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def list_teams(s3, bucket: str) -> set:
+    teams = set()
+    for prefix in (ORIGINALS_PREFIX,) + DERIVATIVE_PREFIXES:
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+            teams.update(p["Prefix"][len(prefix):-1] for p in page.get("CommonPrefixes", []))
+    return teams
+
+
+def reconcile_team(s3, bucket: str, team_id: str, items: dict, grace_seconds: int) -> list:
+    """Findings for one team: its items joined with its listings by media_id."""
+    originals, derived, derived_bytes = {}, {}, {}
+    for obj in list_objects(s3, bucket, f"{ORIGINALS_PREFIX}{team_id}/"):
+        parts = obj["Key"].split("/", 3)
+        if len(parts) == 4:
+            originals[obj["Key"]] = obj
+    for prefix in DERIVATIVE_PREFIXES:
+        for obj in list_objects(s3, bucket, f"{prefix}{team_id}/"):
+            parts = obj["Key"].split("/", 3)
+            if len(parts) < 4:
+                continue
+            media_id = parts[2]
+            derived.setdefault(media_id, set()).add(obj["Key"])
+            derived_bytes[media_id] = derived_bytes.get(media_id, 0) + obj["Size"]
+
+    findings, now = [], time.time()
+    object_keys = set()
+    for media_id, item in items.items():
+        object_keys.add(item["object_key"])
+        base = {
+            "team_id": team_id, "media_id": media_id, "sk": item["sk"], "object_key": item["object_key"],
+            "content_type": item.get("content_type"), "size_bytes": int(item.get("size_bytes") or 0),
+        }
+        if item["object_key"] not in originals:
+            findings.append({**base, "kind": "missing_original"})
+            continue
+        if not item.get("thumb_key"):
+            findings.append({**base, "kind": "missing_derivatives", "reason": "never derived"})
+            continue
+        missing = [k for k in expected_keys(item) if k not in derived.get(media_id, ())]
+        if missing:
+            findings.append({**base, "kind": "missing_derivatives", "reason": f"{len(missing)} keys missing", "missing": missing})
+
+    for media_id, keys in derived.items():
+        if media_id not in items:
+            findings.append({
+                "kind": "orphan_derivatives", "team_id": team_id, "media_id": media_id,
+                "objects": len(keys), "bytes": derived_bytes[media_id],
             })
+    for key, obj in originals.items():
+        age = now - obj["LastModified"].timestamp()
+        if key not in object_keys and age > grace_seconds:
+            findings.append({
+                "kind": "unfinalized", "team_id": team_id, "media_id": key.split("/")[2], "object_key": key,
+                "bytes": obj["Size"], "age_hours": round(age / 3600, 1),
+            })
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile the media table against the media bucket")
+    parser.add_argument("stage", nargs="?", default="prod", choices=STAGES)
+    parser.add_argument("--segments", type=int, default=8, help="DynamoDB parallel scan segments")
+    parser.add_argument("--threads", type=int, default=16, help="Teams listed in parallel")
+    parser.add_argument("--grace-hours", type=float, default=24, help="Ignore item-less originals younger than this")
+    parser.add_argument("--report", help="Write every finding as JSON lines")
+    parser.add_argument("--work-list", help="Write missing_derivatives for backfill_thumbnails.py --work-list")
+    args = parser.parse_args()
+
+    resources = stack_resources(args.stage)
+    table, bucket = resources["MediaTable"], resources["MediaBucket"]
+    ddb = boto3.client("dynamodb", region_name=REGION)
+    s3 = boto3.client("s3", region_name=REGION)
+    print(f"Environment: {args.stage}\n  Table:  {table}\n  Bucket: {bucket}\n")
+
+    started = time.time()
+    items_by_team = load_items(ddb, table, args.segments)
+    print(f"Scanned {sum(map(len, items_by_team.values()))} items in {len(items_by_team)} teams ({time.time() - started:.0f}s)")
+    teams = sorted(list_teams(s3, bucket) | set(items_by_team))
+
+    counts, examples, bytes_by_kind = {}, {}, {}
+    report = open(args.report, "w") if args.report else None
+    work_list = open(args.work_list, "w") if args.work_list else None
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = [
+            pool.submit(reconcile_team, s3, bucket, team_id, items_by_team.get(team_id, {}), args.grace_hours * 3600)
+            for team_id in teams
+        ]
+        for future in futures:
+            for f in future.result():
+                kind = f["kind"]
+                counts[kind] = counts.get(kind, 0) + 1
+                bytes_by_kind[kind] = bytes_by_kind.get(kind, 0) + f.get("bytes", 0)
+                if len(examples.setdefault(kind, [])) < EXAMPLES:
+                    examples[kind].append(f)
+                if report:
+                    report.write(json.dumps(f) + "\n")
+                if work_list and kind == "missing_derivatives":
+                    work_list.write(json.dumps({k: f[k] for k in ("team_id", "sk", "object_key", "content_type", "size_bytes")}) + "\n")
+    for f in (report, work_list):
+        if f:
+            f.close()
+
+    print(f"Listed {len(teams)} teams ({time.time() - started:.0f}s total)\n")
+    print("--- Summary ---")
+    for kind in ("missing_derivatives", "missing_original", "orphan_derivatives", "unfinalized"):
+        extra = f" ({bytes_by_kind[kind] / MB:.1f} MB)" if bytes_by_kind.get(kind) else ""
+        print(f"{kind + ':':<22}{counts.get(kind, 0)}{extra}")
+        for f in examples.get(kind, []):
+            detail = f.get("reason") or f.get("object_key") or f"{f.get('objects')} objects"
+            print(f"    {f['team_id']}/{f['media_id']}  {detail}")
+    if args.work_list:
+        print(f"\nWork list: {args.work_list} ({counts.get('missing_derivatives', 0)} items)")
+        print(f"  python3 scripts/backfill_thumbnails.py {args.stage} --work-list {args.work_list}")
+    print(f"\nChecked at {datetime.now(timezone.utc).isoformat(timespec='seconds')}")
 
-    print(f"\n--- Summary ---")
-    print(f"Total missing thumbs: {len(items)}")
-    print(f"Images to backfill: {len(images_to_backfill)}")
-    print(f"Videos (expected): {sum(1 for i in items if not i.get('content_type', {}).get('S', '').startswith('image/'))}")
-    print(f"Missing from S3: {sum(1 for i in items if i.get('content_type', {}).get('S', '').startswith('image/')) - len(images_to_backfill)}")
 
 if __name__ == "__main__":
     main()
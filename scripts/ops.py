@@ -0,0 +1,61 @@
+"""
+Shared helpers for the operational scripts in this directory.
+
+Physical table and bucket names are looked up from the deployed CloudFormation
+stack rather than hard-coded: CDK appends a hash to every name, and it
+changes whenever a resource is replaced.
+"""
+import json
+import os
+import re
+
+import boto3
+
+REGION = os.getenv("AWS_REGION", "us-east-1")
+STAGES = ("prod", "staging")
+
+# CDK logical ids are the construct id plus an 8-hex-digit hash
+_LOGICAL_ID = re.compile(r"^(.+?)([0-9A-F]{8})$")
+
+
+def stack_name(stage: str) -> str:
+    """Same naming as infra/app.py."""
+    return "TeamMediaHubStack" if stage == "prod" else f"TeamMediaHubStack-{stage.capitalize()}"
+
+
+def stack_resources(stage: str, region: str = REGION) -> dict:
+    """Construct id (e.g. "MediaTable") -> physical name for every resource in the stage's stack."""
+    cfn = boto3.client("cloudformation", region_name=region)
+    resources = {}
+    for page in cfn.get_paginator("list_stack_resources").paginate(StackName=stack_name(stage)):
+        for r in page["StackResourceSummaries"]:
+            m = _LOGICAL_ID.match(r["LogicalResourceId"])
+            resources[m.group(1) if m else r["LogicalResourceId"]] = r["PhysicalResourceId"]
+    return resources
+
+
+def scan_pages(ddb, table: str, segment: int = 0, total_segments: int = 1, start_key: dict = None, **kwargs):
+    """
+    One segment of a (parallel) scan, a page at a time, as (items, last_key)
+    pairs. Items and keys are in the low-level client's DynamoDB JSON, so
+    last_key can be written to a checkpoint as-is and passed back as
+    start_key to resume after that page. last_key is None on the final page.
+    """
+    if total_segments > 1:
+        kwargs.update(Segment=segment, TotalSegments=total_segments)
+    while True:
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        resp = ddb.scan(TableName=table, **kwargs)
+        start_key = resp.get("LastEvaluatedKey")
+        yield resp.get("Items", []), start_key
+        if not start_key:
+            return
+
+
+def write_json(path: str, data: dict):
+    """Write data to path atomically, so an interrupted run never leaves half a file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
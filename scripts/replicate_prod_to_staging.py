@@ -1,33 +1,48 @@
 """
 Replicate prod data → staging (DynamoDB tables + S3 media bucket).
 
+Tables are read with a parallel scan (--segments per table), each segment
+piping its pages straight into its own batch writer on the staging table.
+Stripe fields on Teams are sanitized on the way through.
+
+The media bucket is listed on both sides in parallel, one ListObjectsV2 run
+per team prefix, and objects are copied server side (CopyObject, or a
+multipart UploadPartCopy for large ones) on a worker pool. An object is
+skipped when staging already has it with the same ETag and size, or - for
+copies whose ETag can't match (multipart sources) - when the manifest says
+it was copied from this exact prod version and staging still holds that
+copy. The manifest is saved as the copy runs, so re-runs (and interrupted
+runs) only copy what changed.
+
+Table and bucket names come from the two stacks (see ops.stack_resources).
+
 Usage:
     python3 scripts/replicate_prod_to_staging.py [--dry-run] [--skip-s3] [--skip-dynamo]
+        [--segments 8] [--workers 32] [--manifest replicate-manifest.json]
 
 Requires AWS credentials with read access to prod resources and write access to staging.
 """
 import argparse
-import boto3
+import json
+import os
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import boto3
+
+from ops import REGION, stack_resources, write_json
 
 # ---------------------------------------------------------------------------
-# Resource mapping: prod name → staging name
+# Resources (construct ids in infra/stacks/team_media_hub_stack.py)
 # ---------------------------------------------------------------------------
-TABLE_MAP = {
-    "TeamMediaHubStack-TeamsTableE80F987E-1THOJUJC7RNIZ": "TeamMediaHubStack-Staging-TeamsTableE80F987E-116OW45QOVQGL",
-    "TeamMediaHubStack-InvitesTableE9630325-1P43ZIUHYTGNW": "TeamMediaHubStack-Staging-InvitesTableE9630325-55XKTCVFPRN1",
-    "TeamMediaHubStack-MediaTableCFC93525-8YTEVX5PQ0Z9": "TeamMediaHubStack-Staging-MediaTableCFC93525-1WCAV0MVU03C7",
-    "TeamMediaHubStack-AuditTableB07F8EEB-UTXBXRWIM6DI": "TeamMediaHubStack-Staging-AuditTableB07F8EEB-7Y23RN55YARO",
-    "TeamMediaHubStack-UsersTable9725E9C8-3IY64EFAG6RM": "TeamMediaHubStack-Staging-UsersTable9725E9C8-1RRKKS35KR902",
-    "TeamMediaHubStack-TeamMembersTableCADD68CD-10GHX6G9FS2TM": "TeamMediaHubStack-Staging-TeamMembersTableCADD68CD-101HJ0KQL3OK7",
-    "TeamMediaHubStack-AuthCodesTableA2697F2B-JM39DUSQK5YC": "TeamMediaHubStack-Staging-AuthCodesTableA2697F2B-687QW4B188TX",
-    "TeamMediaHubStack-UserTokensTableDF29304D-1FBRIKAHW0E5N": "TeamMediaHubStack-Staging-UserTokensTableDF29304D-1RZB527LICEM4",
-    "TeamMediaHubStack-WebhookEventsTableCA203B38-R1FZL2WYRSCQ": "TeamMediaHubStack-Staging-WebhookEventsTableCA203B38-192FSM1I9VBCZ",
-}
-
-PROD_BUCKET = "teammediahubstack-mediabucketbcbb02ba-yya0tjoyk8dm"
-STAGING_BUCKET = "teammediahubstack-staging-mediabucketbcbb02ba-c1zsibc2uhk6"
+TABLES = (
+    "TeamsTable", "InvitesTable", "MediaTable", "AuditTable", "UsersTable",
+    "TeamMembersTable", "AuthCodesTable", "UserTokensTable", "WebhookEventsTable",
+)
+BUCKET = "MediaBucket"
 
 # Fields to sanitize in Teams table to avoid staging hitting live Stripe
 STRIPE_FIELDS_TO_CLEAR = [
@@ -41,96 +56,215 @@ STRIPE_FIELDS_TO_CLEAR = [
     "past_due_since",
 ]
 
+MB = 1024 * 1024
+# CopyObject handles up to 5 GB; above this, copy in parallel parts instead
+MULTIPART_COPY_BYTES = 512 * MB
+COPY_PART_BYTES = 128 * MB
+MANIFEST_SAVE_EVERY = 500
+
+
 # ---------------------------------------------------------------------------
 # DynamoDB replication
 # ---------------------------------------------------------------------------
-def replicate_table(ddb_resource, prod_name: str, staging_name: str, dry_run: bool, sanitize_stripe: bool = False):
-    """Scan all items from prod table and batch-write them to staging table."""
+def sanitize_team(item: dict) -> dict:
+    for field in STRIPE_FIELDS_TO_CLEAR:
+        item.pop(field, None)
+    # Reset plan to free so staging doesn't think it has a paid plan
+    if "plan" in item:
+        item["plan"] = "free"
+    if "storage_limit_gb" in item:
+        item["storage_limit_gb"] = 10
+    if "storage_limit_bytes" in item:
+        item["storage_limit_bytes"] = 10 * 1024 * 1024 * 1024
+    return item
+
+
+def replicate_table(ddb_resource, prod_name: str, staging_name: str, dry_run: bool, segments: int, sanitize_stripe: bool = False):
+    """Parallel-scan the prod table and batch-write every page to staging, one writer per segment."""
     prod_table = ddb_resource.Table(prod_name)
     staging_table = ddb_resource.Table(staging_name)
 
-    short_name = prod_name.split("-")[1] if "-" in prod_name else prod_name
-    print(f"\n{'[DRY RUN] ' if dry_run else ''}Replicating: {short_name}")
-    print(f"  Prod:    {prod_name}")
-    print(f"  Staging: {staging_name}")
-
-    total = 0
-    scan_kwargs = {}
-    while True:
-        response = prod_table.scan(**scan_kwargs)
-        items = response.get("Items", [])
-
-        if sanitize_stripe:
-            for item in items:
-                for field in STRIPE_FIELDS_TO_CLEAR:
-                    item.pop(field, None)
-                # Reset plan to free so staging doesn't think it has a paid plan
-                if "plan" in item:
-                    item["plan"] = "free"
-                if "storage_limit_gb" in item:
-                    item["storage_limit_gb"] = 10
-                if "storage_limit_bytes" in item:
-                    item["storage_limit_bytes"] = 10 * 1024 * 1024 * 1024
-
-        if not dry_run and items:
-            with staging_table.batch_writer() as batch:
+    def copy_segment(segment: int) -> int:
+        count = 0
+        scan_kwargs = {"Segment": segment, "TotalSegments": segments}
+        with nullcontext() if dry_run else staging_table.batch_writer() as batch:
+            while True:
+                response = prod_table.scan(**scan_kwargs)
+                items = response.get("Items", [])
                 for item in items:
-                    batch.put_item(Item=item)
-
-        total += len(items)
+                    if sanitize_stripe:
+                        sanitize_team(item)
+                    if batch:
+                        batch.put_item(Item=item)
+                count += len(items)
+                last_key = response.get("LastEvaluatedKey")
+                if not last_key:
+                    return count
+                scan_kwargs["ExclusiveStartKey"] = last_key
 
-        last_key = response.get("LastEvaluatedKey")
-        if not last_key:
-            break
-        scan_kwargs["ExclusiveStartKey"] = last_key
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        return sum(pool.map(copy_segment, range(segments)))
 
-    print(f"  Items copied: {total}")
-    return total
 
-
-def replicate_all_tables(dry_run: bool):
+def replicate_all_tables(prod: dict, staging: dict, dry_run: bool, segments: int):
     """Replicate all DynamoDB tables from prod to staging."""
-    ddb = boto3.resource("dynamodb", region_name="us-east-1")
+    ddb = boto3.resource("dynamodb", region_name=REGION)
+    print(f"\n{'[DRY RUN] ' if dry_run else ''}Replicating {len(TABLES)} tables ({segments} segments each):")
     grand_total = 0
-
-    for prod_name, staging_name in TABLE_MAP.items():
-        is_teams = "TeamsTable" in prod_name
-        count = replicate_table(ddb, prod_name, staging_name, dry_run, sanitize_stripe=is_teams)
+    for name in TABLES:
+        started = time.time()
+        count = replicate_table(ddb, prod[name], staging[name], dry_run, segments, sanitize_stripe=name == "TeamsTable")
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"  {name:<20} {count:>9} items  {count / elapsed:>8.0f} items/s")
         grand_total += count
-
     print(f"\n{'[DRY RUN] ' if dry_run else ''}DynamoDB total items: {grand_total}")
 
 
 # ---------------------------------------------------------------------------
-# S3 replication (uses aws s3 sync for efficiency)
+# S3 replication
 # ---------------------------------------------------------------------------
-def replicate_s3(dry_run: bool):
-    """Sync S3 media bucket from prod to staging using aws cli."""
-    import subprocess
-
-    print(f"\n{'[DRY RUN] ' if dry_run else ''}Syncing S3 media bucket:")
-    print(f"  Prod:    s3://{PROD_BUCKET}")
-    print(f"  Staging: s3://{STAGING_BUCKET}")
-
-    cmd = [
-        "aws", "s3", "sync",
-        f"s3://{PROD_BUCKET}",
-        f"s3://{STAGING_BUCKET}",
-        "--region", "us-east-1",
-    ]
-
-    if dry_run:
-        cmd.append("--dryrun")
-
-    print(f"  Running: {' '.join(cmd)}\n")
-    result = subprocess.run(cmd, capture_output=False, text=True)
-
-    if result.returncode != 0:
-        print(f"\n  ERROR: S3 sync failed with exit code {result.returncode}")
+def _prefixes(s3, bucket: str) -> list:
+    """Top-level/team-level prefixes (media/{team_id}/, ...) to list in parallel, plus stray root keys."""
+    prefixes = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Delimiter="/"):
+        for top in page.get("CommonPrefixes", []):
+            for sub in paginator.paginate(Bucket=bucket, Prefix=top["Prefix"], Delimiter="/"):
+                prefixes.extend(p["Prefix"] for p in sub.get("CommonPrefixes", []))
+                # Keys directly under the top-level prefix
+                prefixes.extend(o["Key"] for o in sub.get("Contents", []))
+        prefixes.extend(o["Key"] for o in page.get("Contents", []))
+    return prefixes
+
+
+def list_bucket(s3, bucket: str, prefixes: list, workers: int) -> dict:
+    """key -> (etag, size) for everything under prefixes, listed in parallel."""
+    def list_prefix(prefix):
+        found = {}
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                found[obj["Key"]] = (obj["ETag"].strip('"'), obj["Size"])
+        return found
+
+    objects = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for found in pool.map(list_prefix, prefixes):
+            objects.update(found)
+    return objects
+
+
+def copy_large(s3, source_bucket: str, dest_bucket: str, key: str, size: int, workers: int = 8):
+    """Server-side multipart copy; metadata and content type are carried over explicitly."""
+    head = s3.head_object(Bucket=source_bucket, Key=key)
+    extra = {k: head[k] for k in ("ContentType", "CacheControl", "ContentDisposition") if head.get(k)}
+    upload_id = s3.create_multipart_upload(
+        Bucket=dest_bucket, Key=key, Metadata=head.get("Metadata", {}), **extra,
+    )["UploadId"]
+    try:
+        def part(number):
+            start = (number - 1) * COPY_PART_BYTES
+            end = min(start + COPY_PART_BYTES, size) - 1
+            resp = s3.upload_part_copy(
+                Bucket=dest_bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                CopySource={"Bucket": source_bucket, "Key": key}, CopySourceRange=f"bytes={start}-{end}",
+            )
+            return {"PartNumber": number, "ETag": resp["CopyPartResult"]["ETag"]}
+
+        count = (size + COPY_PART_BYTES - 1) // COPY_PART_BYTES
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(part, range(1, count + 1)))
+        return s3.complete_multipart_upload(
+            Bucket=dest_bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+        )["ETag"].strip('"')
+    except Exception:
+        s3.abort_multipart_upload(Bucket=dest_bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def copy_one(s3, source_bucket: str, dest_bucket: str, key: str, size: int) -> str:
+    """Copy key server side; returns the staging ETag."""
+    if size > MULTIPART_COPY_BYTES:
+        return copy_large(s3, source_bucket, dest_bucket, key, size)
+    resp = s3.copy_object(Bucket=dest_bucket, Key=key, CopySource={"Bucket": source_bucket, "Key": key})
+    return resp["CopyObjectResult"]["ETag"].strip('"')
+
+
+def is_current(key: str, source: tuple, dest: tuple, manifest: dict) -> bool:
+    """Staging already holds this version of key: same ETag and size, or the copy the manifest recorded."""
+    if dest is None:
         return False
-
-    print(f"\n  S3 sync {'(dry run) ' if dry_run else ''}complete.")
-    return True
+    if tuple(dest) == tuple(source):
+        return True
+    entry = manifest.get(key)
+    return bool(entry) and tuple(entry["src"]) == tuple(source) and tuple(entry["dst"]) == tuple(dest)
+
+
+def load_manifest(path: str, prod_bucket: str, staging_bucket: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        saved = json.load(f)
+    if saved.get("source") != prod_bucket or saved.get("dest") != staging_bucket:
+        print(f"  {path} is for other buckets; ignoring it")
+        return {}
+    return saved.get("objects", {})
+
+
+def replicate_s3(prod_bucket: str, staging_bucket: str, dry_run: bool, workers: int, manifest_path: str):
+    """Copy new and changed objects from the prod media bucket to staging."""
+    s3 = boto3.client("s3", region_name=REGION)
+    print(f"\n{'[DRY RUN] ' if dry_run else ''}Replicating S3 media bucket:")
+    print(f"  Prod:    s3://{prod_bucket}")
+    print(f"  Staging: s3://{staging_bucket}")
+
+    started = time.time()
+    manifest = load_manifest(manifest_path, prod_bucket, staging_bucket)
+    source = list_bucket(s3, prod_bucket, _prefixes(s3, prod_bucket), workers)
+    dest = list_bucket(s3, staging_bucket, _prefixes(s3, staging_bucket), workers)
+    todo = [(k, v) for k, v in source.items() if not is_current(k, v, dest.get(k), manifest)]
+    todo_bytes = sum(size for _, (_, size) in todo)
+    print(f"  Listed {len(source)} prod / {len(dest)} staging objects in {time.time() - started:.0f}s; "
+          f"{len(todo)} to copy ({todo_bytes / MB:.0f} MB), {len(source) - len(todo)} up to date")
+    if dry_run or not todo:
+        return True
+
+    lock = threading.Lock()
+    stats = {"copied": 0, "bytes": 0, "failed": 0}
+
+    def save():
+        write_json(manifest_path, {"source": prod_bucket, "dest": staging_bucket, "objects": manifest})
+
+    def copy(entry):
+        key, (etag, size) = entry
+        try:
+            dest_etag = copy_one(s3, prod_bucket, staging_bucket, key, size)
+        except Exception as e:
+            print(f"  FAILED {key}: {e}")
+            with lock:
+                stats["failed"] += 1
+            return
+        with lock:
+            manifest[key] = {"src": [etag, size], "dst": [dest_etag, size]}
+            stats["copied"] += 1
+            stats["bytes"] += size
+            if stats["copied"] % MANIFEST_SAVE_EVERY == 0:
+                save()
+                elapsed = time.time() - started
+                print(f"  {stats['copied']}/{len(todo)} objects, {stats['bytes'] / MB / elapsed:.1f} MB/s")
+
+    copy_started = time.time()
+    try:
+        # Largest first, so a multi-GB video isn't the straggler at the end
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(copy, sorted(todo, key=lambda e: -e[1][1])))
+    finally:
+        with lock:
+            save()
+
+    elapsed = max(time.time() - copy_started, 1e-6)
+    print(f"\n  Copied {stats['copied']} objects ({stats['bytes'] / MB:.0f} MB) in {elapsed:.0f}s: "
+          f"{stats['copied'] / elapsed:.1f} objects/s, {stats['bytes'] / MB / elapsed:.1f} MB/s, failed={stats['failed']}")
+    return stats["failed"] == 0
 
 
 # ---------------------------------------------------------------------------
@@ -141,6 +275,9 @@ def main():
     parser.add_argument("--dry-run", action="store_true", help="Show what would be copied without writing")
     parser.add_argument("--skip-s3", action="store_true", help="Skip S3 media sync")
     parser.add_argument("--skip-dynamo", action="store_true", help="Skip DynamoDB table copy")
+    parser.add_argument("--segments", type=int, default=8, help="Parallel scan segments per table")
+    parser.add_argument("--workers", type=int, default=32, help="Concurrent S3 listings/copies")
+    parser.add_argument("--manifest", default="replicate-manifest.json", help="Copy manifest for incremental re-runs")
     args = parser.parse_args()
 
     print("=" * 60)
@@ -159,12 +296,13 @@ def main():
             sys.exit(0)
 
     start = time.time()
+    prod, staging = stack_resources("prod"), stack_resources("staging")
 
     if not args.skip_dynamo:
-        replicate_all_tables(args.dry_run)
+        replicate_all_tables(prod, staging, args.dry_run, args.segments)
 
     if not args.skip_s3:
-        replicate_s3(args.dry_run)
+        replicate_s3(prod[BUCKET], staging[BUCKET], args.dry_run, args.workers, args.manifest)
 
     elapsed = time.time() - start
     print(f"\n{'[DRY RUN] ' if args.dry_run else ''}Done in {elapsed:.1f}s")